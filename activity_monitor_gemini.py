@@ -5,9 +5,11 @@ import sqlite3
 from datetime import datetime
 import mss
 import easyocr
-import google.generativeai as genai
 from dotenv import load_dotenv
 
+from key_pool import get_key_pool
+from llm_gateway import PRIORITY_BACKGROUND, generate
+
 # --- Configuration ---
 CAPTURE_INTERVAL_SECONDS = 150  # 5 minutes
 DB_PATH = "database/activity_log_gemini.db"
@@ -63,16 +65,13 @@ def log_activity(db_path: str, screenshot_path: str, ocr_text: str, analysis: st
 # --- Gemini Analysis Component ---
 
 def configure_gemini():
-    """Configures the Gemini API with an API key."""
+    """Makes sure Gemini API keys are available; calls lease them from the shared key pool."""
     load_dotenv()
-    api_key = os.getenv("GENAI_API_KEY_3")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found. Please set it in a.env file.")
-    genai.configure(api_key=api_key)
+    get_key_pool()  # raises ValueError when .env has no keys
     
 
-def analyze_text_with_gemini(model, ocr_text: str) -> str:
-    """Analyzes OCR text using the Gemini API."""
+def analyze_text_with_gemini(ocr_text: str) -> str:
+    """Analyzes OCR text using the Gemini API (through the LLM gateway when it is running)."""
     prompt = f"""
     You are an expert user activity analyst. Analyze the following text extracted from a user's screen and infer their current activity.
     Provide your analysis in a single, valid JSON object with keys: "application", "activity", and "topics".
@@ -84,10 +83,9 @@ def analyze_text_with_gemini(model, ocr_text: str) -> str:
     ---
     """
     try:
-        generation_config = genai.types.GenerationConfig(temperature=0)
-
-        response = model.generate_content(prompt, generation_config=generation_config)
-        json_text = response.text.strip().replace("```json", "").replace("```", "").strip()
+        # temperature 0 makes the analysis deterministic, so the gateway caches repeated screens
+        response = generate(GEMINI_MODEL_NAME, prompt, generation_config={"temperature": 0}, priority=PRIORITY_BACKGROUND)
+        json_text = response["text"].strip().replace("```json", "").replace("```", "").strip()
         json.loads(json_text)
         return json_text
     except Exception as e:
@@ -111,7 +109,6 @@ def main():
     try:
         sct = mss.mss()
         configure_gemini()
-        gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         ocr_reader = easyocr.Reader(['en'], gpu=True)
         initialize_database(DB_PATH)
     except Exception as e:
@@ -130,7 +127,7 @@ def main():
             ocr_text = extract_text_from_image(ocr_reader, screenshot_file)
             print(f"  - OCR complete: Extracted {len(ocr_text)} characters.")
 
-            analysis_json = analyze_text_with_gemini(gemini_model, ocr_text)
+            analysis_json = analyze_text_with_gemini(ocr_text)
             print(f"  - Gemini analysis complete.")
 
             log_activity(DB_PATH, screenshot_file, ocr_text, analysis_json)
@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+from focus_scorer import categorize_record, estimate_sample_seconds, load_scoring_config
+
+# Rebuilds activity_summary_YYYY-MM-DD.json files straight from activity_log,
+# so days when the strategist wasn't running still get a summary.
+#
+# Usage:
+#   python backfill_summaries.py --start 2025-09-01 --end 2025-09-30
+#   python backfill_summaries.py --start 2025-09-01 --workers 8 --force
+
+# --- CONFIGURATION ---
+DB_PATH = 'database/activity_log_gemini.db'
+ACTIVITY_DATA_DIR = 'activity_data'
+MAX_TIMELINE_ENTRIES = 200
+
+
+# --- HELPER FUNCTIONS ---
+
+def get_summary_path(day_str, data_dir=ACTIVITY_DATA_DIR):
+    return os.path.join(data_dir, f'activity_summary_{day_str}.json')
+
+def get_day_fingerprints(db_path, start_str, end_str):
+    """
+    Returns {date: fingerprint} for every day in the range that has activity rows.
+
+    activity_log is append-only, so row count, highest id and total payload
+    length together change whenever a day's source rows change.
+    """
+    query = """
+    SELECT substr(timestamp, 1, 10) AS day, COUNT(*), MAX(id), TOTAL(LENGTH(activity_analysis))
+    FROM activity_log
+    WHERE substr(timestamp, 1, 10) BETWEEN ? AND ?
+    GROUP BY day
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(query, (start_str, end_str)).fetchall()
+    return {day: f"{count}:{max_id}:{int(total_length)}" for day, count, max_id, total_length in rows}
+
+def get_day_bounds(db_path):
+    """Returns the first and last dates present in activity_log, or (None, None)."""
+    with sqlite3.connect(db_path) as conn:
+        first, last = conn.execute(
+            "SELECT MIN(substr(timestamp, 1, 10)), MAX(substr(timestamp, 1, 10)) FROM activity_log"
+        ).fetchone()
+    return first, last
+
+def read_existing_fingerprint(summary_path):
+    """Returns the fingerprint stored in a summary, "" for LLM-written ones, None if absent."""
+    if not os.path.exists(summary_path):
+        return None
+    try:
+        with open(summary_path, 'r') as f:
+            return json.load(f).get("source_fingerprint", "")
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return ""
+
+def load_day_records(conn, day_str):
+    """Loads one day's analysed records from activity_log in chronological order."""
+    cursor = conn.execute(
+        "SELECT timestamp, activity_analysis FROM activity_log WHERE substr(timestamp, 1, 10) = ? ORDER BY timestamp",
+        (day_str,),
+    )
+    records = []
+    for timestamp, analysis_json_str in cursor:
+        try:
+            analysis_data = json.loads(analysis_json_str)
+        except (json.JSONDecodeError, TypeError):
+            # Skip malformed JSON data
+            continue
+        if not isinstance(analysis_data, dict):
+            continue
+        analysis_data['timestamp'] = timestamp
+        records.append(analysis_data)
+    return records
+
+
+# --- SUMMARY BUILDER ---
+
+def build_daily_summary(day_str, records, config=None):
+    """
+    Builds a day summary in the same format the strategist's summary prompt uses:
+    total active time, productivity score, timeline log and minutes by category
+    and application.
+    """
+    config = config or load_scoring_config()
+    usable = [
+        r for r in records
+        if (r.get("application") or r.get("activity")) and r.get("activity") != "Error during analysis"
+    ]
+    sample_minutes = estimate_sample_seconds(usable) / 60
+
+    time_by_category = {category: 0.0 for category in config["weights"]}
+    time_by_application = {}
+    timeline_log = []
+    previous_span = None
+
+    for record in usable:
+        category = categorize_record(record, config)
+        application = record.get("application") or "Unknown"
+        time_by_category[category] = time_by_category.get(category, 0.0) + sample_minutes
+        time_by_application[application] = time_by_application.get(application, 0.0) + sample_minutes
+
+        # Collapse consecutive samples of the same activity into one timeline entry
+        span = (application, record.get("activity") or "")
+        if span != previous_span and len(timeline_log) < MAX_TIMELINE_ENTRIES:
+            clock = record["timestamp"][11:16]
+            activity = f" - {span[1]}" if span[1] else ""
+            timeline_log.append(f"{clock} - {application}{activity} ({category})")
+        previous_span = span
+
+    total_minutes = sum(time_by_category.values())
+    productive_minutes = time_by_category.get("Productive", 0.0)
+    productivity = round(100 * productive_minutes / total_minutes) if total_minutes else 0
+
+    return {
+        "date": day_str,
+        "total_active_time_minutes": round(total_minutes),
+        "productivity_score_percent": productivity,
+        "timeline_log": timeline_log,
+        "time_by_category": {k: round(v) for k, v in time_by_category.items()},
+        "time_by_application": {
+            k: round(v) for k, v in sorted(time_by_application.items(), key=lambda item: item[1], reverse=True)
+        },
+    }
+
+def rebuild_day(day_str, fingerprint, db_path=DB_PATH, data_dir=ACTIVITY_DATA_DIR):
+    """
+    Rebuilds and atomically writes one day's summary. Runs inside a pool worker.
+    Returns (day, number of source rows).
+    """
+    with sqlite3.connect(db_path) as conn:
+        records = load_day_records(conn, day_str)
+
+    summary = build_daily_summary(day_str, records)
+    summary["source_fingerprint"] = fingerprint
+
+    summary_path = get_summary_path(day_str, data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    temp_path = f"{summary_path}.tmp{os.getpid()}"
+    with open(temp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(temp_path, summary_path)
+    return day_str, len(records)
+
+def refresh_day_summary(day_str, db_path=DB_PATH, data_dir=ACTIVITY_DATA_DIR, force=False):
+    """
+    Rebuilds a single day's summary in-process if its source rows changed.
+    Like backfill(), keeps a summary written by the strategist's LLM (no
+    fingerprint) unless force is set. Returns the summary path.
+    """
+    fingerprint = get_day_fingerprints(db_path, day_str, day_str).get(day_str)
+    if fingerprint is None:
+        return None
+    summary_path = get_summary_path(day_str, data_dir)
+    existing = read_existing_fingerprint(summary_path)
+    if force or (existing != fingerprint and existing != ""):
+        rebuild_day(day_str, fingerprint, db_path, data_dir)
+    return summary_path
+
+
+# --- BACKFILL ---
+
+def backfill(start_str, end_str, workers=None, force=False, db_path=DB_PATH, data_dir=ACTIVITY_DATA_DIR):
+    """
+    Rebuilds summaries for every day in [start, end] that has activity rows,
+    one day per task across a process pool. Days whose source rows are
+    unchanged since the last rebuild are skipped. Summaries written by the
+    strategist's LLM (no fingerprint) are kept unless force is set.
+    """
+    started = time.perf_counter()
+    fingerprints = get_day_fingerprints(db_path, start_str, end_str)
+
+    pending = {}
+    skipped = 0
+    for day_str, fingerprint in sorted(fingerprints.items()):
+        existing = read_existing_fingerprint(get_summary_path(day_str, data_dir))
+        if not force and existing is not None and (existing == fingerprint or existing == ""):
+            skipped += 1
+            continue
+        pending[day_str] = fingerprint
+
+    print(f"{len(fingerprints)} day(s) with activity in {start_str}..{end_str}: "
+          f"{len(pending)} to rebuild, {skipped} up to date.")
+
+    rebuilt, total_rows, failed = 0, 0, []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(rebuild_day, day_str, fingerprint, db_path, data_dir): day_str
+                for day_str, fingerprint in pending.items()
+            }
+            for future in as_completed(futures):
+                day_str = futures[future]
+                try:
+                    _, rows = future.result()
+                    rebuilt += 1
+                    total_rows += rows
+                except Exception as e:
+                    print(f"  - {day_str}: failed ({e})")
+                    failed.append(day_str)
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "days_with_activity": len(fingerprints),
+        "rebuilt": rebuilt,
+        "skipped": skipped,
+        "failed": failed,
+        "rows": total_rows,
+        "seconds": round(elapsed, 3),
+        "days_per_second": round(rebuilt / elapsed, 1) if elapsed else 0.0,
+        "rows_per_second": round(total_rows / elapsed) if elapsed else 0,
+    }
+    print(f"Rebuilt {rebuilt} day(s) from {total_rows} rows in {report['seconds']}s "
+          f"({report['days_per_second']} days/s, {report['rows_per_second']} rows/s).")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild daily activity summaries from activity_log.")
+    parser.add_argument("--start", help="First date (YYYY-MM-DD). Defaults to the earliest logged day.")
+    parser.add_argument("--end", help="Last date (YYYY-MM-DD). Defaults to the latest logged day.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument("--force", action="store_true", help="Rebuild even unchanged or LLM-written summaries.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the activity database.")
+    parser.add_argument("--out", default=ACTIVITY_DATA_DIR, help="Directory for the summary files.")
+    args = parser.parse_args()
+
+    first, last = get_day_bounds(args.db)
+    if first is None:
+        print("No activity found in the database.")
+        return
+
+    start_str = args.start or first
+    end_str = args.end or last
+    for value in (start_str, end_str):
+        date.fromisoformat(value)  # raises ValueError for malformed dates
+
+    backfill(start_str, end_str, workers=args.workers, force=args.force, db_path=args.db, data_dir=args.out)
+
+if __name__ == "__main__":
+    main()
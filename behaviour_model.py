@@ -0,0 +1,222 @@
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from focus_scorer import DEFAULT_SAMPLE_SECONDS, categorize_record, load_scoring_config
+
+# Local analytics over weeks of activity_log rows. Builds a compact behaviour
+# profile (hour-of-week focus heatmap, distraction onset times, app-switch
+# rates, focus session lengths) so the LLM only has to narrate the numbers.
+
+# --- CONFIGURATION ---
+DB_PATH = 'database/activity_log_gemini.db'
+ACTIVITY_DATA_DIR = 'activity_data'
+BEHAVIOUR_PROFILE_FILE = os.path.join(ACTIVITY_DATA_DIR, 'behaviour_profile.json')
+DEFAULT_WEEKS = 4
+CATEGORY_CODES = {"Productive": 1, "Neutral": 0, "Distracting": -1}
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+# --- LOADING ---
+
+def load_activity_arrays(db_path=DB_PATH, weeks=DEFAULT_WEEKS, now=None, config=None):
+    """
+    Loads the last `weeks` of activity_log into parallel NumPy arrays.
+
+    Returns a dict with:
+      - "epoch": float64 seconds since epoch, sorted
+      - "category": int8 codes (1 productive, 0 neutral, -1 distracting)
+      - "weight": float64 focus weight of each sample
+      - "app": int32 index into "app_names"
+    """
+    config = config or load_scoring_config()
+    now = now or datetime.now()
+    start_str = (now - timedelta(weeks=weeks)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT timestamp, activity_analysis FROM activity_log WHERE timestamp >= ? ORDER BY timestamp",
+            (start_str,),
+        ).fetchall()
+
+    epochs, categories, weights, apps = [], [], [], []
+    for timestamp, analysis_json_str in rows:
+        try:
+            record = json.loads(analysis_json_str)
+            moment = datetime.fromisoformat(timestamp)
+        except (json.JSONDecodeError, TypeError, ValueError):
+            continue
+        if not isinstance(record, dict) or not (record.get("application") or record.get("activity")):
+            continue
+        if record.get("activity") == "Error during analysis":
+            continue
+        category = categorize_record(record, config)
+        epochs.append(moment.timestamp())
+        categories.append(CATEGORY_CODES[category])
+        weights.append(config["weights"].get(category, 0.0))
+        apps.append(record.get("application") or "Unknown")
+
+    # Dictionary-encode application names
+    app_names, app_index = np.unique(np.array(apps, dtype=str), return_inverse=True)
+    return {
+        "epoch": np.array(epochs, dtype=np.float64),
+        "category": np.array(categories, dtype=np.int8),
+        "weight": np.array(weights, dtype=np.float64),
+        "app": app_index.astype(np.int32),
+        "app_names": [str(name) for name in app_names],
+    }
+
+
+# --- STATISTICS ---
+
+def _sample_seconds(epoch):
+    gaps = np.diff(epoch)
+    gaps = gaps[gaps > 0]
+    return float(np.median(gaps)) if gaps.size else float(DEFAULT_SAMPLE_SECONDS)
+
+def _local_time_fields(epoch):
+    """Returns (weekday, hour, minute_of_day, day_ordinal) arrays for epoch seconds in local time."""
+    moments = [datetime.fromtimestamp(value) for value in epoch]
+    weekday = np.fromiter((m.weekday() for m in moments), dtype=np.int16, count=len(moments))
+    hour = np.fromiter((m.hour for m in moments), dtype=np.int16, count=len(moments))
+    minute_of_day = hour * 60 + np.fromiter((m.minute for m in moments), dtype=np.int16, count=len(moments))
+    day = np.fromiter((m.toordinal() for m in moments), dtype=np.int32, count=len(moments))
+    return weekday, hour, minute_of_day, day
+
+def _runs(mask, breaks):
+    """Returns (start_index, length) arrays for runs of True in mask, split at breaks."""
+    if not mask.size:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    # A run starts where mask turns on, or continues across a recording gap
+    starts_mask = mask & np.concatenate(([True], ~mask[:-1] | breaks[:-1]))
+    ends_mask = mask & np.concatenate((~mask[1:] | breaks[:-1], [True]))
+    starts = np.flatnonzero(starts_mask)
+    ends = np.flatnonzero(ends_mask)
+    return starts, ends - starts + 1
+
+def _percentiles(values, points=(25, 50, 75, 90)):
+    if not values.size:
+        return {}
+    return {f"p{p}": round(float(v), 1) for p, v in zip(points, np.percentile(values, points))}
+
+def _clock(minute_of_day):
+    minute_of_day = int(round(minute_of_day))
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+def compute_behaviour_profile(arrays):
+    """Computes the behaviour statistics from the arrays built by load_activity_arrays."""
+    epoch = arrays["epoch"]
+    if not epoch.size:
+        return {"samples": 0}
+
+    sample_seconds = _sample_seconds(epoch)
+    sample_minutes = sample_seconds / 60
+    weekday, hour, minute_of_day, day = _local_time_fields(epoch)
+    category = arrays["category"]
+    weight = arrays["weight"]
+    app = arrays["app"]
+
+    # Recording gaps (monitor stopped, laptop asleep) break sessions and switch counts
+    gaps = np.diff(epoch)
+    breaks = np.concatenate((gaps > 2 * sample_seconds, [False]))
+
+    # Hour-of-week focus heatmap: mean focus weight per (weekday, hour) cell
+    cell = weekday.astype(np.int64) * 24 + hour
+    counts = np.bincount(cell, minlength=7 * 24)
+    sums = np.bincount(cell, weights=weight, minlength=7 * 24)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        heat = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan).reshape(7, 24)
+    heatmap = {
+        WEEKDAYS[d]: [None if np.isnan(v) else round(float(v), 2) for v in heat[d]]
+        for d in range(7)
+    }
+    hour_counts = np.bincount(hour, minlength=24)
+    hour_focus = np.bincount(hour, weights=weight, minlength=24) / np.maximum(hour_counts, 1)
+    active_hours = np.flatnonzero(hour_counts >= max(3, hour_counts.max() * 0.1))
+    ranked_hours = active_hours[np.argsort(hour_focus[active_hours])]
+
+    # Distraction onsets: a distracting sample whose predecessor was not distracting
+    distracting = category == -1
+    onset = distracting & np.concatenate(([True], ~distracting[:-1] | breaks[:-1]))
+    onset_minutes = minute_of_day[onset]
+    onset_hours = np.bincount(hour[onset], minlength=24)
+    # First onset of each day
+    onset_days = day[onset]
+    _, first_idx = np.unique(onset_days, return_index=True)
+    first_onsets = onset_minutes[first_idx]
+
+    # App switches, ignoring changes across recording gaps
+    switched = (app[1:] != app[:-1]) & ~breaks[:-1]
+    switches_by_hour = np.bincount(hour[1:][switched], minlength=24)
+    hours_observed = hour_counts * sample_minutes / 60
+    with np.errstate(invalid='ignore', divide='ignore'):
+        switch_rate_by_hour = np.where(hours_observed > 0, switches_by_hour / np.maximum(hours_observed, 1e-9), np.nan)
+
+    # Focus session lengths: consecutive productive samples
+    _, productive_lengths = _runs(category == 1, breaks)
+    session_minutes = productive_lengths * sample_minutes
+    _, distracting_lengths = _runs(distracting, breaks)
+
+    # Time per application
+    app_minutes = np.bincount(app, minlength=len(arrays["app_names"])) * sample_minutes
+    top_apps = np.argsort(app_minutes)[::-1][:5]
+
+    total_hours = epoch.size * sample_minutes / 60
+    return {
+        "samples": int(epoch.size),
+        "days_observed": int(np.unique(day).size),
+        "from": datetime.fromtimestamp(epoch[0]).strftime('%Y-%m-%d'),
+        "to": datetime.fromtimestamp(epoch[-1]).strftime('%Y-%m-%d'),
+        "sample_minutes": round(sample_minutes, 2),
+        "tracked_hours": round(total_hours, 1),
+        "mean_focus": round(float(weight.mean()), 3),
+        "share_by_category": {
+            name: round(float(np.mean(category == code)), 3) for name, code in CATEGORY_CODES.items()
+        },
+        "hour_of_week_focus": heatmap,
+        "best_hours": [int(h) for h in ranked_hours[::-1][:3]],
+        "worst_hours": [int(h) for h in ranked_hours[:3]],
+        "distraction_onset": {
+            "median_first_onset": _clock(np.median(first_onsets)) if first_onsets.size else None,
+            "first_onset_range": (
+                [_clock(np.percentile(first_onsets, 25)), _clock(np.percentile(first_onsets, 75))]
+                if first_onsets.size else None
+            ),
+            "onsets_per_day": round(float(onset.sum()) / max(int(np.unique(day).size), 1), 1),
+            "peak_onset_hours": [int(h) for h in np.argsort(onset_hours)[::-1][:3] if onset_hours[h] > 0],
+            "median_distraction_minutes": (
+                round(float(np.median(distracting_lengths * sample_minutes)), 1) if distracting_lengths.size else 0.0
+            ),
+        },
+        "app_switches": {
+            "per_hour": round(float(switched.sum()) / total_hours, 1) if total_hours else 0.0,
+            "by_hour_of_day": [None if np.isnan(v) else round(float(v), 1) for v in switch_rate_by_hour],
+        },
+        "focus_sessions": {
+            "count": int(session_minutes.size),
+            "mean_minutes": round(float(session_minutes.mean()), 1) if session_minutes.size else 0.0,
+            "longest_minutes": round(float(session_minutes.max()), 1) if session_minutes.size else 0.0,
+            "percentiles_minutes": _percentiles(session_minutes),
+        },
+        "top_applications": {
+            arrays["app_names"][i]: round(float(app_minutes[i])) for i in top_apps if app_minutes[i] > 0
+        },
+    }
+
+def build_behaviour_profile(db_path=DB_PATH, weeks=DEFAULT_WEEKS, profile_path=BEHAVIOUR_PROFILE_FILE):
+    """Loads recent activity, computes the profile and saves it. Returns the profile."""
+    profile = compute_behaviour_profile(load_activity_arrays(db_path, weeks))
+    profile["generated_at"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    profile["weeks"] = weeks
+
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    with open(profile_path, 'w') as f:
+        json.dump(profile, f, separators=(',', ':'))
+    return profile
+
+
+if __name__ == "__main__":
+    print(json.dumps(build_behaviour_profile(), indent=2))
@@ -1,4 +1,7 @@
+import json
 import os
+import threading
+import time
 from app_terminator import close_all_browsers
 
 
@@ -7,6 +10,8 @@ from app_terminator import close_all_browsers
 HOSTS_PATH = "/etc/hosts"
 JANUS_START_MARKER = "# START JANUS BLOCKLIST\n"
 JANUS_END_MARKER = "# END JANUS BLOCKLIST\n"
+# Unblock deadlines survive restarts here, so a crash can't leave sites blocked forever.
+BLOCK_STATE_FILE = "database/block_state.json"
 
 distracting_sites = []
 
@@ -57,11 +62,156 @@ def unblock_sites(silent=False):
 
 
 def block_for_duration(duration: int, distracting_sites: list = distracting_sites):
-    import time
     block_sites(distracting_sites)
     time.sleep(duration)
     unblock_sites()
 
+
+# --- SCHEDULED BLOCKS ---
+# schedule_block() applies a block and returns immediately. Deadlines are kept
+# per site in BLOCK_STATE_FILE and a single background thread lifts them when
+# they expire. Overlapping blocks merge (a site keeps its latest deadline) and
+# the hosts file is only rewritten when the set of blocked sites changes.
+
+_block_condition = threading.Condition()
+_block_deadlines = None  # {site: unblock epoch seconds}, loaded lazily
+_expiry_thread = None
+
+
+def _load_block_state():
+    try:
+        with open(BLOCK_STATE_FILE, "r") as f:
+            return {site: float(deadline) for site, deadline in json.load(f).items()}
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError, TypeError, ValueError):
+        return {}
+
+def _save_block_state(deadlines):
+    dir_name = os.path.dirname(BLOCK_STATE_FILE)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    temp_path = BLOCK_STATE_FILE + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(deadlines, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, BLOCK_STATE_FILE)
+
+def _write_blocklist(sites):
+    """Replaces the Janus block in the hosts file with `sites` in a single rewrite."""
+    try:
+        with open(HOSTS_PATH, "r") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        print(f"Error: {HOSTS_PATH} not found.")
+        return
+
+    kept = []
+    in_janus_block = False
+    for line in lines:
+        if line.strip() == JANUS_START_MARKER.strip():
+            in_janus_block = True
+            continue
+        if line.strip() == JANUS_END_MARKER.strip():
+            in_janus_block = False
+            continue
+        if not in_janus_block:
+            kept.append(line)
+
+    if sites:
+        if kept and not kept[-1].endswith("\n"):
+            kept[-1] += "\n"
+        kept.append(JANUS_START_MARKER)
+        kept.extend(f"127.0.0.1 {site}\n" for site in sorted(sites))
+        kept.append(JANUS_END_MARKER)
+
+    with open(HOSTS_PATH, "w") as f:
+        f.writelines(kept)
+
+def _split_expired(deadlines, now):
+    """(remaining {site: deadline}, expired sites) without touching `deadlines`."""
+    remaining = {site: deadline for site, deadline in deadlines.items() if deadline > now}
+    return remaining, [site for site in deadlines if site not in remaining]
+
+def _expiry_loop():
+    """Background thread: sleeps until the earliest deadline, then lifts every expired block at once."""
+    global _expiry_thread, _block_deadlines
+    with _block_condition:
+        while _block_deadlines:
+            timeout = min(_block_deadlines.values()) - time.time()
+            if timeout > 0:
+                _block_condition.wait(timeout)
+                continue
+            remaining, expired = _split_expired(_block_deadlines, time.time())
+            try:
+                _write_blocklist(remaining.keys())
+                _save_block_state(remaining)
+            except OSError as e:
+                # The expired sites stay in the state, so the retry lifts them again
+                print(f"Error lifting expired blocks: {e}. Retrying in 60 seconds.")
+                _block_condition.wait(60)
+                continue
+            _block_deadlines = remaining
+            print(f"Unblocked {', '.join(sorted(expired))}.")
+        _expiry_thread = None
+
+def _ensure_expiry_thread():
+    """Starts the expiry thread if needed. Caller must hold _block_condition."""
+    global _expiry_thread
+    if _block_deadlines and _expiry_thread is None:
+        _expiry_thread = threading.Thread(target=_expiry_loop, name="janus-unblocker", daemon=True)
+        _expiry_thread.start()
+    _block_condition.notify_all()
+
+def schedule_block(duration: int, distracting_sites: list = distracting_sites):
+    """
+    Blocks the sites for `duration` seconds without waiting.
+    Returns the unblock deadline (epoch seconds) of this request.
+    """
+    global _block_deadlines
+    deadline = time.time() + duration
+    with _block_condition:
+        if _block_deadlines is None:
+            _block_deadlines = _load_block_state()
+
+        new_sites = [site for site in distracting_sites if site not in _block_deadlines]
+        for site in distracting_sites:
+            _block_deadlines[site] = max(_block_deadlines.get(site, 0.0), deadline)
+
+        # Persist the deadline before touching the hosts file, so a crash in
+        # between is still reconciled on the next start.
+        _save_block_state(_block_deadlines)
+        if new_sites:
+            _write_blocklist(_block_deadlines.keys())
+            print(f"Blocked {', '.join(new_sites)}.")
+        _ensure_expiry_thread()
+
+    if new_sites:
+        close_all_browsers()
+    return deadline
+
+def reconcile_blocks():
+    """
+    Call on startup: lifts blocks whose deadline passed while nothing was running,
+    clears a Janus block left in the hosts file without a saved state, and
+    re-arms the timer for the ones still outstanding.
+    Returns the outstanding {site: deadline}.
+    """
+    global _block_deadlines
+    with _block_condition:
+        _block_deadlines = _load_block_state()
+        remaining, expired = _split_expired(_block_deadlines, time.time())
+        try:
+            _write_blocklist(remaining.keys())
+            _save_block_state(remaining)
+        except OSError as e:
+            print(f"Error reconciling blocks: {e}. The unblocker will retry.")
+        else:
+            _block_deadlines = remaining
+            if expired:
+                print(f"Lifted expired blocks: {', '.join(sorted(expired))}.")
+        _ensure_expiry_thread()
+        return remaining
+
 if __name__ == "__main__":
     # Example usage
     distracting_sites = ["facebook.com", "www.youtube.com", "twitter.com", "www.instagram.com"]
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+
+# Append-only persistence for the commander's chat history.
+#
+# Each message is appended (and fsync'd) to conversation_history_YYYY-MM-DD.jsonl
+# as it happens, so saving a turn costs the same no matter how long the day's
+# history is. Every so often a background thread compacts the journal into the
+# conversation_history_YYYY-MM-DD.json snapshot (the plain list format
+# load_chat_history has always read) via an atomic rename, then empties the
+# journal. A crash mid-append loses at most the partial last line.
+
+# --- CONFIGURATION ---
+COMPACT_EVERY = 20  # appended messages between background compactions
+
+
+class ChatJournal:
+    def __init__(self, snapshot_path, compact_every=COMPACT_EVERY):
+        self.snapshot_path = snapshot_path
+        self.journal_path = os.path.splitext(snapshot_path)[0] + '.jsonl'
+        self.compact_every = compact_every
+        self.messages = []  # the full persisted transcript, snapshot + journal
+        self._lock = threading.Lock()
+        self._journal_file = None
+        self._pending = 0  # messages appended since the last compaction
+        self._compactor = None
+
+    # --- LOADING ---
+
+    def load(self):
+        """Reads the snapshot and replays the journal on top of it. Returns a copy of the messages."""
+        with self._lock:
+            self.messages = self._read_snapshot()
+            replayed = 0
+            for seq, message in self._read_journal():
+                if seq < len(self.messages) and self.messages[seq] == message:
+                    continue  # already in the snapshot (crash between rename and journal reset)
+                self.messages.append(message)
+                replayed += 1
+            self._pending = replayed
+        if replayed:
+            self.compact_in_background()
+        return list(self.messages)
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return []
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, list) else []
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read chat snapshot {self.snapshot_path}: {e}")
+            return []
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        entries = []
+        with open(self.journal_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries.append((entry["seq"], {"role": entry["role"], "parts": entry["parts"]}))
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # A torn final line from a crash mid-append; everything before it is intact
+                    break
+        return entries
+
+    # --- APPENDING ---
+
+    def append(self, messages):
+        """Durably appends messages ({"role", "parts"} dicts) to the journal."""
+        if not messages:
+            return
+        with self._lock:
+            if self._journal_file is None:
+                os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+                self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+            lines = []
+            for message in messages:
+                entry = {"seq": len(self.messages), "role": message["role"], "parts": message["parts"]}
+                lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+                self.messages.append({"role": message["role"], "parts": message["parts"]})
+            self._journal_file.write("".join(lines))
+            self._journal_file.flush()
+            os.fsync(self._journal_file.fileno())
+            self._pending += len(messages)
+            due = self._pending >= self.compact_every
+        if due:
+            self.compact_in_background()
+
+    # --- COMPACTION ---
+
+    def compact(self):
+        """Atomically rewrites the snapshot with every message and empties the journal."""
+        with self._lock:
+            if self._pending == 0 and os.path.exists(self.snapshot_path):
+                return
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            temp_path = self.snapshot_path + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(self.messages, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+
+            # Only now is it safe to drop the journal; a crash before this line
+            # leaves entries that load() recognises as already compacted.
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+            with open(self.journal_path, 'w') as f:
+                os.fsync(f.fileno())
+            self._pending = 0
+
+    def compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_safely, name="janus-chat-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except OSError as e:
+            print(f"Chat history compaction failed: {e}")
+
+    def reset(self, messages):
+        """Replaces the persisted transcript, e.g. when a session rolls over to a new day's file."""
+        with self._lock:
+            self.messages = [{"role": m["role"], "parts": m["parts"]} for m in messages]
+            self._pending = len(self.messages) or 1
+        self.compact()
+
+    def close(self):
+        """Waits for any background compaction and compacts whatever is left."""
+        if self._compactor is not None:
+            self._compactor.join()
+        self.compact()
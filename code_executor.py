@@ -1,58 +1,844 @@
+import builtins
+import hashlib
+import json
+import os
+import signal
+import socket
 import subprocess
 import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from multiprocessing.connection import Connection
 from typing import Dict, Union
 
-def run_code(code_string: str, timeout_seconds: int = 10) -> Dict[str, Union[str, int]]:
+try:
+    import resource
+except ImportError:  # Windows: no rlimits
+    resource = None
+
+# --- CONFIGURATION ---
+# run_code executes jobs in a pool of warm worker processes instead of starting
+# a fresh interpreter per call. Workers start from this file (--worker), not
+# from the commander, and import PREIMPORT_MODULES before they take their first
+# job. Every job gets a clean namespace, and a
+# worker is replaced after MAX_JOBS_PER_WORKER jobs, when its memory grows past
+# RECYCLE_RSS_MB, when a job leaves threads behind, or when a job times out.
+USE_WORKER_POOL = True
+POOL_SIZE = 2                       # idle workers kept warm
+PREIMPORT_MODULES = ["json", "math", "statistics", "datetime", "csv", "re", "collections", "itertools", "numpy", "pandas"]
+MAX_JOBS_PER_WORKER = 50
+RECYCLE_RSS_MB = 512
+WORKER_START_SECONDS = 30           # a worker that hasn't finished its imports by then is given up on
+
+# Per-job resource limits
+MEMORY_LIMIT_MB = 1024              # address space a job may add on top of the worker's own
+CPU_LIMIT_SECONDS = 30
+MAX_OPEN_FILES = 256
+MAX_CHILD_PROCESSES = 16
+MAX_OUTPUT_BYTES = 64 * 1024        # per stream; the middle of longer output is dropped
+
+# Named sessions: run_code(code, session="name") keeps variables between calls in a long-lived worker
+MAX_SESSIONS = 4                    # the least recently used session is closed to open another
+SESSION_IDLE_SECONDS = 15 * 60
+SESSION_MEMORY_LIMIT_MB = 2048      # a session whose memory grows past this is reset
+
+# Result cache: run_code(code, cache=True) returns the stored result of an identical earlier run
+# as long as every file and directory that run read is unchanged
+RESULT_CACHE_ENTRIES = 128
+RESULT_CACHE_BYTES = 4 * 1024 * 1024    # output and error text kept in total
+RACY_INPUT_SECONDS = 1.0                # inputs modified this recently may change again within the same mtime tick
+
+
+# --- JOB LIMITS ---
+# Each job runs under soft rlimits (restored afterwards, so a pooled worker can
+# serve the next job) and its output is streamed into bounded buffers. Runaway
+# allocation, CPU use, file descriptors, forks or output fail the job instead
+# of growing the worker or the commander.
+
+class CPULimitExceeded(Exception):
+    pass
+
+class OutputBuffer:
+    """Keeps the first and the most recent bytes of a stream within a fixed budget."""
+
+    def __init__(self, limit=MAX_OUTPUT_BYTES):
+        self.head_limit = limit // 4
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = deque()  # ring of the latest chunks
+        self.tail_size = 0
+        self.dropped = 0
+
+    def write(self, data):
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        while self.tail_size > self.tail_limit:
+            excess = self.tail_size - self.tail_limit
+            first = self.tail[0]
+            if len(first) <= excess:
+                self.tail.popleft()
+                self.tail_size -= len(first)
+                self.dropped += len(first)
+            else:
+                self.tail[0] = first[excess:]
+                self.tail_size -= excess
+                self.dropped += excess
+
+    def text(self):
+        marker = f"\n...[{self.dropped} bytes of output truncated]...\n".encode() if self.dropped else b""
+        return (bytes(self.head) + marker + b"".join(self.tail)).decode('utf-8', errors='replace')
+
+def _drain(fd, buffer):
+    try:
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buffer.write(chunk)
+    finally:
+        os.close(fd)
+
+def _read_proc_status(field):
+    """A kB field of /proc/self/status (Linux) in MB, or None."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _peak_rss_mb():
+    peak = _read_proc_status('VmHWM')
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    return peak
+
+def _current_rss_mb():
+    """Resident memory of this process in MB (current on Linux, peak elsewhere)."""
+    rss = _read_proc_status('VmRSS')
+    return rss if rss is not None else (_peak_rss_mb() or 0)
+
+def _reset_peak_rss():
+    """Makes VmHWM report this job's peak instead of the worker's lifetime peak (Linux 4.0+)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF) if resource is not None else None
+    return usage.ru_utime + usage.ru_stime if usage else time.process_time()
+
+def _user_process_count():
+    uid = os.getuid()
+    count = 0
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                count += os.stat(f'/proc/{name}').st_uid == uid
+            except OSError:
+                continue
+    return count
+
+class _JobLimits:
+    """Lowers the soft rlimits for one job and restores them afterwards."""
+
+    def __enter__(self):
+        self.saved = {}
+        if resource is None:
+            return self
+        address_space = _read_proc_status('VmSize')
+        if address_space is not None:
+            self._set(resource.RLIMIT_AS, int((address_space + MEMORY_LIMIT_MB) * 1024 * 1024))
+        self._set(resource.RLIMIT_CPU, int(_cpu_seconds()) + CPU_LIMIT_SECONDS)
+        self._set(resource.RLIMIT_NOFILE, MAX_OPEN_FILES)
+        # RLIMIT_NPROC counts every process of the user (and root ignores it)
+        if hasattr(resource, 'RLIMIT_NPROC') and os.geteuid() != 0 and os.path.isdir('/proc'):
+            self._set(resource.RLIMIT_NPROC, _user_process_count() + MAX_CHILD_PROCESSES)
+        return self
+
+    def _set(self, kind, soft):
+        old_soft, hard = resource.getrlimit(kind)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        try:
+            resource.setrlimit(kind, (soft, hard))
+            self.saved[kind] = (old_soft, hard)
+        except (ValueError, OSError):
+            pass
+
+    def __exit__(self, *exc_info):
+        for kind, limits in self.saved.items():
+            resource.setrlimit(kind, limits)
+        return False
+
+def _on_cpu_limit(signum, frame):
+    raise CPULimitExceeded(f"CPU time limit of {CPU_LIMIT_SECONDS} seconds exceeded.")
+
+
+# --- INPUT TRACING ---
+# A cacheable job runs with an audit hook (PEP 578) that records the (mtime,
+# size) of every file it opens for reading and every directory it lists.
+# Writes, deletes, subprocesses and network use mark the job as having side
+# effects, and such results are never cached. Audit hooks can't be removed, so
+# the hook is installed once per worker and is a no-op outside traced jobs.
+
+SIDE_EFFECT_EVENTS = (
+    "os.remove", "os.rename", "os.rmdir", "os.mkdir", "os.truncate", "os.chmod", "os.chown", "os.utime",
+    "os.link", "os.symlink", "os.system", "os.exec", "os.posix_spawn", "os.spawn", "os.fork", "os.kill",
+    "shutil.", "subprocess.Popen", "socket.connect", "socket.sendto", "socket.bind", "urllib.Request",
+    "sqlite3.connect",
+)
+_WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC
+# The interpreter's own files are covered by the version in the cache key; /proc, /dev and /sys aren't inputs
+_UNTRACED_PREFIXES = tuple(sorted({
+    os.path.join(os.path.realpath(prefix), '') for prefix in (sys.prefix, sys.base_prefix, sys.exec_prefix)
+})) + ('/proc/', '/dev/', '/sys/')
+
+def _fingerprint(path):
+    """(mtime_ns, size) of path, or None when it doesn't exist."""
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+class _Trace:
+    def __init__(self):
+        self.inputs = {}          # absolute path -> fingerprint when first read
+        self.side_effects = False
+
+    def read(self, path):
+        if path is None:
+            path = '.'
+        if isinstance(path, int):
+            return  # an already open descriptor
+        path = os.path.abspath(os.fsdecode(path))
+        if path in self.inputs or (path + os.sep).startswith(_UNTRACED_PREFIXES) or '__pycache__' in path:
+            return
+        self.inputs[path] = _fingerprint(path)
+
+_trace = None
+_audit_hook_installed = False
+
+def _audit(event, args):
+    trace = _trace
+    if trace is None:
+        return
+    try:
+        if event == "open":
+            path, mode, flags = args
+            writes = any(c in mode for c in "wax+") if mode else bool((flags or 0) & _WRITE_FLAGS)
+            if not writes:
+                trace.read(path)
+            elif not isinstance(path, int) and '__pycache__' not in os.fsdecode(path):
+                trace.side_effects = True
+        elif event in ("os.listdir", "os.scandir"):
+            trace.read(args[0])
+        elif event.startswith(SIDE_EFFECT_EVENTS):
+            trace.side_effects = True
+    except Exception:
+        trace.side_effects = True  # something unexpected; don't cache this job
+
+def _install_audit_hook():
+    global _audit_hook_installed
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit)
+        _audit_hook_installed = True
+
+
+# --- WORKER PROCESS ---
+
+def _execute_job(code_string, namespace=None):
+    """
+    Runs code_string like `python -c` would, in namespace if given (a
+    session's) or a fresh one. fds 1 and 2 are pipes drained into bounded
+    buffers, so output from C code is kept too.
+    """
+    buffers = OutputBuffer(), OutputBuffer()
+    readers = []
+    write_fds = []
+    for buffer in buffers:
+        read_fd, write_fd = os.pipe()
+        write_fds.append(write_fd)
+        reader = threading.Thread(target=_drain, args=(read_fd, buffer), daemon=True)
+        reader.start()
+        readers.append(reader)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = os.dup(1), os.dup(2)
+    os.dup2(write_fds[0], 1)
+    os.dup2(write_fds[1], 2)
+    returncode = 0
+    try:
+        if namespace is None:
+            namespace = {"__name__": "__main__", "__builtins__": builtins}
+        try:
+            with _JobLimits():
+                exec(compile(code_string, "<string>", "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                returncode = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException as e:
+            # Drop this function's frame so the traceback starts at the job's code
+            tb = e.__traceback__.tb_next if e.__traceback__ is not None else None
+            traceback.print_exception(type(e), e, tb)
+            returncode = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_fds[0], 1)
+        os.dup2(saved_fds[1], 2)
+        for fd in (*saved_fds, *write_fds):
+            os.close(fd)
+    for reader in readers:
+        reader.join(timeout=1)  # a process the job started may still hold the pipe open
+    return returncode, buffers[0], buffers[1]
+
+def _run_job(code_string, namespace=None, trace=False):
+    """
+    Runs one job and returns its reply, including resource usage and, when
+    traced, the files it read and whether it had side effects.
+    """
+    global _trace
+    _reset_peak_rss()
+    cpu_before = _cpu_seconds()
+    if trace:
+        _install_audit_hook()
+        _trace = _Trace()
+    try:
+        returncode, output, error = _execute_job(code_string, namespace)
+    finally:
+        traced, _trace = _trace, None
+    peak = _peak_rss_mb()
+    reply = {
+        "returncode": returncode,
+        "output": output.text(),
+        "error": error.text(),
+        "truncated": bool(output.dropped or error.dropped),
+        "cpu_seconds": round(_cpu_seconds() - cpu_before, 3),
+        "peak_rss_mb": round(peak, 1) if peak is not None else None,
+        "rss_mb": _current_rss_mb(),
+        "dirty": threading.active_count() > 1,  # the job left threads running
+    }
+    if traced is not None:
+        reply["inputs"] = sorted(traced.inputs.items())
+        reply["side_effects"] = traced.side_effects
+    return reply
+
+def _worker_main(conn, preload, session=False):
+    """
+    Worker loop: runs one job at a time. Pool workers restore the process
+    state a job may have changed; session workers keep it, namespace included.
+    """
+    for module_name in preload:
+        try:
+            __import__(module_name)
+        except ImportError:
+            pass
+    sys.stdin = open(os.devnull)
+    if hasattr(signal, 'SIGXCPU'):
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    try:
+        conn.send("ready")
+    except OSError:
+        return  # the commander exited while this worker was starting
+    cwd, environ, path, argv = os.getcwd(), dict(os.environ), list(sys.path), list(sys.argv)
+    namespace = {"__name__": "__main__", "__builtins__": builtins} if session else None
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        code_string, trace = message
+        conn.send(_run_job(code_string, namespace, trace))
+        if session:
+            continue
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+        sys.path[:] = path
+        sys.argv[:] = argv
+
+def _job_result(reply):
+    """The run_code result for a worker reply."""
+    if reply["returncode"] != 0:
+        result = {"status": "error", "output": reply["output"], "error": reply["error"].strip()}
+    else:
+        result = {"status": "success", "output": reply["output"].strip(), "error": reply["error"].strip()}
+    result["cpu_seconds"] = reply["cpu_seconds"]
+    result["peak_rss_mb"] = reply["peak_rss_mb"]
+    if reply["truncated"]:
+        result["truncated"] = True
+    return result
+
+
+# --- WORKER POOL ---
+
+class _Worker:
+    """
+    A worker interpreter running this file with --worker, connected over a
+    socket pair. Started as a fresh interpreter rather than forked from the
+    commander, so it never imports the commander's own modules.
+    """
+
+    def __init__(self, preload, session=False):
+        if os.name == "nt":
+            raise OSError("worker processes need inheritable sockets, which Windows doesn't provide")
+        parent_sock, child_sock = socket.socketpair()
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(child_sock.fileno()), ",".join(preload)]
+        if session:
+            command.append("--session")
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.DEVNULL, pass_fds=(child_sock.fileno(),))
+        except BaseException:
+            parent_sock.close()
+            raise
+        finally:
+            child_sock.close()
+        self.conn = Connection(parent_sock.detach())
+        self.jobs = 0
+        try:
+            ready = self.conn.poll(WORKER_START_SECONDS) and self.conn.recv() == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self.kill()
+            raise OSError(f"the code worker didn't start (exit code {self.process.poll()})")
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self._wait()
+        self.conn.close()
+
+    def retire(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        if not self._wait():
+            self.process.kill()
+            self._wait()
+        self.conn.close()
+
+    def _wait(self):
+        try:
+            self.process.wait(timeout=1)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+
+
+class WorkerPool:
+    def __init__(self, size=POOL_SIZE, preload=PREIMPORT_MODULES):
+        self.size = size
+        self.preload = list(preload)
+        self._idle = []
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Starts workers until size of them are idle; safe to call from a background thread."""
+        while True:
+            with self._lock:
+                if len(self._idle) + self._busy >= self.size:
+                    return
+                self._busy += 1  # reserve the slot while the worker starts
+            try:
+                worker = _Worker(self.preload)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+            with self._lock:
+                self._idle.append(worker)
+
+    def _replenish(self):
+        threading.Thread(target=self.warm, name="janus-code-pool", daemon=True).start()
+
+    def _checkout(self):
+        with self._lock:
+            worker = self._idle.pop() if self._idle else None
+            self._busy += 1
+        if worker is None:
+            try:
+                worker = _Worker(self.preload)  # every warm worker is busy
+            except BaseException:
+                with self._lock:
+                    self._busy -= 1
+                raise
+        return worker
+
+    def _checkin(self, worker, reply):
+        """Returns a healthy worker to the pool; kills or retires it otherwise."""
+        with self._lock:
+            self._busy -= 1
+        if reply is None:
+            worker.kill()
+        else:
+            worker.jobs += 1
+            recycle = reply["dirty"] or reply["rss_mb"] > RECYCLE_RSS_MB or worker.jobs >= MAX_JOBS_PER_WORKER
+            with self._lock:
+                keep = not recycle and len(self._idle) < self.size
+                if keep:
+                    self._idle.append(worker)
+            if not keep:
+                worker.retire()
+        self._replenish()
+
+    def run(self, code_string, timeout_seconds):
+        return self.execute(code_string, timeout_seconds)[0]
+
+    def execute(self, code_string, timeout_seconds, trace=False):
+        """Runs one job. Returns (result, worker reply); the reply is None on a timeout or crash."""
+        worker = self._checkout()
+        reply, timed_out = None, False
+        try:
+            worker.conn.send((code_string, trace))
+            if worker.conn.poll(timeout_seconds):
+                reply = worker.conn.recv()
+            else:
+                timed_out = True
+        except (EOFError, OSError):
+            pass  # the worker died mid-job
+        finally:
+            # Only this worker is killed on a timeout; the rest of the pool stays warm
+            self._checkin(worker, reply)
+
+        if timed_out:
+            return {
+                "status": "timeout",
+                "output": "",
+                "error": f"Execution timed out after {timeout_seconds} seconds."
+            }, None
+        if reply is None:
+            return {"status": "error", "output": "", "error": f"The worker process exited unexpectedly (exit code {worker.process.returncode})."}, None
+        return _job_result(reply), reply
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.retire()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_worker_pool():
+    """The process-wide worker pool, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool()
+            _pool._replenish()  # warm up in the background; run() starts a worker itself if none is ready
+        return _pool
+
+# --- RESULT CACHE ---
+
+class ResultCache:
+    """
+    LRU of successful, side-effect-free job results, bounded by entry count
+    and text size. An entry is only returned while every input the job read
+    still has the fingerprint it had during the run.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (inputs, result, size), least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code_string):
+        # Relative paths in the code resolve against the working directory, so it is part of the key
+        material = "\0".join((sys.version, sys.executable, os.getcwd(), code_string))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            inputs, result, _ = entry
+            if all(_fingerprint(path) == stamp for path, stamp in inputs):
+                with self._lock:
+                    self.hits += 1
+                return dict(result, cached=True)
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._remove(key)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, inputs, result):
+        inputs = [(path, tuple(stamp) if stamp is not None else None) for path, stamp in inputs]
+        size = len(result["output"]) + len(result["error"]) + sum(len(path) for path, _ in inputs)
+        racy = time.time_ns() - int(RACY_INPUT_SECONDS * 1e9)
+        if size > self.max_bytes or any(stamp is not None and stamp[0] >= racy for _, stamp in inputs):
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (inputs, dict(result), size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+_result_cache = ResultCache()
+
+def _run_cached(code_string, timeout_seconds):
+    """Runs a job through the result cache."""
+    key = _result_cache.key(code_string)
+    result = _result_cache.get(key)
+    if result is not None:
+        return result
+    result, reply = get_worker_pool().execute(code_string, timeout_seconds, trace=True)
+    if reply is not None and result["status"] == "success" and not reply["side_effects"]:
+        _result_cache.put(key, reply["inputs"], result)
+    return result
+
+
+# --- SESSIONS ---
+
+class _Session:
+    def __init__(self, name):
+        self.name = name
+        self.worker = None  # set once started; None afterwards means it failed to start
+        self.jobs = 0
+        self.last_used = time.time()
+        self.lock = threading.Lock()  # one job at a time per session; held while the worker starts
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.kill()
+
+
+class SessionManager:
+    """Named, long-lived workers that keep their namespace between jobs."""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._sessions = OrderedDict()  # name -> _Session, least recently used first
+        self._lock = threading.Lock()
+        threading.Thread(target=self._reap_idle, name="janus-code-sessions", daemon=True).start()
+
+    def _get(self, name):
+        """
+        The session called name, creating it if needed. The name is reserved
+        under the manager lock, but its worker starts outside it, holding only
+        the new session's own lock, so other sessions aren't held up meanwhile.
+        """
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is not None:
+                self._sessions.move_to_end(name)
+                return session, False
+            evicted = []
+            while len(self._sessions) >= MAX_SESSIONS:
+                evicted.append(self._sessions.popitem(last=False)[1])
+            session = self._sessions[name] = _Session(name)
+            session.lock.acquire()
+        try:
+            for old in evicted:
+                old.close()
+                print(f"Closed code session '{old.name}' to make room for '{name}'.")
+            try:
+                worker = _Worker(self._pool.preload, session=True)
+            except BaseException:
+                with self._lock:
+                    if self._sessions.get(name) is session:
+                        del self._sessions[name]
+                raise
+            with self._lock:
+                session.worker = worker
+                dropped = self._sessions.get(name) is not session  # evicted or reset while starting
+            if dropped:
+                session.close()
+        finally:
+            session.lock.release()
+        return session, True
+
+    def _drop(self, session):
+        with self._lock:
+            if self._sessions.get(session.name) is session:
+                del self._sessions[session.name]
+        session.close()
+
+    def run(self, name, code_string, timeout_seconds):
+        session, created = self._get(name)
+        with session.lock:
+            if session.worker is None:
+                raise OSError(f"the worker for session '{name}' didn't start")
+            reply, timed_out = None, False
+            try:
+                session.worker.conn.send((code_string, False))
+                if session.worker.conn.poll(timeout_seconds):
+                    reply = session.worker.conn.recv()
+                else:
+                    timed_out = True
+            except (EOFError, OSError):
+                pass
+            session.last_used = time.time()
+            session.jobs += 1
+
+        if timed_out:
+            self._drop(session)
+            return {
+                "status": "timeout",
+                "output": "",
+                "error": f"Execution timed out after {timeout_seconds} seconds. Session '{name}' was reset; its variables are gone.",
+                "session": name,
+            }
+        if reply is None:
+            self._drop(session)
+            return {"status": "error", "output": "", "session": name,
+                    "error": f"Session '{name}' crashed and was reset; its variables are gone."}
+
+        result = _job_result(reply)
+        result["session"] = name
+        result["session_jobs"] = session.jobs
+        if created:
+            result["note"] = f"Started a new session '{name}'."
+        if reply["rss_mb"] > SESSION_MEMORY_LIMIT_MB:
+            self._drop(session)
+            result["note"] = f"Session '{name}' used {reply['rss_mb']:.0f} MB (cap {SESSION_MEMORY_LIMIT_MB} MB) and was reset."
+        return result
+
+    def reset(self, name):
+        with self._lock:
+            session = self._sessions.pop(name, None)
+        if session is None:
+            return {"status": "error", "message": f"No code session named '{name}'."}
+        with session.lock:
+            session.close()
+        return {"status": "success", "message": f"Session '{name}' was reset."}
+
+    def list(self):
+        now = time.time()
+        with self._lock:
+            return [
+                {"session": s.name, "jobs": s.jobs, "idle_seconds": round(now - s.last_used)}
+                for s in self._sessions.values()
+            ]
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(60)
+            now = time.time()
+            with self._lock:
+                idle = [s for s in self._sessions.values() if now - s.last_used > SESSION_IDLE_SECONDS]
+            for session in idle:
+                if session.lock.acquire(blocking=False):
+                    try:
+                        self._drop(session)
+                    finally:
+                        session.lock.release()
+                    print(f"Closed idle code session '{session.name}'.")
+
+    def shutdown(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        for session in sessions:
+            session.close()
+
+
+_sessions = None
+
+def get_session_manager():
+    global _sessions
+    pool = get_worker_pool()
+    with _pool_lock:
+        if _sessions is None:
+            _sessions = SessionManager(pool)
+        return _sessions
+
+def reset_session(session):
+    """Drops a named session and its variables."""
+    return get_session_manager().reset(session)
+
+def run_code(code_string: str, timeout_seconds: int = 10, session: str = None, cache: bool = False) -> Dict[str, Union[str, int]]:
     """
-    Executes a string of Python code in a secure, isolated subprocess.
-
-    This function is designed to safely run code from untrusted sources (like an LLM)
-    by isolating the execution in a separate process. It prevents the code from
-    accessing or harming the host system.
-
-    Features:
-    - Runs code in a separate process using the same Python executable.
-    - Captures both standard output (stdout) and standard error (stderr).
-    - Implements a timeout to stop code that runs for too long.
-    - Returns a structured dictionary with the execution status and results.
-
-    Args:
-        code_string (str): The Python code to be executed.
-        timeout_seconds (int): The maximum number of seconds the code is allowed to run.
-                               Defaults to 10 seconds.
-
-    Returns:
-        dict: A dictionary containing:
-              - 'status' (str): "success", "error", "timeout", or "exception".
-              - 'output' (str): The captured standard output.
-              - 'error' (str): The captured standard error.
+    Executes a string of Python code in an isolated worker process and returns
+    {"status", "output", "error"} with status "success", "error", "timeout" or
+    "exception". Uses the warm worker pool, falling back to a fresh
+    interpreter per call when the pool is disabled or can't start. With a
+    session name the code runs in that session's long-lived worker, so
+    variables, imports and loaded data carry over to the next call.
+
+    With cache=True an identical earlier run is reused, flagged "cached",
+    while the files it read are unchanged. Only opt in for code whose result
+    depends on nothing but its inputs (no clock, randomness or network).
+    Session runs are never cached.
+    """
+    if session:
+        try:
+            return get_session_manager().run(str(session), code_string, timeout_seconds)
+        except OSError as e:
+            return {"status": "exception", "output": "", "error": f"Code sessions are unavailable: {e}"}
+    if USE_WORKER_POOL:
+        try:
+            if cache:
+                return _run_cached(code_string, timeout_seconds)
+            return get_worker_pool().run(code_string, timeout_seconds)
+        except OSError as e:
+            print(f"Code worker pool unavailable, using a fresh interpreter: {e}")
+    return _run_in_subprocess(code_string, timeout_seconds)
+
+def _run_in_subprocess(code_string: str, timeout_seconds: int = 10) -> Dict[str, Union[str, int]]:
+    """
+    Executes a string of Python code in a fresh interpreter (the path used
+    before the worker pool). The child runs the job exactly like a pool
+    worker, with the same limits and bounded capture, and prints its reply
+    as JSON on its real stdout.
     """
     try:
-        # The 'subprocess.run' command executes the code in a new process.
-        # [sys.executable, "-c", code_string] tells the subprocess to run the
-        # current python interpreter and execute the code_string.
         result = subprocess.run(
-            [sys.executable, "-c", code_string],
-            capture_output=True,  # Capture stdout and stderr
-            text=True,            # Decode output and error as text
+            [sys.executable, os.path.abspath(__file__), "--run-job"],
+            input=code_string.encode(),
+            capture_output=True,
             timeout=timeout_seconds, # Enforce a timeout
-            check=False           # Do not raise exception on non-zero exit codes
+            check=False
         )
-
-        # If the code executed and returned a non-zero exit code, it's a runtime error.
-        if result.returncode != 0:
+        try:
+            return _job_result(json.loads(result.stdout))
+        except (json.JSONDecodeError, KeyError):
             return {
                 "status": "error",
-                "output": result.stdout,
-                "error": result.stderr.strip()
+                "output": "",
+                "error": f"The interpreter exited unexpectedly (exit code {result.returncode}): {result.stderr[-2000:].decode(errors='replace').strip()}"
             }
-        
-        # If the code executed successfully (return code 0).
-        return {
-            "status": "success",
-            "output": result.stdout.strip(),
-            "error": result.stderr.strip() # May contain warnings even on success
-        }
 
     except subprocess.TimeoutExpired:
         # This block catches the case where the code takes too long to run.
@@ -70,6 +856,18 @@ def run_code(code_string: str, timeout_seconds: int = 10) -> Dict[str, Union[str
         }
 
 if __name__ == '__main__':
+    if sys.argv[1:] == ["--run-job"]:
+        # One-shot job for _run_in_subprocess
+        if hasattr(signal, 'SIGXCPU'):
+            signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        sys.stdout.write(json.dumps(_run_job(sys.stdin.read())))
+        sys.exit(0)
+    if sys.argv[1:2] == ["--worker"]:
+        # Pool or session worker for _Worker: --worker <socket fd> <preload,modules> [--session]
+        preload = [name for name in sys.argv[3].split(",") if name]
+        _worker_main(Connection(int(sys.argv[2])), preload, session="--session" in sys.argv[4:])
+        sys.exit(0)
+
     print("--- Running examples of the 'run_code' function ---")
 
     # Example 1: Successful execution
@@ -108,3 +906,10 @@ if __name__ == '__main__':
     fs_result = run_code(filesystem_code)
     print(f"   Status: {fs_result['status']}")
     print(f"   Output:\n---\n{fs_result['output']}\n---")
+
+    # Example 6: Workers must not carry the commander's modules (genai, gRPC, the key pool)
+    print("\n6. Checking that a worker starts clean...")
+    probe_code = "import sys\nprint(sorted(m for m in sys.modules if m.split('.')[0] in ('google', 'commander_cli', 'key_pool', 'generative_speech')))"
+    probe_result = run_code(probe_code)
+    print(f"   Status: {probe_result['status']}")
+    print(f"   Commander modules in the worker: {probe_result['output']}")
@@ -1,46 +1,40 @@
+import copy
 import os
 import json
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from pathlib import Path
 from re import escape
 import google.generativeai as genai
 from dotenv import load_dotenv
 from rich.console import Console
+from rich.live import Live
+from rich.markup import MarkupError
 from rich.prompt import Prompt
+from rich.text import Text
 import sqlite3
 from datetime import datetime, timedelta
 
-from code_executor import run_code
-from generative_speech import speak
+from code_executor import get_worker_pool, reset_session, run_code
+from generative_speech import cancel_speech, speak
+from chat_journal import ChatJournal
+from context_digest import get_context_digest
+from context_manager import ContextManager
+from file_pager import PageTokenError, read_page
+from intent_router import answer as answer_intent, route as route_intent
+from project_index import find_project_files, project_structure
+from key_pool import bind_model, get_key_pool, is_rate_limit_error
+from llm_gateway import GatewayUnavailable, PRIORITY_INTERACTIVE, build_request, gateway_stream_async, history_to_contents
+from streaming_json import StreamingFieldExtractor, clean_model_json
 
 
-from dotenv import load_dotenv
-import itertools
 # --- SETUP AND TOOLS (No changes here) ---
 load_dotenv()
 
-# Load all keys from .env into a list
-api_keys = [
-    os.getenv("GOOGLE_API_KEY_1"),
-    os.getenv("GOOGLE_API_KEY_2"),
-    os.getenv("GOOGLE_API_KEY_3"),
-    os.getenv("GOOGLE_API_KEY_4"),
-    os.getenv("GOOGLE_API_KEY_5"),
-    os.getenv("GOOGLE_API_KEY_6"),
-    os.getenv("GOOGLE_API_KEY_7"),
-    os.getenv("GOOGLE_API_KEY_8"),
-    os.getenv("GOOGLE_API_KEY_9"),
-    os.getenv("GOOGLE_API_KEY_10"),
-    os.getenv("GOOGLE_API_KEY_11"),
-]
-# Filter out any missing keys
-valid_keys = [key for key in api_keys if key]
-
-if not valid_keys:
-    raise ValueError("No valid Google API keys found in .env file.")
-
-# Create an infinite, cycling iterator for the keys
-key_rotator = itertools.cycle(valid_keys)
+# Keys from .env are shared with the other Janus processes through the key pool ledger
+KEY_POOL = get_key_pool()
 
 
 # --- CONFIGURATION ---
@@ -53,6 +47,12 @@ TASKS_FILE = os.path.join(DATA_DIR, 'tasks.json')
 BEHAVIOR_FILE = os.path.join(DATA_DIR, 'user_behavior.json')
 TODAYS_PLAN_FILE = os.path.join(DATA_DIR, 'todays_plan.json')
 LLM_INFO_FILE = os.path.join(DATA_DIR, 'additional_llm_info.json')
+CONTEXT_TOKEN_BUDGET = 60000  # estimated tokens of chat history sent with each message
+COMMANDER_MODEL = 'gemini-2.5-flash'
+GENERATION_CONFIG = {"response_mime_type": "application/json"}
+TEXT_FILE_EXTENSIONS = ('.txt', '.md', '.sh', '.py', '.log', '.jsonl')
+WHOLE_FILE_MAX_BYTES = 64 * 1024  # larger files (and every .csv) are returned a page at a time
+PAGE_TOKEN_ROOTS = (os.getcwd(), os.path.expanduser('~'))  # a page token may only continue files under these
 # reading llm info file to add it to system prompt
 os.makedirs(DATA_DIR, exist_ok=True)
 with open(LLM_INFO_FILE, 'r') as f:
@@ -60,10 +60,6 @@ with open(LLM_INFO_FILE, 'r') as f:
 
 
 
-API_KEY = os.getenv('GENAI_API_KEY_3')
-if not API_KEY: raise ValueError("GENAI_API_KEY_2 not set.")
-genai.configure(api_key=API_KEY)
-
 # --- SYSTEM PROMPT ---
 SYSTEM_PROMPT = f"""
 You are Janus, a personal AI assistant. Your purpose is to help the user.
@@ -71,6 +67,7 @@ You are Janus, a personal AI assistant. Your purpose is to help the user.
 The JSON object must have a "response_type" key.
 1.  If you want to have a conversation, set "response_type" to "conversation" and put your reply in a "comment" key. And you voice message in "speak" key. Keep the voice message short and relevant to the comment.
 2.  If you need to use a tool, set "response_type" to "tool_use" and add the "tool_name" and "parameters" keys.
+    If you need several tools that don't depend on each other's results, set "response_type" to "tool_batch" and list them in "tool_calls". They run at the same time and all results come back in one message.
 3.  Whenever you find new info about me first update that into files.
 
 **Example 1: Conversational Reply**
@@ -87,6 +84,16 @@ The JSON object must have a "response_type" key.
   "parameters": {{}}
 }}
 
+**Example 3: Batch Tool Use**
+{{
+  "response_type": "tool_batch",
+  "tool_calls": [
+    {{"tool_name": "read_user_profile", "parameters": {{}}}},
+    {{"tool_name": "read_tasks", "parameters": {{}}}},
+    {{"tool_name": "get_recent_activity_data", "parameters": {{"minutes": 60}}}}
+  ]
+}}
+
 1.  `read_user_profile()`: Reads the user's personal profile.
 2.  `read_tasks()`: Reads the user's goals and tasks.
 3.  `read_user_behavior()`: Reads observations about the user's habits.
@@ -98,24 +105,19 @@ The JSON object must have a "response_type" key.
 9.  `get_recent_activity_data(minutes)`: Retrieves the user's computer activity data from the last 'minutes' minutes. Provide the number of minutes as an integer parameter.
 10. `read_todays_plan()`: Reads the user's plan for today.
 11. `update_todays_plan(updated_plan)`: Overwrites today's plan.
-12. `get_project_structure(target_path)`: Retrieves the project's folder structure. Provide the target path as a string parameter. For current directories, use "." as the path. Always provide a target path.
-13. `read_any_file(file_path)`: Reads the content of any file given its path. Supported file types: .json, .txt, .md, .csv, .sh, .py. Returns an error message if the file does not exist or is of an unsupported type.
+12. `get_project_structure(target_path, max_depth)`: Retrieves the folder tree of target_path in one call, down to max_depth levels (default 3). Files are shown as [size in bytes, last modified]; deeper folders as "N entries". .gitignore'd files, venv and __pycache__ are left out. For current directories, use "." as the path. Always provide a target path.
+13. `read_any_file(file_path, offset, limit, unit, page_token)`: Reads the content of any file given its path. Supported file types: .json, .txt, .md, .csv, .sh, .py, .log, .jsonl. Small files come back whole. Large files and .csv files come back one page at a time: "unit" is "lines", "bytes" or "rows" (.csv), "offset" and "limit" are in that unit, and .csv pages include the column schema. Only file_path is required. If the result has a "next_page_token", pass it as "page_token" (without file_path) to read the next page. Read only as many pages as you need. Returns an error message if the file does not exist or is of an unsupported type.
 14. `write_any_file(file_path, data)`: Writes data to any file given its path. Supported file types: .json, .txt, .md, .csv, .sh, .py. The 'data' parameter should be the content to write. Creates the file if it does not exist.
 15. `current_time()`: Returns the current date and time in the format "YYYY-MM-DD HH:MM:SS".
-16. `run_code(code, timeout_seconds)`: Executes provided Python code in a secure sandboxed environment. The 'code' parameter is a string of Python code to execute. The 'timeout_seconds' parameter is an integer specifying the maximum execution time in seconds.
+16. `run_code(code, timeout_seconds, session, cache)`: Executes provided Python code in a secure sandboxed environment. The 'code' parameter is a string of Python code to execute. The 'timeout_seconds' parameter is an integer specifying the maximum execution time in seconds. The optional 'session' parameter is a name (for example "sales_analysis"): calls with the same session share variables, imports and loaded data, so for multi-step analysis load the data once and reuse it in later calls instead of reloading it. Sessions close after 15 idle minutes, on a timeout or when they use too much memory; the result says when a session was started or reset. Set the optional 'cache' parameter to true for read-only computations you may repeat (for example summarizing a file): if the same code already ran and the files it read are unchanged, the stored result comes back instantly with "cached": true. Don't cache code that depends on the time, randomness or the network, or that writes files.
+17. `find_files(pattern, target_path, limit)`: Finds files and folders under target_path (default ".") matching a glob such as "*.py" or "src/*/test_*". A pattern without wildcards matches any name containing it. Prefer this over exploring folders one by one.
+18. `reset_code_session(session)`: Discards a run_code session and all its variables.
+19. `get_cache_stats()`: Returns the entries, size and hit rate of the file cache behind the read tools. Only use it when the user asks about it.
 
 **Important Instructions:**
 1. I am using rich python library so format you conversation based in rich markdown.
-2. Do one thing at a time. Use a tool or have a conversation, but not both at the same time.also complete the task like if you want to call multiple tools then do it one by one and only start the conversation after the tool calls are done.
-3. You can shorten the conversation_history by summarizing it if it gets too long. Conversation_history is stored in chat_history folder. The file with name conversation_history_YYYY-MM-DD.json is the current file used. use write_any_file tool to add a new block to the json file following the structure like
-    example: 
-        [{{
-            "role": "model",
-            "parts": [
-            "<summary here>"
-            ]
-        }}
-        ]
+2. Do one thing at a time. Use tools or have a conversation, but not both at the same time. If you need multiple independent tools (for example reading several files), request them together with "tool_batch". Only call tools one by one when a call needs the result of an earlier one, and never put two writes to the same file in one batch. Only start the conversation after the tool calls are done.
+3. The conversation history is kept within a token budget automatically: old tool results are shortened and older messages are folded into a "[Summary of earlier conversation]" block. Don't rewrite the conversation_history files yourself. If you need the full content of an elided tool result, call the tool again.
 4. You MUST ALWAYS respond with a single, valid JSON object. Do not add any text before or after the JSON object.
 5. If you want to use tool then don't add any other text except the JSON object.
 
@@ -131,32 +133,122 @@ Use this new conversation json format:
 }}
 """
 
+# --- FILE CACHE ---
+class FileCache:
+    """
+    Read-through cache of parsed file contents for the file tools.
+
+    Entries are keyed by (absolute path, kind) and validated against the
+    file's (mtime_ns, size) on every lookup, so edits made outside the
+    commander are picked up. Memory is bounded by entry count and by the
+    total size of the cached files, evicting least recently used first.
+    Values are kept parsed and every lookup returns a deep copy, so a caller
+    mutating its result can't corrupt the cache.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (path, kind) -> ((mtime_ns, size), value)
+        self._bytes = 0
+        self._lock = threading.Lock()  # batched tools read concurrently
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _stamp(path):
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, path, kind, loader):
+        """Returns the cached value for path, calling loader(path) on a miss or when the file changed."""
+        key = (os.path.abspath(path), kind)
+        stamp = self._stamp(key[0])  # raises FileNotFoundError like open() would
+        with self._lock:
+            entry = self._entries.get(key)
+            fresh = entry is not None and entry[0] == stamp
+            if fresh:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if fresh:
+            return copy.deepcopy(entry[1])
+        value = loader(path)
+        self._store(key, stamp, value)
+        return copy.deepcopy(value)
+
+    def put(self, path, kind, value):
+        """Write-through: caches value as the current contents of path and drops its other kinds."""
+        path = os.path.abspath(path)
+        self.invalidate(path)
+        self._store((path, kind), self._stamp(path), copy.deepcopy(value))
+
+    def invalidate(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._bytes -= self._entries.pop(key)[0][1]
+
+    def _store(self, key, stamp, value):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0][1]
+            if stamp[1] > self.max_bytes:
+                return
+            self._entries[key] = (stamp, value)
+            self._bytes += stamp[1]
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (old_stamp, _) = self._entries.popitem(last=False)
+                self._bytes -= old_stamp[1]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+FILE_CACHE = FileCache()
+
+def get_cache_stats():
+    """Hit rates of the file cache, for checking it while the commander runs."""
+    return {"status": "success", "file_cache": FILE_CACHE.stats()}
+
+def _load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _load_text(path):
+    with open(path, 'r') as f:
+        return {"content": f.read()}
+
 # --- TOOL FUNCTIONS ---
 
 # Function to read the data from any file type provided the path
-def read_any_file(file_path):
-    if not os.path.exists(file_path):
-        return {"status": "error", "message": f"File {os.path.basename(file_path)} does not exist."}
+def read_any_file(file_path=None, offset=0, limit=None, unit=None, page_token=None):
+    if page_token:
+        try:
+            return read_page(page_token=page_token, limit=limit,
+                             extensions=('.json', '.csv') + TEXT_FILE_EXTENSIONS, roots=PAGE_TOKEN_ROOTS)
+        except (PageTokenError, TypeError, ValueError, OSError) as e:
+            return {"status": "error", "message": str(e)}
+    if not file_path or not os.path.exists(file_path):
+        return {"status": "error", "message": f"File {os.path.basename(file_path or '')} does not exist."}
     try:
-        with open(file_path, 'r') as f:
-            if file_path.endswith('.json'):
-                return json.load(f)
-            elif file_path.endswith('.txt'):
-                return {"content": f.read()}
-            elif file_path.endswith('.md'): # markdown file
-                return {"content": f.read()}
-            elif file_path.endswith('.csv'): # CSV file
-                import pandas as pd
-                df = pd.read_csv(f)
-                return df.to_dict(orient='records')
-            # .sh file
-            elif file_path.endswith('.sh'):
-                return {"content": f.read()}
-            # .py file
-            elif file_path.endswith('.py'):
-                return {"content": f.read()}
-            else:
-                return {"status": "error", "message": "Unsupported file type."}
+        whole = not (offset or limit or unit) and os.path.getsize(file_path) <= WHOLE_FILE_MAX_BYTES
+        if file_path.endswith('.json') and whole:
+            return FILE_CACHE.get(file_path, "json", _load_json)
+        elif file_path.endswith(TEXT_FILE_EXTENSIONS) and whole: # text, markdown, log and script files
+            return FILE_CACHE.get(file_path, "text", _load_text)
+        elif file_path.endswith(('.json', '.csv') + TEXT_FILE_EXTENSIONS): # large files and CSV, a page at a time
+            return read_page(file_path, offset, limit, unit)
+        else:
+            return {"status": "error", "message": "Unsupported file type."}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -164,8 +256,7 @@ def read_any_file(file_path):
 def read_file(filepath):
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
     try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
+        return FILE_CACHE.get(filepath, "json", _load_json)
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
 
@@ -225,6 +316,12 @@ def write_file(filepath, data):
                 "Unsupported data type. Data must be a str, bytes, or a dict/list for .json files."
             )
 
+        # Keep the file cache in step with what was just written
+        if filepath.endswith('.json') and isinstance(data, (dict, list)):
+            FILE_CACHE.put(filepath, "json", data)
+        else:
+            FILE_CACHE.invalidate(filepath)
+
         # If everything succeeded, return a success message.
         return {"status": "success", "message": f"File '{os.path.basename(filepath)}' was written successfully."}
 
@@ -233,27 +330,21 @@ def write_file(filepath, data):
         return {"status": "error", "message": str(e)}
 
 # get the file structure of provided path
-def get_project_structure(target_path="."):
+def get_project_structure(target_path=".", max_depth=3):
     """
-    Returns the top-level directory structure for a given path.
+    Returns the directory tree of a given path, down to max_depth levels.
     
     Args:
         target_path (str): The path to the folder to search. 
                            Defaults to the current directory (".").
+        max_depth (int): How many directory levels to expand.
     """
-    # Convert the incoming string path into a Path object
-    search_path = Path(target_path)
-
-    # Safety check: Make sure the path exists and is a directory
-    if not search_path.is_dir():
-        print(f"Error: Path '{search_path}' is not a valid directory.")
-        return {} # Return an empty dictionary on error
+    # Served from a cached index that only rescans directories that changed
+    return project_structure(target_path, max_depth)
 
-    # Use iterdir() for a non-recursive listing of the given path
-    return {
-        path.name: path.name 
-        for path in search_path.iterdir()
-    }
+def find_files(pattern, target_path=".", limit=100):
+    """Finds files under target_path whose name (or relative path, if pattern has a '/') matches pattern."""
+    return find_project_files(pattern, target_path, limit)
 
 def get_recent_activity_data(minutes=60):
     """Queries the DB for the last 'minutes' of activity for today."""
@@ -305,57 +396,217 @@ TOOL_MAPPING = {
     "get_recent_activity_data": lambda minutes: get_recent_activity_data(minutes),
     "read_todays_plan": lambda: read_file(TODAYS_PLAN_FILE),
     "update_todays_plan": lambda updated_plan: write_file(TODAYS_PLAN_FILE, updated_plan),
-    "get_project_structure": lambda target_path: get_project_structure(target_path),
-    "read_any_file": lambda file_path: read_any_file(file_path),
+    "get_project_structure": lambda target_path=".", max_depth=3: get_project_structure(target_path, max_depth),
+    "find_files": lambda pattern, target_path=".", limit=100: find_files(pattern, target_path, limit),
+    "read_any_file": lambda file_path=None, offset=0, limit=None, unit=None, page_token=None: read_any_file(
+        file_path, offset, limit, unit, page_token
+    ),
     # tool that will use write_file function to write data to any file
     "write_any_file": lambda file_path, data: write_file(file_path, data),
     "current_time": lambda: {"current_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S')},
-    "run_code": lambda code, timeout_seconds=5: run_code(code, timeout_seconds),
+    "run_code": lambda code, timeout_seconds=5, session=None, cache=False: run_code(code, timeout_seconds, session, cache),
+    "reset_code_session": lambda session: reset_session(session),
+    "get_cache_stats": lambda: get_cache_stats(),
 
 }
 
 # --- CHAT HISTORY FUNCTIONS ---
+context_manager = ContextManager(token_budget=CONTEXT_TOKEN_BUDGET)
+
 def get_chat_history_path():
     today_str = datetime.now().strftime('%Y-%m-%d')
     os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
     return os.path.join(CHAT_HISTORY_DIR, f'conversation_history_{today_str}.json')
 
-def load_chat_history():
-    history_path = get_chat_history_path()
-    if os.path.exists(history_path):
-        with open(history_path, 'r') as f:
-            chat_history = json.load(f)
-            chat_history_length = len(json.dumps(chat_history))
-            print(f"Loaded {len(chat_history)}({chat_history_length}) messages from chat history.")
-            if chat_history_length > 200000:  # If history exceeds 200k characters, truncate it
-                print("Chat history too long, truncating to last 10 messages.")
-                return chat_history[-10:]
-            return chat_history
-    return []
-
-def save_chat_history(history):
+chat_journal = None
+
+def get_chat_journal():
+    """Returns the journal for today's history file, rolling the transcript over when the date changes."""
+    global chat_journal
     history_path = get_chat_history_path()
-    serializable_history = [
-        {"role": msg.role, "parts": [part.text for part in msg.parts]} for msg in history
+    if chat_journal is None:
+        chat_journal = ChatJournal(history_path)
+    elif chat_journal.snapshot_path != history_path:
+        previous = chat_journal
+        previous.close()
+        chat_journal = ChatJournal(history_path)
+        chat_journal.reset(previous.messages)
+    return chat_journal
+
+def load_chat_history():
+    chat_history = get_chat_journal().load()
+    if chat_history:
+        chat_history_tokens = context_manager.track(chat_history)
+        print(f"Loaded {len(chat_history)}(~{chat_history_tokens} tokens) messages from chat history.")
+        # Over-budget histories are trimmed by the context manager before the first send
+    return chat_history
+
+def save_chat_history(new_messages):
+    """Appends the messages of the latest exchange to today's history journal."""
+    serializable_messages = [
+        {"role": msg.role, "parts": [part.text for part in msg.parts]} for msg in new_messages
     ]
-    with open(history_path, 'w') as f:
-        json.dump(serializable_history, f, indent=2)
+    get_chat_journal().append(serializable_messages)
 
 
 # Function that runs for the first time and llm a call with the current date and time, ask it to read all the files and respond with a message that seems appropriate. based on user history.
 def say_hello():
-    user_input = f"Hello Janus, today is {datetime.now().strftime('%A, %B %d, %Y')}. This is a system generated request to read the files and based on all the data of user reponse with a message that seems appropriate. Also if this step is already done in the chat history then just greet the user with a message that seems appropriate."
+    # The digest already holds the files the model used to read one tool call at a time
+    digest = get_context_digest()
+    user_input = (
+        f"Hello Janus, today is {datetime.now().strftime('%A, %B %d, %Y')}. This is a system generated request. "
+        "A digest of the user's profile, tasks, today's plan, behavior, your notes, today's project logs and the weekly schedule is below, "
+        "so don't call the read tools now; based on this data respond directly with a message that seems appropriate. "
+        "Also if this step is already done in the chat history then just greet the user with a message that seems appropriate."
+        f"\n<context_digest>\n{digest}\n</context_digest>"
+    )
     return user_input
 
+# --- TOOL EXECUTION ---
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="janus-tool")
+
+def execute_tool_call(tool_name, parameters):
+    """Runs one tool from TOOL_MAPPING. Errors are returned as results so one failing call doesn't sink a batch."""
+    if tool_name not in TOOL_MAPPING:
+        return {"status": "error", "message": f"Unknown tool: {tool_name}"}
+    try:
+        return TOOL_MAPPING[tool_name](**(parameters or {}))
+    except Exception as e:
+        return {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+async def execute_tool_batch(tool_calls):
+    """Runs a batch of independent tool calls concurrently on TOOL_EXECUTOR. Results keep the call order."""
+    loop = asyncio.get_running_loop()
+    futures = [
+        loop.run_in_executor(TOOL_EXECUTOR, execute_tool_call, call.get("tool_name"), call.get("parameters", {}))
+        for call in tool_calls
+    ]
+    results = await asyncio.gather(*futures)
+    return [
+        {"tool_name": call.get("tool_name"), "result": result}
+        for call, result in zip(tool_calls, results)
+    ]
+
+# --- STREAMING ---
+SYSTEM_ADDED_INSTRUCTION = "<system added instrution > Remember to respond with a single, valid JSON object as per the instructions. Do one thing at a time either use tools (batch independent ones) or do conversation. <system added instrution>"
+
+def _render_comment(comment, final=False):
+    """Renders Janus' comment. Partial comments are shown as plain text since their markup may be unbalanced."""
+    if final:
+        try:
+            return Text.from_markup(f"[bold white on black][bold green]Janus[/bold green]: {comment}[/bold white on black]")
+        except MarkupError:
+            pass
+    return Text.assemble(("Janus", "bold green"), ": ", comment, style="bold white on black")
+
+async def _reply_chunks(chat, message):
+    """
+    Yields the reply's text as it streams. Goes through the LLM gateway at
+    interactive priority when it is running, else calls Gemini directly.
+    Either way the exchange ends up in chat.history.
+    """
+    contents = history_to_contents(chat.history) + [{"role": "user", "parts": [message]}]
+    try:
+        gateway_chunks = await gateway_stream_async(
+            build_request(COMMANDER_MODEL, contents, SYSTEM_PROMPT, GENERATION_CONFIG), PRIORITY_INTERACTIVE
+        )
+    except GatewayUnavailable:
+        gateway_chunks = None
+
+    if gateway_chunks is not None:
+        parts = []
+        async for text in gateway_chunks:
+            parts.append(text)
+            yield text
+        # Appending keeps the existing Content objects, so the context manager's estimates stay cached
+        chat.history = list(chat.history) + [
+            {"role": "user", "parts": [message]},
+            {"role": "model", "parts": ["".join(parts)]},
+        ]
+        return
+
+    lease_id, api_key = await asyncio.to_thread(KEY_POOL.acquire)
+    throttled = False
+    try:
+        bind_model(chat.model, api_key)
+        response = await chat.send_message_async(message, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # chunk without text parts
+            yield text
+    except Exception as e:
+        throttled = is_rate_limit_error(e)
+        raise
+    finally:
+        # Streaming reads happen lazily, so the key stays leased until the stream is consumed
+        await asyncio.to_thread(KEY_POOL.release, lease_id, api_key, throttled)
+
+async def stream_message(chat, console, message):
+    """
+    Sends a message and streams the reply. The "comment" is rendered live as
+    it arrives and speech starts as soon as the "speak" field is complete.
+    Returns (full response text, streamed) where streamed tells which
+    fields were already handled.
+    """
+    extractor = StreamingFieldExtractor(("comment", "speak"))
+    chunks = []
+    live = None
+    spoken = False
+
+    # Keep the history and the outgoing message inside the token budget before every send
+    context_manager.apply(chat, message)
+
+    try:
+        async for text in _reply_chunks(chat, message):
+            chunks.append(text)
+            changed = extractor.feed(text)
+
+            if "comment" in changed:
+                if live is None:
+                    live = Live(console=console, refresh_per_second=15)
+                    live.start()
+                live.update(_render_comment(extractor.value("comment")))
+            if not spoken and extractor.is_complete("speak"):
+                spoken = True
+                speak_text = extractor.value("speak")
+                if speak_text:
+                    speak(speak_text)
+    finally:
+        if live is not None:
+            live.update(_render_comment(extractor.value("comment"), final=extractor.is_complete("comment")))
+            live.stop()
+
+    # The exchange is complete once the stream is consumed; persist it right away
+    save_chat_history(chat.history[-2:])
+
+    streamed = {"comment": live is not None, "speak": spoken}
+    return "".join(chunks), streamed
+
+def answer_locally(chat, console, user_input, tool_name, parameters):
+    """Answers a routed request with its tool, keeping the exchange in the history like any other turn."""
+    console.print(f"Answering locally with {tool_name}...", style="italic dim")
+    reply = answer_intent(tool_name, TOOL_MAPPING[tool_name](**parameters))
+    console.print(_render_comment(reply["comment"], final=True))
+    if reply["speak"]:
+        speak(reply["speak"])
+    chat.history = list(chat.history) + [
+        {"role": "user", "parts": [user_input]},
+        {"role": "model", "parts": [json.dumps(reply)]},
+    ]
+    save_chat_history(chat.history[-2:])
+
 # --- MAIN LOGIC ---
-def main():
+async def main_async():
     """The main CLI loop for the Commander."""
     console = Console()
+    get_worker_pool()  # warms the run_code workers in the background
     
     model = genai.GenerativeModel(
-        'gemini-2.5-flash',
+        COMMANDER_MODEL,
         system_instruction=SYSTEM_PROMPT,
-        generation_config={"response_mime_type": "application/json"}
+        generation_config=GENERATION_CONFIG
     )
     history = load_chat_history()
     chat = model.start_chat(history=history)
@@ -369,45 +620,63 @@ def main():
             user_input = say_hello()
             first_interaction = False
         else:
-            user_input = Prompt.ask("\n[bold cyan]You[/bold cyan]")
+            # Prompt.ask blocks, so it runs off the event loop
+            user_input = await asyncio.to_thread(Prompt.ask, "\n[bold cyan]You[/bold cyan]")
         if user_input.lower() in ['exit', 'quit']:
+            console.print(f"File cache: {FILE_CACHE.stats()}", style="dim")
             break
+        # Whatever is still being said about the previous command is stale now
+        cancel_speech()
 
         # add timestamp to user input
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         user_input = f"[{timestamp}] {user_input}"
 
-        response = chat.send_message(user_input + "<system added instrution > Remember to respond with a single, valid JSON object as per the instructions. Do one thing at a time either use tool or do conversation. <system added instrution>")
-        cleaned_response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
-        
+        # Plain reads ("what time is it", "show my tasks") don't need a Gemini round trip
+        routed = route_intent(user_input)
+        if routed:
+            try:
+                await asyncio.to_thread(answer_locally, chat, console, user_input, *routed)
+                continue
+            except Exception as e:
+                print(f"Local answer failed, asking Gemini instead: {e}")
+
+        try:
+            response_text, streamed = await stream_message(chat, console, user_input + SYSTEM_ADDED_INSTRUCTION)
+        except Exception as e:
+            console.print("[bold red]Error sending message to chat:[/bold red]")
+            print(e)
+            continue
+
         # Calling the response processing function
-        process_llm_response(chat, console, cleaned_response_text)    
-        # Save chat history after each interaction
-        save_chat_history(chat.history)
+        await process_llm_response(chat, console, clean_model_json(response_text), streamed)
+
+    # Fold the journal into the history snapshot before exiting
+    get_chat_journal().close()
 
-def process_llm_response(chat, console, cleaned_response_text):
+def main():
+    asyncio.run(main_async())
+
+async def process_llm_response(chat, console, cleaned_response_text, streamed=None):
+    streamed = streamed or {}
     try:
         # We now expect every valid response to be a JSON object.
         response_json = json.loads(cleaned_response_text)
         response_type = response_json.get("response_type")
 
         if response_type == "conversation":
+            comment = response_json.get("comment", "I'm not sure what to say.")
             try:
-                comment = response_json.get("comment", "I'm not sure what to say.")
-                console.print(f"[bold white on black][bold green]Janus[/bold green]: {comment}[/bold white on black]")
-                current_key_for_llm = next(key_rotator) # Rotate to the next API key
+                if not streamed.get("comment"):
+                    console.print(_render_comment(comment, final=True))
                 speak_text = response_json.get("speak", None)
-                if speak_text:
-                    speak(speak_text, key_rotator=key_rotator)
+                if speak_text and not streamed.get("speak"):
+                    speak(speak_text)
                 return
             except Exception as e:
                 console.print(f"[bold red]Error processing conversation response:[/bold red]")
                 print(e)
                 print("Response JSON:", comment)
-                current_key_for_llm = next(key_rotator) # Rotate to the next API key
-                speak_text = response_json.get("speak", None)
-                if speak_text:
-                    speak(speak_text, key_rotator=key_rotator)
                 return
         elif response_type == "tool_use":
             try:
@@ -418,22 +687,19 @@ def process_llm_response(chat, console, cleaned_response_text):
                 if tool_name in TOOL_MAPPING:
                     console.print(f"Executing tool: {tool_name}...", style="italic dim")
                     tool_function = TOOL_MAPPING[tool_name]
-                    tool_result = tool_function(**parameters)
+                    # Tools do blocking file, database and subprocess work; keep them off the event loop
+                    tool_result = await asyncio.to_thread(tool_function, **parameters)
                     
                     try:
-                        final_response = chat.send_message(f"Tool Result: {json.dumps(tool_result)}" + " Please respond with a JSON object as per the instructions.")
+                        final_response_text, final_streamed = await stream_message(
+                            chat, console, f"Tool Result: {json.dumps(tool_result)}" + " Please respond with a JSON object as per the instructions."
+                        )
                     except Exception as e:  
                         console.print(f"[bold red]Error sending tool result to chat:[/bold red]")
                         print(e)
                         return
                     # The response to a tool result should also be a JSON object
-                    try:
-                        cleaned_response = final_response.text.strip().replace('```json', '').replace('```', '').strip()
-                        process_llm_response(chat, console, cleaned_response)
-                    except json.JSONDecodeError:
-                        console.print("[bold red]Error: The AI's response after tool execution was not valid JSON.[/bold red]")
-                        console.print(f"\n[bold]Problematic Text Received:[/bold]\n{final_response.text}")
-                        return
+                    await process_llm_response(chat, console, clean_model_json(final_response_text), final_streamed)
                 else:
                     console.print(f"[bold red]Janus: Error - I tried to use an unknown tool: {tool_name}[/bold red]")
                     return
@@ -441,6 +707,30 @@ def process_llm_response(chat, console, cleaned_response_text):
                 console.print(f"[bold red]Error executing tool:[/bold red]")
                 print(e)
                 return
+        elif response_type == "tool_batch":
+            try:
+                tool_calls = [call for call in response_json.get("tool_calls", []) if isinstance(call, dict)]
+                if not tool_calls:
+                    console.print("[bold red]Janus: Error - Received an empty tool batch.[/bold red]")
+                    return
+                print("Tool batch requested...", response_json)
+                names = ", ".join(str(call.get("tool_name")) for call in tool_calls)
+                console.print(f"Executing {len(tool_calls)} tools: {names}...", style="italic dim")
+                batch_results = await execute_tool_batch(tool_calls)
+
+                try:
+                    final_response_text, final_streamed = await stream_message(
+                        chat, console, f"Tool Results: {json.dumps(batch_results)}" + " Please respond with a JSON object as per the instructions."
+                    )
+                except Exception as e:
+                    console.print("[bold red]Error sending tool results to chat:[/bold red]")
+                    print(e)
+                    return
+                await process_llm_response(chat, console, clean_model_json(final_response_text), final_streamed)
+            except Exception as e:
+                console.print("[bold red]Error executing tool batch:[/bold red]")
+                print(e)
+                return
         else:
             console.print(f"[bold red]Janus: Error - Received an unknown response type: {response_type}[/bold red]")
             return
@@ -451,4 +741,4 @@ def process_llm_response(chat, console, cleaned_response_text):
         return
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
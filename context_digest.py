@@ -0,0 +1,139 @@
+import glob
+import json
+import os
+from datetime import datetime
+
+# Builds a bounded digest of everything Janus reads at startup (profile, tasks,
+# today's plan, behaviour notes, its own notes, today's project log entries and
+# the weekly schedule), so the first greeting needs one LLM call instead of a
+# chain of read_* tool calls. The digest is cached on disk and only rebuilt
+# when one of its source files changes.
+
+# --- CONFIGURATION ---
+DATA_DIR = 'user_data'
+PROJECT_LOG_PATTERN = '*_log.json'
+SCHEDULE_PATTERN = '*_weekly_schedule.json'
+DIGEST_CACHE_FILE = os.path.join(DATA_DIR, 'context_digest.json')
+MAX_DIGEST_CHARS = 12000
+
+# (section title, path, character budget)
+DIGEST_SOURCES = [
+    ("User profile", os.path.join(DATA_DIR, 'user_profile.json'), 2500),
+    ("Tasks", os.path.join(DATA_DIR, 'tasks.json'), 2500),
+    ("Today's plan", os.path.join(DATA_DIR, 'todays_plan.json'), 2000),
+    ("User behavior", os.path.join(DATA_DIR, 'user_behavior.json'), 1500),
+    ("Your notes", os.path.join(DATA_DIR, 'additional_llm_info.json'), 1000),
+]
+PROJECT_LOGS_BUDGET = 1500
+SCHEDULE_BUDGET = 1500
+
+
+# --- HELPER FUNCTIONS ---
+
+def _stamp(path):
+    try:
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+    except OSError:
+        return None
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+def _compact(data, budget):
+    """Minified JSON cut to budget characters."""
+    text = json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+    if len(text) <= budget:
+        return text
+    return text[:budget - 14] + "...(truncated)"
+
+def _project_log_files(root):
+    return sorted(glob.glob(os.path.join(root, PROJECT_LOG_PATTERN)))
+
+def _schedule_files(root):
+    return sorted(glob.glob(os.path.join(root, SCHEDULE_PATTERN)))
+
+def _source_paths(root):
+    """Every file the digest reads, relative to root."""
+    found = [os.path.relpath(path, root) for path in _project_log_files(root) + _schedule_files(root)]
+    return [path for _, path, _ in DIGEST_SOURCES] + found
+
+def _project_logs_section(root, today_str, budget):
+    """Today's entries from every project log, plus when each other project was last touched."""
+    todays_entries, last_seen = [], []
+    for path in _project_log_files(root):
+        data = _read_json(path)
+        if data is None:
+            continue
+        name = data.get("name") if isinstance(data, dict) else None
+        name = name or os.path.basename(path)[:-len('_log.json')].replace('_', ' ')
+        entries = data.get("log", []) if isinstance(data, dict) else data
+        entries = [e for e in entries if isinstance(e, dict)] if isinstance(entries, list) else []
+        today = [{k: v for k, v in e.items() if k != "date"} for e in entries if e.get("date") == today_str]
+        if today:
+            todays_entries.append({"project": name, "entries": today})
+        else:
+            dates = sorted(str(e.get("date")) for e in entries if e.get("date"))
+            last_seen.append(f"{name} (last: {dates[-1] if dates else 'never'})")
+
+    lines = []
+    if todays_entries:
+        lines.append("Today: " + _compact(todays_entries, budget))
+    if last_seen:
+        lines.append("No entries today: " + "; ".join(last_seen))
+    return _compact_text("\n".join(lines), budget)
+
+def _compact_text(text, budget):
+    return text if len(text) <= budget else text[:budget - 14] + "...(truncated)"
+
+
+# --- DIGEST ---
+
+def build_context_digest(root='.', today=None):
+    """Builds the digest text from the source files."""
+    today_str = (today or datetime.now()).strftime('%Y-%m-%d')
+    sections = []
+    for title, path, budget in DIGEST_SOURCES:
+        data = _read_json(os.path.join(root, path))
+        if data:
+            sections.append(f"## {title}\n{_compact(data, budget)}")
+
+    project_logs = _project_logs_section(root, today_str, PROJECT_LOGS_BUDGET)
+    if project_logs:
+        sections.append(f"## Project logs ({today_str})\n{project_logs}")
+
+    for path in _schedule_files(root):
+        data = _read_json(path)
+        if data:
+            sections.append(f"## Weekly schedule ({os.path.basename(path)})\n{_compact(data, SCHEDULE_BUDGET)}")
+
+    return _compact_text("\n\n".join(sections), MAX_DIGEST_CHARS)
+
+def get_context_digest(root='.', cache_path=DIGEST_CACHE_FILE):
+    """
+    Returns the digest, rebuilding it only when a source file was added,
+    removed or modified (by mtime and size) or the date changed.
+    """
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    stamps = {path: _stamp(os.path.join(root, path)) for path in _source_paths(root)}
+    cache_file = os.path.join(root, cache_path)
+
+    cached = _read_json(cache_file)
+    if isinstance(cached, dict) and cached.get("date") == today_str and cached.get("sources") == stamps:
+        return cached["digest"]
+
+    digest = build_context_digest(root)
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    temp_path = cache_file + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({"date": today_str, "sources": stamps, "digest": digest}, f)
+    os.replace(temp_path, cache_file)
+    return digest
+
+
+if __name__ == "__main__":
+    print(get_context_digest())
@@ -0,0 +1,158 @@
+import json
+
+# Keeps the commander's chat history inside a token budget before every send.
+#
+# Per-message token estimates are cached, so each fit only estimates the
+# messages added since the last one. When the history is over budget, old tool
+# results are elided first (they are the bulk of the history and are rarely
+# needed verbatim). If that is not enough, the oldest exchanges are folded
+# into a running summary block at the start of the history. The most recent
+# exchanges are always kept verbatim.
+
+# --- CONFIGURATION ---
+DEFAULT_TOKEN_BUDGET = 60000
+CHARS_PER_TOKEN = 4
+KEEP_RECENT_MESSAGES = 8        # never elided or summarized
+SUMMARY_SHARE = 0.15            # max share of the budget the running summary may use
+TOOL_RESULT_PREFIXES = ("Tool Result:", "Tool Results:")
+SUMMARY_MARKER = "[Summary of earlier conversation]"
+SUMMARY_ACK = json.dumps({"response_type": "conversation", "comment": "Noted the summary of our earlier conversation.", "speak": ""})
+
+
+def _role(message):
+    return message["role"] if isinstance(message, dict) else message.role
+
+def _texts(message):
+    parts = message["parts"] if isinstance(message, dict) else message.parts
+    return [part if isinstance(part, str) else getattr(part, "text", "") for part in parts]
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def _shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+def _describe_reply(text):
+    """One-line description of a model reply for the running summary."""
+    try:
+        reply = json.loads(text.strip().replace('```json', '').replace('```', '').strip())
+    except json.JSONDecodeError:
+        return _shorten(text, 160)
+    if not isinstance(reply, dict):
+        return _shorten(text, 160)
+    if reply.get("response_type") == "tool_use":
+        return f"used tool {reply.get('tool_name')}"
+    if reply.get("response_type") == "tool_batch":
+        names = ", ".join(str(call.get("tool_name")) for call in reply.get("tool_calls", []) if isinstance(call, dict))
+        return f"used tools {names}"
+    return _shorten(str(reply.get("comment", "")), 160)
+
+
+class ContextManager:
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, keep_recent=KEEP_RECENT_MESSAGES):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_lines = []
+        self._tracked = []  # [(message, tokens)] mirroring the last fitted history
+        self.total_tokens = 0
+
+    # --- TOKEN TRACKING ---
+
+    def _estimate(self, message):
+        return sum(estimate_tokens(text) for text in _texts(message)) + 4  # + role/part overhead
+
+    def track(self, history):
+        """Updates the cached estimates for history, estimating only messages not seen before."""
+        prefix = 0
+        for (tracked_message, _), message in zip(self._tracked, history):
+            if tracked_message is not message:
+                break
+            prefix += 1
+        self._tracked = self._tracked[:prefix] + [(m, self._estimate(m)) for m in history[prefix:]]
+        self.total_tokens = sum(tokens for _, tokens in self._tracked)
+        return self.total_tokens
+
+    # --- FITTING ---
+
+    def fit(self, history, reserve=0):
+        """
+        Returns (history, changed). The returned history fits the budget less
+        reserve tokens (kept free for the message about to be sent); changed
+        is False when history already fit and is returned as is.
+        """
+        budget = max(0, self.token_budget - reserve)
+        if self.track(history) <= budget:
+            return history, False
+
+        messages = list(history)
+        tokens = [t for _, t in self._tracked]
+        start = 2 if self._has_summary_block(messages) else 0
+        protected_from = max(start, len(messages) - self.keep_recent)
+
+        # 1. Elide old tool results
+        for i in range(start, protected_from):
+            if self.total_tokens <= budget:
+                break
+            if _role(messages[i]) != "user":
+                continue
+            text = "\n".join(_texts(messages[i]))
+            if not text.startswith(TOOL_RESULT_PREFIXES) or text.startswith("[Tool result elided"):
+                continue
+            placeholder = f"[Tool result elided to save context (~{tokens[i]} tokens): {_shorten(text, 200)}]"
+            messages[i] = {"role": "user", "parts": [placeholder]}
+            new_tokens = self._estimate(messages[i])
+            self.total_tokens -= tokens[i] - new_tokens
+            tokens[i] = new_tokens
+
+        # 2. Fold the oldest exchanges into the running summary
+        fold_end = start
+        while fold_end < protected_from and (
+            self.total_tokens > budget or _role(messages[fold_end]) != "user"
+        ):
+            # Fold whole user/model exchanges so the kept history still starts with a user turn
+            text = "\n".join(_texts(messages[fold_end]))
+            if _role(messages[fold_end]) == "user":
+                is_tool_result = text.startswith(TOOL_RESULT_PREFIXES + ("[Tool result elided",))
+                line = "- (tool result)" if is_tool_result else f"- User: {_shorten(text, 120)}"
+                if fold_end + 1 < protected_from and _role(messages[fold_end + 1]) == "model":
+                    line += f" | Janus: {_describe_reply(chr(10).join(_texts(messages[fold_end + 1])))}"
+                    self.total_tokens -= tokens[fold_end + 1]
+                    fold_end += 1
+            else:
+                line = f"- Janus: {_describe_reply(text)}"
+            self.summary_lines.append(line)
+            self.total_tokens -= tokens[fold_end]
+            fold_end += 1
+
+        if fold_end > start:
+            self._trim_summary()
+            summary_block = [
+                {"role": "user", "parts": [SUMMARY_MARKER + "\n" + "\n".join(self.summary_lines)]},
+                {"role": "model", "parts": [SUMMARY_ACK]},
+            ]
+            messages = summary_block + messages[fold_end:]
+
+        self.track(messages)
+        return messages, True
+
+    def _has_summary_block(self, messages):
+        return bool(messages) and "\n".join(_texts(messages[0])).startswith(SUMMARY_MARKER)
+
+    def _trim_summary(self):
+        """Keeps the running summary within its share of the budget by dropping its oldest lines."""
+        limit = int(self.token_budget * SUMMARY_SHARE)
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > limit:
+            self.summary_lines.pop(0)
+
+    def apply(self, chat, message=None):
+        """
+        Fits chat.history into the budget in place, leaving room for message,
+        the text about to be sent with it. Returns the estimated history tokens.
+        """
+        reserve = self._estimate({"role": "user", "parts": [message]}) if message else 0
+        history, changed = self.fit(chat.history, reserve)
+        if changed:
+            chat.history = history
+            print(f"Context trimmed to ~{self.total_tokens} tokens (budget {self.token_budget}, {reserve} reserved for the new message).")
+        return self.total_tokens
@@ -0,0 +1,300 @@
+import base64
+import csv
+import io
+import json
+import mmap
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+# Paged reads for the commander's read_any_file tool, so large logs and
+# datasets can be inspected a page at a time instead of being loaded whole
+# into memory and the prompt.
+#
+# Every page ends with a continuation token that records where the next page
+# starts (in bytes as well as lines/rows). Continuing from it is O(page size)
+# however deep into the file it is. Jumping straight to line N uses a sparse,
+# mmap-built line index that is cached per file and rebuilt only when the
+# file changes.
+
+# --- CONFIGURATION ---
+DEFAULT_LIMITS = {"lines": 200, "bytes": 16 * 1024, "rows": 100}
+MAX_PAGE_CHARS = 32000          # a page stops early rather than exceed this
+CHECKPOINT_EVERY = 256          # lines between line index checkpoints
+LINE_INDEX_CACHE_SIZE = 16
+SCHEMA_SAMPLE_ROWS = 50
+
+
+class PageTokenError(ValueError):
+    """Raised for a continuation token that can't be decoded."""
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# --- CONTINUATION TOKENS ---
+
+def encode_token(path, unit, offset, byte_pos, stamp, limit):
+    state = {"p": os.path.abspath(path), "u": unit, "o": offset, "b": byte_pos, "m": stamp[0], "s": stamp[1], "l": limit}
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode()
+
+def decode_token(token):
+    """(path, unit, offset, byte_pos, stamp, limit) of a continuation token."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return state["p"], state["u"], state["o"], state["b"], (state["m"], state["s"]), state.get("l")
+    except (ValueError, KeyError, TypeError) as e:
+        raise PageTokenError(f"Invalid page token: {e}") from e
+
+def _check_token_path(path, extensions, roots):
+    """
+    Tokens are plain base64 that the model hands back, so the file they name
+    is checked again against the caller's extension whitelist and roots.
+    """
+    if not isinstance(path, str):
+        raise PageTokenError("Invalid page token: bad path")
+    if extensions is not None and not path.endswith(tuple(extensions)):
+        raise PageTokenError(f"Invalid page token: unsupported file type {os.path.basename(path)}")
+    if roots is not None:
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, os.path.realpath(root)]) == os.path.realpath(root) for root in roots):
+            raise PageTokenError(f"Invalid page token: {os.path.basename(path)} is outside the readable folders")
+
+
+# --- LINE INDEX ---
+
+class LineIndex:
+    """Byte offset of every CHECKPOINT_EVERY-th line start, built with one pass over an mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stamp = _stamp(path)
+        self.checkpoints = array('Q', [0])
+        self.total_lines = 0
+        size = self.stamp[1]
+        if size == 0:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position, line = 0, 0
+            while True:
+                newline = mm.find(b"\n", position)
+                if newline == -1:
+                    line += 1  # last line without a trailing newline
+                    break
+                line += 1
+                position = newline + 1
+                if position >= size:
+                    break
+                if line % CHECKPOINT_EVERY == 0:
+                    self.checkpoints.append(position)
+        self.total_lines = line
+
+    def offset_of(self, line):
+        """Byte offset where line (0-based) starts; the file size when line is past the end."""
+        if line >= self.total_lines:
+            return self.stamp[1]
+        checkpoint = line // CHECKPOINT_EVERY
+        position = self.checkpoints[checkpoint]
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for _ in range(line - checkpoint * CHECKPOINT_EVERY):
+                position = mm.find(b"\n", position) + 1
+        return position
+
+
+_line_indexes = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+def get_line_index(path):
+    """Cached LineIndex for path, rebuilt when the file's mtime or size changed."""
+    path = os.path.abspath(path)
+    stamp = _stamp(path)
+    with _line_indexes_lock:
+        index = _line_indexes.get(path)
+        if index is not None and index.stamp == stamp:
+            _line_indexes.move_to_end(path)
+            return index
+    index = LineIndex(path)
+    with _line_indexes_lock:
+        _line_indexes[path] = index
+        while len(_line_indexes) > LINE_INDEX_CACHE_SIZE:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+# --- TEXT PAGES ---
+
+def _utf8_boundary(data):
+    """Length of data without a trailing, incomplete UTF-8 sequence."""
+    end = len(data)
+    for back in range(1, min(4, end) + 1):
+        byte = data[end - back]
+        if byte < 0x80:
+            return end
+        if byte >= 0xC0:  # lead byte of the last sequence
+            expected = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return end if back >= expected else end - back
+    return end
+
+def read_line_page(path, offset, limit, byte_pos=None):
+    """Lines [offset, offset + limit). Returns (lines, next line, next byte offset, total lines)."""
+    index = get_line_index(path)
+    if byte_pos is None:
+        byte_pos = index.offset_of(offset)
+    lines, chars = [], 0
+    with open(path, 'rb') as f:
+        f.seek(byte_pos)
+        while len(lines) < limit:
+            raw = f.readline()
+            if not raw:
+                break
+            line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+            if lines and chars + len(line) > MAX_PAGE_CHARS:
+                break
+            lines.append(line[:MAX_PAGE_CHARS])
+            chars += len(line)
+            byte_pos += len(raw)
+    return lines, offset + len(lines), byte_pos, index.total_lines
+
+def read_byte_page(path, offset, limit):
+    """Up to limit bytes from offset, cut at a UTF-8 boundary. Returns (text, next byte offset)."""
+    limit = min(limit, MAX_PAGE_CHARS)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(limit)
+    end = _utf8_boundary(data) if len(data) == limit else len(data)
+    return data[:end].decode('utf-8', errors='replace'), offset + (end or len(data))
+
+
+# --- CSV PAGES ---
+
+def _csv_records(f):
+    """Yields (raw bytes, parsed row) per CSV record, keeping quoted newlines inside their record."""
+    pending = b""
+    while True:
+        raw = f.readline()
+        if not raw:
+            if pending:
+                yield pending, next(csv.reader(io.StringIO(pending.decode('utf-8', errors='replace'))), [])
+            return
+        pending += raw
+        if pending.count(b'"') % 2:
+            continue  # inside a quoted field that spans lines
+        yield pending, next(csv.reader(io.StringIO(pending.decode('utf-8', errors='replace'))), [])
+        pending = b""
+
+def _infer_type(values):
+    values = [v for v in values if v != ""]
+    if not values:
+        return "empty"
+    for name, parse in (("int", int), ("float", float)):
+        try:
+            for value in values:
+                parse(value)
+            return name
+        except ValueError:
+            continue
+    return "str"
+
+def _convert(value, column_type):
+    if value == "":
+        return None
+    try:
+        if column_type == "int":
+            return int(value)
+        if column_type == "float":
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+def csv_schema(path):
+    """Header, inferred column types and example values from the first rows."""
+    with open(path, 'rb') as f:
+        records = _csv_records(f)
+        header_raw, header = next(records, (b"", []))
+        sample = [row for _, (_, row) in zip(range(SCHEMA_SAMPLE_ROWS), records)]
+    columns = []
+    for i, name in enumerate(header):
+        values = [row[i] if i < len(row) else "" for row in sample]
+        example = next((v for v in values if v != ""), None)
+        columns.append({"name": name, "type": _infer_type(values), "example": example})
+    return columns, len(header_raw)
+
+def read_csv_page(path, offset, limit, byte_pos=None):
+    """Data rows [offset, offset + limit). Returns (schema, rows, next row, next byte offset)."""
+    schema, header_end = csv_schema(path)
+    types = [column["type"] for column in schema]
+    rows, chars, row_number = [], 0, 0
+    with open(path, 'rb') as f:
+        f.seek(byte_pos if byte_pos is not None else header_end)
+        position = f.tell()
+        row_number = offset if byte_pos is not None else 0
+        for raw, row in _csv_records(f):
+            if row_number < offset:
+                row_number += 1
+                position += len(raw)
+                continue
+            if len(rows) >= limit or (rows and chars + len(raw) > MAX_PAGE_CHARS):
+                break
+            rows.append([_convert(value, types[i] if i < len(types) else "str") for i, value in enumerate(row)])
+            chars += len(raw)
+            row_number += 1
+            position += len(raw)
+    return schema, rows, row_number, position
+
+
+# --- PAGES ---
+
+def default_unit(path):
+    return "rows" if path.endswith('.csv') else "lines"
+
+def read_page(path=None, offset=0, limit=None, unit=None, page_token=None, extensions=None, roots=None):
+    """
+    One page of a file as a tool result. unit is "lines", "bytes" or "rows"
+    (CSV only). A page_token from an earlier page continues where it stopped,
+    with the same page size unless limit is given; its file must end with one
+    of extensions and lie under one of roots, when those are given.
+    """
+    byte_pos, note = None, None
+    if page_token:
+        path, unit, offset, byte_pos, stamp, token_limit = decode_token(page_token)
+        _check_token_path(path, extensions, roots)
+        limit = limit or token_limit
+        if not os.path.exists(path):
+            return {"status": "error", "message": f"File {os.path.basename(path)} does not exist."}
+        if _stamp(path) != stamp:
+            byte_pos = None  # the file changed; find the position again by line/row number
+            note = "The file changed since the previous page; continued by position."
+    unit = unit or default_unit(path)
+    if unit not in DEFAULT_LIMITS or (unit == "rows" and not path.endswith('.csv')):
+        return {"status": "error", "message": f"Unsupported unit '{unit}' for {os.path.basename(path)}."}
+    offset = max(0, int(offset or 0))
+    limit = max(1, int(limit or DEFAULT_LIMITS[unit]))
+    stamp = _stamp(path)
+    size = stamp[1]
+
+    page = {"status": "success", "file": os.path.basename(path), "unit": unit, "offset": offset, "file_bytes": size}
+    if unit == "bytes":
+        page["content"], next_offset = read_byte_page(path, offset, limit)
+        next_byte = next_offset
+    elif unit == "lines":
+        lines, next_offset, next_byte, total = read_line_page(path, offset, limit, byte_pos)
+        page["content"] = "\n".join(lines)
+        page["returned"] = len(lines)
+        page["total_lines"] = total
+    else:
+        schema, rows, next_offset, next_byte = read_csv_page(path, offset, limit, byte_pos)
+        page["columns"] = [column["name"] for column in schema]
+        if offset == 0 or page_token is None:
+            page["schema"] = schema
+        page["rows"] = rows
+        page["returned"] = len(rows)
+
+    page["bytes_read_to"] = next_byte
+    page["next_page_token"] = encode_token(path, unit, next_offset, next_byte, stamp, limit) if next_byte < size else None
+    if note:
+        page["note"] = note
+    return page
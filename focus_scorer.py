@@ -0,0 +1,237 @@
+import json
+import os
+from datetime import datetime
+
+# Local scoring engine for the strategist. Scores a window of activity_log
+# records and decides the obvious cases (clearly focused, clearly distracted,
+# clearly idle) without a Gemini round-trip. Only ambiguous windows are
+# handed to the LLM.
+
+# --- CONFIGURATION ---
+SCORING_CONFIG_FILE = os.path.join('user_data', 'focus_scoring.json')
+DEFAULT_SAMPLE_SECONDS = 150  # matches CAPTURE_INTERVAL_SECONDS in the activity monitor
+
+DEFAULT_CONFIG = {
+    # Keywords are matched (case-insensitive) against application, activity and topics.
+    "categories": {
+        "Productive": [
+            "vs code", "vscode", "visual studio code", "visual studio", "terminal", "pycharm", "jupyter", "kaggle",
+            "python", "github", "stack overflow", "documentation", "docs", "notebook",
+            "programming", "debugging", "research", "study", "lecture", "course", "writing",
+            "script", "editing video", "davinci", "premiere", "obsidian", "notion",
+        ],
+        "Distracting": [
+            "youtube", "instagram", "facebook", "twitter", "x.com", "reddit", "netflix",
+            "prime video", "hotstar", "tiktok", "manhwa", "manga", "webtoon", "playing game", "gaming",
+            "steam", "memes", "social media", "scrolling", "entertainment",
+        ],
+        "Neutral": [
+            "file manager", "settings", "system settings", "idle", "lock screen", "email", "gmail",
+            "whatsapp", "calendar", "music", "spotify",
+        ],
+    },
+    "weights": {"Productive": 1.0, "Neutral": 0.0, "Distracting": -1.0},
+    "thresholds": {
+        "min_records": 3,               # fewer samples than this -> not enough data
+        "praise_score": 0.6,            # mean weight at/above which the user is praised
+        "nudge_score": -0.4,            # mean weight at/below which the user is nudged
+        "neutral_band": 0.2,            # |score| below this with no distracting streak -> neutral
+        "distraction_streak_minutes": 10,
+        "max_switches_per_hour_for_praise": 30,
+    },
+    # When true, decided 0/1 windows still ask the LLM to word the comment.
+    "llm_comments": False,
+}
+
+
+# --- HELPER FUNCTIONS ---
+
+def load_scoring_config(config_path=SCORING_CONFIG_FILE):
+    """Returns the scoring config, with any user overrides merged over the defaults."""
+    config = json.loads(json.dumps(DEFAULT_CONFIG))  # deep copy
+    if not os.path.exists(config_path):
+        return config
+    try:
+        with open(config_path, 'r') as f:
+            overrides = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read scoring config {config_path}: {e}. Using defaults.")
+        return config
+
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key].update(value)
+        else:
+            config[key] = value
+    return config
+
+def _record_text(record):
+    """Flattens the analysed fields of an activity record into one lowercase string."""
+    topics = record.get("topics") or []
+    if isinstance(topics, str):
+        topics = [topics]
+    fields = [record.get("application") or "", record.get("activity") or ""] + [str(t) for t in topics]
+    return " ".join(fields).lower()
+
+def _is_usable(record):
+    """Monitor errors and empty OCR analyses carry no signal about the user."""
+    if not isinstance(record, dict):
+        return False
+    if record.get("activity") == "Error during analysis":
+        return False
+    return bool(record.get("application") or record.get("activity"))
+
+def categorize_record(record, config):
+    """Returns 'Productive', 'Distracting' or 'Neutral' for a single activity record."""
+    text = _record_text(record)
+    # Distracting keywords win over productive ones: "YouTube" in a Chrome window
+    # is more telling than the fact that it is a browser.
+    for category in ("Distracting", "Productive", "Neutral"):
+        for keyword in config["categories"].get(category, []):
+            if keyword.lower() in text:
+                return category
+    return "Neutral"
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def estimate_sample_seconds(records):
+    """Estimates how much wall-clock time each record represents from its timestamps."""
+    stamps = [t for t in (_parse_timestamp(r.get("timestamp")) for r in records) if t]
+    gaps = sorted(
+        (later - earlier).total_seconds()
+        for earlier, later in zip(stamps, stamps[1:])
+        if later > earlier
+    )
+    if not gaps:
+        return DEFAULT_SAMPLE_SECONDS
+    return gaps[len(gaps) // 2]
+
+def _longest_streak(categories, target):
+    longest = current = 0
+    for category in categories:
+        current = current + 1 if category == target else 0
+        longest = max(longest, current)
+    return longest
+
+
+# --- SCORING ---
+
+def score_activity_window(records, config=None):
+    """
+    Scores a window of activity records.
+
+    Returns a dict with the focus score (mean category weight, -1..1), time per
+    category, the longest productive/distracting streaks, the app-switch rate
+    and the top applications. Records are expected in chronological order.
+    """
+    config = config or load_scoring_config()
+    usable = [r for r in (records or []) if _is_usable(r)]
+    sample_seconds = estimate_sample_seconds(usable)
+    sample_minutes = sample_seconds / 60
+
+    categories = [categorize_record(r, config) for r in usable]
+    weights = config["weights"]
+    focus_score = (
+        sum(weights.get(c, 0.0) for c in categories) / len(categories) if categories else 0.0
+    )
+
+    applications = [(r.get("application") or "Unknown") for r in usable]
+    switches = sum(1 for prev, cur in zip(applications, applications[1:]) if prev != cur)
+    window_hours = (len(usable) * sample_seconds) / 3600
+    switches_per_hour = switches / window_hours if window_hours else 0.0
+
+    minutes_by_category = {c: 0.0 for c in weights}
+    for category in categories:
+        minutes_by_category[category] = minutes_by_category.get(category, 0.0) + sample_minutes
+
+    minutes_by_application = {}
+    for application in applications:
+        minutes_by_application[application] = minutes_by_application.get(application, 0.0) + sample_minutes
+    top_applications = sorted(minutes_by_application.items(), key=lambda item: item[1], reverse=True)[:3]
+
+    distracting_apps = []
+    for record, category in zip(usable, categories):
+        name = record.get("application") or "Unknown"
+        if category == "Distracting" and name not in distracting_apps:
+            distracting_apps.append(name)
+
+    return {
+        "records": len(usable),
+        "focus_score": round(focus_score, 3),
+        "categories": categories,
+        "minutes_by_category": {k: round(v, 1) for k, v in minutes_by_category.items()},
+        "longest_productive_streak_minutes": round(_longest_streak(categories, "Productive") * sample_minutes, 1),
+        "longest_distracting_streak_minutes": round(_longest_streak(categories, "Distracting") * sample_minutes, 1),
+        "app_switches": switches,
+        "switches_per_hour": round(switches_per_hour, 1),
+        "top_applications": [name for name, _ in top_applications],
+        "distracting_applications": distracting_apps,
+    }
+
+def decide_execute_code(score, config=None):
+    """
+    Maps a window score onto the strategist's execute_code.
+
+    Returns (code, reason) for clear cases, or (None, reason) when the window
+    is ambiguous and the LLM should be consulted.
+    """
+    config = config or load_scoring_config()
+    t = config["thresholds"]
+    focus = score["focus_score"]
+    distracting_streak = score["longest_distracting_streak_minutes"]
+
+    if score["records"] < t["min_records"]:
+        return -1, f"only {score['records']} usable records in the window"
+    if focus <= t["nudge_score"] or distracting_streak >= t["distraction_streak_minutes"]:
+        return 0, f"focus score {focus}, distracting streak {distracting_streak} min"
+    if focus >= t["praise_score"] and score["switches_per_hour"] <= t["max_switches_per_hour_for_praise"]:
+        return 1, f"focus score {focus}, productive streak {score['longest_productive_streak_minutes']} min"
+    if abs(focus) < t["neutral_band"] and distracting_streak == 0:
+        return -1, f"balanced window, focus score {focus}"
+    return None, f"ambiguous window, focus score {focus}, {score['switches_per_hour']} switches/hour"
+
+def local_comment(code, score):
+    """Template comment for a locally decided window, in the strategist's response format."""
+    if code == 1:
+        apps = ", ".join(score["top_applications"]) or "your work"
+        return (
+            f"Great focus! {score['longest_productive_streak_minutes']:.0f} minutes of solid work "
+            f"in {apps}. Keep it going!"
+        )
+    if code == 0:
+        apps = ", ".join(score["distracting_applications"]) or "distractions"
+        return (
+            f"You've spent about {score['minutes_by_category'].get('Distracting', 0):.0f} minutes on {apps}. "
+            f"Time to get back to your plan."
+        )
+    return ""
+
+def evaluate_window(records, config=None):
+    """
+    Scores the window and decides it locally when possible.
+
+    Returns a dict with "score", "reason" and "decision". "decision" is a
+    strategist-style response ({"execute_code", "comment"}) for clear windows
+    and None for ambiguous ones.
+    """
+    config = config or load_scoring_config()
+    score = score_activity_window(records, config)
+    code, reason = decide_execute_code(score, config)
+    decision = None
+    if code is not None:
+        decision = {"execute_code": code, "comment": local_comment(code, score)}
+    return {"score": score, "reason": reason, "decision": decision}
+
+
+if __name__ == "__main__":
+    sample = [
+        {"application": "VS Code", "activity": "Editing strategist.py", "topics": ["python"], "timestamp": "2025-10-23T10:00:00"},
+        {"application": "VS Code", "activity": "Debugging", "topics": ["python"], "timestamp": "2025-10-23T10:02:30"},
+        {"application": "Terminal", "activity": "Running tests", "topics": [], "timestamp": "2025-10-23T10:05:00"},
+        {"application": "Google Chrome", "activity": "Reading Python docs", "topics": ["documentation"], "timestamp": "2025-10-23T10:07:30"},
+    ]
+    print(json.dumps(evaluate_window(sample, DEFAULT_CONFIG), indent=2))
@@ -1,128 +1,449 @@
 # File: audio_generator.py
 
-import mimetypes
-import os
+import abc
+import heapq
+import itertools
+import queue
+import shutil
 import struct
-import traceback
+import subprocess
+import time
 import threading  # <-- NEW IMPORT
-import google.generativeai as genai
+from collections import OrderedDict
 
-# NEW IMPORT for playing the audio
-from playsound import playsound
+try:
+    import pyaudio  # preferred output; without it PCM is piped to one of PLAYER_COMMANDS
+except ImportError:
+    pyaudio = None
+
+from key_pool import load_api_keys
+from llm_gateway import PRIORITY_BACKGROUND
+from phrase_cache import get_phrase_cache, is_cacheable, normalize_text
+from tts_engines import SpeechCancelled, get_engines, parse_audio_mime_type, route
+
+# Engines, voice and routing are configured in tts_engines.py
+USE_PYAUDIO = True
+# Raw PCM players used without PyAudio; the first one installed is started once per format and kept running
+PLAYER_COMMANDS = [
+    ["aplay", "-q", "-t", "raw", "-f", "S{bits}_LE", "-r", "{rate}", "-c", "1"],
+    ["paplay", "--raw", "--format=s{bits}le", "--rate={rate}", "--channels=1"],
+    ["ffplay", "-nodisp", "-loglevel", "quiet", "-f", "s{bits}le", "-ar", "{rate}", "-ac", "1", "-i", "-"],
+]
+PREFETCH_UTTERANCES = 1     # utterances synthesized ahead of the one playing
+WARM_QUEUE_SIZE = 16        # short phrases spoken locally, waiting to be fetched in the cloud voice
+WARM_AFTER_REPEATS = 3      # fetch the cloud voice of a phrase once it was spoken locally this often; 0 never does
+WARM_TRACKED_PHRASES = 256  # locally spoken phrases whose repeats are counted
+USE_PHRASE_CACHE = True     # replay short phrases from database/phrase_cache.db instead of re-synthesizing them
+
+# speak() priorities, lowest first
+PRIORITY_URGENT = 0         # jumps ahead of queued replies
+PRIORITY_REPLY = 1          # the commander's replies
+PRIORITY_LOW = 2
 
 
 
 #
 # THIS IS THE NEW FUNCTION YOU WILL CALL FROM YOUR MAIN FILE
 #
-def speak(text_to_speak: str, key_rotator):
+def speak(text_to_speak: str, priority: int = PRIORITY_REPLY, supersede: bool = True) -> bool:
     """
-    Starts the audio generation and playback on a new background thread.
-    This function returns immediately.
+    Queues text for the speech worker and returns immediately. Text that is
+    already pending is spoken once. A superseding utterance (a newer reply)
+    drops the queued and prefetched utterances of the same or lower priority;
+    the one already playing finishes. Returns False when the text was dropped
+    as a duplicate or there is no audio output.
     """
-    # Create a new thread object
-    # target = the function to run in the background
-    # args = the arguments to pass to that function (must be a tuple)
-    # daemon = True means the thread will automatically exit when the main program quits
-    thread = threading.Thread(
-        target=_speak_blocking, 
-        args=(text_to_speak, key_rotator), 
-        daemon=True
-    )
-    
-    # Start the background thread
-    thread.start()
+    worker = get_speech_worker()
+    if worker is None:
+        return False
+    return worker.submit(text_to_speak, priority, supersede)
 
+def cancel_speech():
+    """Stops the current utterance and drops everything queued, e.g. when the user starts a new command."""
+    if _speech_worker is not None:
+        _speech_worker.cancel()
 
-#
-# RENAMED your old 'speak' function to '_speak_blocking'
-#
-def _speak_blocking(text_to_speak: str, key_rotator):
+
+def export_speech(text_to_speak: str, file_name: str) -> str | None:
     """
-    The ACTUAL work: generates audio, plays it, and deletes the file.
-    This function runs in the background and is 'blocking'.
+    Synthesizes text into a WAV file with the best available voice (the
+    cloud one, else the local one); playback never touches the disk, so this
+    is the only way to keep an utterance. Returns file_name, or None on
+    failure.
     """
-    # print("---------------------------------")
-    # print(f"BG Thread: Requesting speech for: '{text_to_speak}'")
+    engines = get_engines()
+    for engine in (engines["gemini"], engines["local"]):
+        if not engine.available():
+            continue
+        parts = []
+        try:
+            engine.synthesize(text_to_speak, parts.append)
+        except Exception as e:
+            print(f"Error generating audio with {engine.name}: {e}")
+            continue
+        if parts:
+            # An engine streams several PCM parts of the same format
+            _save_binary_file(file_name, convert_to_wav(b"".join(part["data"] for part in parts), parts[0]["mime_type"]))
+            return file_name
+    return None
 
-    audio_file = _generate_audio_file(text_to_speak, key_rotator)
+# --- PLAYBACK ---
+# Audio parts are queued to an output as they arrive and played from memory by
+# its feeder thread through a device handle (a PyAudio stream or a player
+# process's stdin) that stays open between utterances. Speech starts with the
+# first part, synthesis never waits on playback and nothing is written to disk.
+# Every chunk is tagged with its utterance; chunks of a cancelled utterance are
+# skipped.
 
-    if audio_file:
-        # print(f"BG Thread: Playing {audio_file}...")
-        playsound(audio_file)
-        try:
-            os.remove(audio_file)
-            # print(f"BG Thread: Deleted temporary file: {audio_file}")
-        except OSError as e:
-            pass
-            # print(f"BG Thread: Error deleting file {audio_file}: {e}")
+class _QueuedOutput(abc.ABC):
+    def __init__(self):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._feed, name="janus-audio-output", daemon=True).start()
 
+    def write(self, utterance, pcm: bytes, bits_per_sample: int, rate: int):
+        """Queues mono PCM of utterance for playback and returns immediately."""
+        self._queue.put(("pcm", utterance, (pcm, bits_per_sample, rate)))
 
-#
-# Renamed 'generate_audio_file' to '_generate_audio_file'
-#
-def _generate_audio_file(text_prompt: str, key_rotator) -> str | None:
-    """
-    Generates an audio file from text and returns the filename.
-    Returns None on failure.
-    """
+    def end(self, utterance, on_played):
+        """Calls on_played once everything written for utterance has been played or skipped."""
+        self._queue.put(("end", utterance, on_played))
+
+    def drain(self):
+        """Blocks until everything queued so far has been played."""
+        self._queue.join()
+
+    def _feed(self):
+        while True:
+            kind, utterance, payload = self._queue.get()
+            try:
+                if kind == "end":
+                    if not utterance.cancelled:
+                        self._finish(utterance)
+                    payload()
+                elif not utterance.cancelled:
+                    self._play(utterance, *payload)
+            except Exception as e:
+                print(f"BG Thread: Audio output error: {e}")
+                self._reset()
+            finally:
+                self._queue.task_done()
+
+    @abc.abstractmethod
+    def _play(self, utterance, pcm, bits_per_sample, rate):
+        """Plays one chunk; runs on the output thread."""
+
+    def _finish(self, utterance):
+        pass
+
+    def _reset(self):
+        pass
+
+
+class AudioOutput(_QueuedOutput):
+    """A persistent PyAudio output stream, reopened only when the PCM format changes."""
+
+    def __init__(self):
+        self._pyaudio = pyaudio.PyAudio()
+        self._stream = None
+        self._format = None  # (bits_per_sample, rate)
+        super().__init__()
+
+    def _play(self, utterance, pcm, bits_per_sample, rate):
+        if self._format != (bits_per_sample, rate):
+            self._reset()
+            self._stream = self._pyaudio.open(
+                format=self._pyaudio.get_format_from_width(bits_per_sample // 8), channels=1, rate=rate, output=True,
+            )
+            self._format = (bits_per_sample, rate)
+        # Small blocks, so a cancelled utterance stops within one of them
+        block = rate * (bits_per_sample // 8) // 10
+        for i in range(0, len(pcm), block):
+            if utterance.cancelled:
+                return
+            self._stream.write(pcm[i:i + block])
+
+    def _reset(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception:
+                pass
+        self._stream, self._format = None, None
+
+
+class PipeOutput(_QueuedOutput):
+    """Fallback without PyAudio: raw PCM written to the stdin of a long-lived player process."""
+
+    def __init__(self, command):
+        self.command = command
+        self._process = None
+        self._format = None  # (bits_per_sample, rate)
+        super().__init__()
+
+    def _play(self, utterance, pcm, bits_per_sample, rate):
+        if self._format != (bits_per_sample, rate) or self._process.poll() is not None:
+            self._reset()
+            args = [arg.format(bits=bits_per_sample, rate=rate) for arg in self.command]
+            self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                             stderr=subprocess.DEVNULL)
+            self._format = (bits_per_sample, rate)
+        self._process.stdin.write(pcm)
+        self._process.stdin.flush()
+
+    def _reset(self):
+        if self._process is not None:
+            try:
+                self._process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self._process.wait(timeout=5)  # let it play what it already has
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process, self._format = None, None
+
+
+# --- SPEECH WORKER ---
+# One long-lived thread synthesizes queued utterances in priority order and
+# keeps at most PREFETCH_UTTERANCES synthesized ahead of the one playing, so
+# the next reply is ready when the current one ends without generating speech
+# that a newer reply will make stale.
+
+class _Utterance:
+    def __init__(self, text, priority):
+        self.text = text
+        self.key = normalize_text(text)
+        self.priority = priority
+        self.cancelled = False
+        self.audio_written = False  # some of it was queued for playback
+
+
+class SpeechWorker:
+    def __init__(self, output):
+        self.output = output
+        self._queue = []    # heap of (priority, seq, utterance)
+        self._seq = itertools.count()
+        self._active = []   # being synthesized or not yet played, in playback order
+        self._cond = threading.Condition()
+        self._warm_queue = queue.Queue(maxsize=WARM_QUEUE_SIZE)
+        self._warming = set()
+        self._local_repeats = OrderedDict()  # normalized phrase -> times spoken locally, least recent first
+        threading.Thread(target=self._run, name="janus-speech", daemon=True).start()
+        threading.Thread(target=self._warm, name="janus-speech-warm", daemon=True).start()
+
+    def submit(self, text, priority=PRIORITY_REPLY, supersede=True):
+        utterance = _Utterance(text, priority)
+        if not utterance.key:
+            return False
+        with self._cond:
+            queued = [entry[2] for entry in self._queue]
+            if any(other.key == utterance.key and not other.cancelled for other in queued + self._active):
+                return False
+            if supersede:
+                for stale in queued + self._active[1:]:
+                    if stale.priority >= priority:
+                        stale.cancelled = True
+            heapq.heappush(self._queue, (priority, next(self._seq), utterance))
+            self._cond.notify_all()
+        return True
+
+    def cancel(self):
+        with self._cond:
+            for utterance in [entry[2] for entry in self._queue] + self._active:
+                utterance.cancelled = True
+            self._queue.clear()
+            self._cond.notify_all()
+
+    def _next(self):
+        with self._cond:
+            while True:
+                while self._queue and self._queue[0][2].cancelled:
+                    heapq.heappop(self._queue)
+                if self._queue and len(self._active) <= PREFETCH_UTTERANCES:
+                    utterance = heapq.heappop(self._queue)[2]
+                    self._active.append(utterance)
+                    return utterance
+                self._cond.wait()
+
+    def _played(self, utterance):
+        with self._cond:
+            self._active.remove(utterance)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            utterance = self._next()
+            try:
+                _synthesize(utterance, self.output)
+            except SpeechCancelled:
+                pass
+            except Exception as e:
+                print(f"BG Thread: Error generating audio: {e}")
+            self.output.end(utterance, lambda utterance=utterance: self._played(utterance))
+
+    def warm(self, text):
+        """
+        Counts a phrase that was spoken locally. Once it has come up
+        WARM_AFTER_REPEATS times it is queued for the cloud voice, so it plays
+        from the phrase cache next time; one-off phrases never cost a request.
+        """
+        if WARM_AFTER_REPEATS <= 0:
+            return
+        key = normalize_text(text)
+        with self._cond:
+            repeats = self._local_repeats.pop(key, 0) + 1
+            self._local_repeats[key] = repeats
+            while len(self._local_repeats) > WARM_TRACKED_PHRASES:
+                self._local_repeats.popitem(last=False)
+            if repeats < WARM_AFTER_REPEATS or key in self._warming:
+                return
+            try:
+                self._warm_queue.put_nowait(text)
+            except queue.Full:
+                return
+            self._warming.add(key)
+            del self._local_repeats[key]
+
+    def _warm(self):
+        while True:
+            text = self._warm_queue.get()
+            try:
+                engine = get_engines()["gemini"]
+                cache = _phrase_cache()
+                if cache is None or not engine.available() or cache.contains(text, *engine.cache_identity):
+                    continue
+                parts = []
+                engine.synthesize(text, parts.append, priority=PRIORITY_BACKGROUND)
+                if parts:
+                    cache.put(text, *engine.cache_identity, parts[0]["mime_type"], b"".join(part["data"] for part in parts))
+            except Exception as e:
+                print(f"BG Thread: Could not fetch the cloud voice of a phrase: {e}")
+            finally:
+                with self._cond:
+                    self._warming.discard(normalize_text(text))
+
+
+def _phrase_cache():
+    """The phrase cache, or None when it is disabled or can't be opened."""
+    global USE_PHRASE_CACHE
+    if not USE_PHRASE_CACHE:
+        return None
     try:
-        current_key_for_llm = next(key_rotator) # Rotate to the next API key
-        genai.configure(api_key=current_key_for_llm)
+        return get_phrase_cache()
     except Exception as e:
-        # print(f"BG Thread: Error configuring API key: {e}")
+        print(f"BG Thread: Phrase cache unavailable: {e}")
+        USE_PHRASE_CACHE = False
         return None
 
-    model = genai.GenerativeModel(
-        model_name="gemini-2.5-flash-preview-tts"
-    )
+def _stream_engine(engine, utterance, output, record):
+    """
+    Streams one engine's audio for the utterance into output, carrying a
+    sample split across two parts over to the next. Returns (seconds to
+    first audio or None, the PCM when record is set, its mime type).
+    """
+    pending = b""
+    first_audio_at = None
+    recorded = bytearray()
+    recorded_mime_type = None
+    started = time.perf_counter()
 
-    contents = [{"role": "user", "parts": [{"text": text_prompt}]}]
-    
-    generate_content_config = {
-        "temperature": 0.5,
-        "response_modalities": ["AUDIO"],
-        "speech_config": {
-            "voice_config": {"prebuilt_voice_config": {"voice_name": "Zephyr"}}
-        },
-    }
-
-    output_filename = f"temp_audio_{threading.get_ident()}.wav" # Unique name per thread
-    audio_saved = False
-    
-    print("BG Thread: Generating audio...")
-    
-    for _ in range(2):  # Try up to 2 times
-        
+    def on_audio(part):
+        nonlocal pending, first_audio_at, recorded_mime_type
+        if utterance.cancelled:
+            raise SpeechCancelled()
+        parameters = parse_audio_mime_type(part["mime_type"])
+        sample_width = parameters["bits_per_sample"] // 8
+        data = pending + part["data"]
+        whole = len(data) - len(data) % sample_width
+        pending = data[whole:]
+        if whole:
+            if first_audio_at is None:
+                first_audio_at = time.perf_counter()
+            output.write(utterance, data[:whole], parameters["bits_per_sample"], parameters["rate"])
+            utterance.audio_written = True
+            if record:
+                recorded_mime_type = recorded_mime_type or part["mime_type"]
+                recorded.extend(data[:whole])
+
+    engine.synthesize(utterance.text, on_audio)
+    first_audio = first_audio_at - started if first_audio_at is not None else None
+    return first_audio, bytes(recorded), recorded_mime_type
+
+def _synthesize(utterance, output):
+    """
+    Speaks the utterance with the first engine route() offers that produces
+    audio, queueing each PCM part to output as soon as it arrives. Short
+    phrases the cloud voice has said before play from the phrase cache,
+    whichever engine the route prefers; new ones are saved to it.
+    """
+    engines = get_engines()
+    cache = _phrase_cache() if is_cacheable(utterance.text) else None
+    if cache is not None:
+        for engine in engines.values():
+            cached = cache.get(utterance.text, *engine.cache_identity) if engine.cacheable else None
+            if cached is not None:
+                mime_type, pcm = cached
+                parameters = parse_audio_mime_type(mime_type)
+                output.write(utterance, pcm, parameters["bits_per_sample"], parameters["rate"])
+                return
+
+    candidates = route(utterance.text)
+    if not candidates:
+        print("BG Thread: No TTS engine is available.")
+        return
+    for engine in candidates:
+        print(f"BG Thread: Generating audio ({engine.name})...")
         try:
-            current_key_for_llm = next(key_rotator) # Rotate to the next API key
-            genai.configure(api_key=current_key_for_llm)
-            for chunk in model.generate_content(
-                contents=contents,
-                generation_config=generate_content_config,
-                stream=True,
-            ):
-                if (
-                    chunk.candidates is None
-                    or chunk.candidates[0].content is None
-                    or chunk.candidates[0].content.parts is None
-                ):
-                    continue
+            first_audio, pcm, mime_type = _stream_engine(engine, utterance, output, cache is not None and engine.cacheable)
+        except SpeechCancelled:
+            raise
+        except Exception as e:
+            print(f"BG Thread: {engine.name} TTS failed: {e}")
+            if not utterance.audio_written and not utterance.cancelled:
+                continue  # nothing was said yet; try the next engine
+            return
+        if first_audio is None:
+            continue
+        print(f"BG Thread: First audio after {first_audio:.2f}s ({engine.name}).")
+        if utterance.cancelled:
+            return
+        if pcm:
+            try:
+                cache.put(utterance.text, *engine.cache_identity, mime_type, pcm)
+            except Exception as e:
+                print(f"BG Thread: Could not cache phrase: {e}")
+        elif cache is not None and not engine.cacheable and engines["gemini"] in candidates:
+            _speech_worker.warm(utterance.text)
+        return
 
-                for part in chunk.candidates[0].content.parts:
-                    if part.inline_data and part.inline_data.data:
-                        inline_data = part.inline_data
-                        data_buffer = convert_to_wav(inline_data.data, inline_data.mime_type)
-                        _save_binary_file(output_filename, data_buffer)
-                        audio_saved = True
 
+_speech_worker = None
+_speech_worker_ready = False
+_speech_worker_lock = threading.Lock()
+
+def _open_output():
+    """PyAudio when available, else the first installed player from PLAYER_COMMANDS, else None."""
+    if USE_PYAUDIO and pyaudio is not None:
+        try:
+            return AudioOutput()
         except Exception as e:
-            continue  # Try again with a new API key
-        if audio_saved:
-            return output_filename
-        else:
-            # print("BG Thread: No audio data was returned.")
-            return None
+            print(f"BG Thread: PyAudio output unavailable: {e}")
+    for command in PLAYER_COMMANDS:
+        if shutil.which(command[0]):
+            return PipeOutput(command)
+    print("BG Thread: No audio output found (install PyAudio, or aplay, paplay or ffplay); speech is disabled.")
+    return None
+
+def get_speech_worker():
+    """The process-wide speech worker, started on first use; None when there is no audio output."""
+    global _speech_worker, _speech_worker_ready
+    with _speech_worker_lock:
+        if not _speech_worker_ready:
+            output = _open_output()
+            _speech_worker = SpeechWorker(output) if output is not None else None
+            _speech_worker_ready = True
+        return _speech_worker
 
 # --- Helper functions are unchanged, just added underscores ---
 
@@ -170,26 +491,11 @@ def convert_to_wav(audio_data: bytes, mime_type: str) -> bytes:
     )
     return header + audio_data
 
-def parse_audio_mime_type(mime_type: str) -> dict[str, int | None]:
-    bits_per_sample = 16
-    rate = 24000
-    parts = mime_type.split(";")
-    for param in parts:
-        param = param.strip()
-        if param.lower().startswith("rate="):
-            try: rate = int(param.split("=", 1)[1])
-            except (ValueError, IndexError): pass 
-        elif param.startswith("audio/L"):
-            try: bits_per_sample = int(param.split("L", 1)[1])
-            except (ValueError, IndexError): pass 
-    return {"bits_per_sample": bits_per_sample, "rate": rate}
-
 
 # --- This block is for testing the file directly ---
 if __name__ == "__main__":
-    import time
-    if "GEMINI_API_KEY" not in os.environ:
-        print("ERROR: GEMINI_API_KEY environment variable not set.")
+    if not load_api_keys():
+        print("ERROR: No Gemini API keys found in .env file.")
     else:
         print("Main Thread: Calling speak() for 'Hello'.")
         speak("Hello! This audio should play in the background.")
@@ -199,8 +505,8 @@ if __name__ == "__main__":
         time.sleep(1)
         print("Main Thread: I'm in my 'main loop' doing other work...")
         
-        speak("This is a second sentence, which might overlap the first.")
+        speak("This is a second sentence, queued behind the first.", supersede=False)
         
-        print("Main Thread: Waiting for 10 seconds for audio to finish...")
+        print("Main Thread: Waiting for audio to finish...")
         time.sleep(10)
         print("Main Thread: Exiting.")
\ No newline at end of file
@@ -0,0 +1,110 @@
+import json
+import re
+from datetime import datetime
+
+# Answers trivial commander requests ("what time is it", "show my tasks",
+# "what's today's plan") locally, without a Gemini round trip.
+#
+# Matching is deliberately conservative: a message is routed only when it is
+# short, contains every keyword of one of an intent's phrases and nothing that
+# suggests a change or a follow-up ("update", "and", "why", ...). Anything else
+# goes to the model as before.
+
+# --- CONFIGURATION ---
+MAX_WORDS = 8
+# Words that mean the user wants more than a plain read
+BLOCKING_WORDS = {
+    "add", "update", "change", "remove", "delete", "edit", "write", "set", "move", "mark", "finish", "complete",
+    "and", "then", "also", "but", "why", "how", "should", "could", "would", "help", "suggest", "plan", "make",
+    "create", "schedule", "remind", "yesterday", "tomorrow", "week",
+}
+
+# (tool name, keyword phrases: every keyword of one phrase must appear, words that may appear besides them)
+INTENTS = [
+    ("current_time", [("time",), ("date",), ("day", "today")], {"what", "is", "it", "the", "current", "now", "whats", "s",
+                                                               "tell", "me", "today", "todays", "which", "right"}),
+    ("read_todays_plan", [("today", "plan"), ("todays", "plan"), ("plan", "today"), ("my", "plan")],
+     {"what", "is", "the", "whats", "s", "show", "me", "my", "for", "read", "today", "todays", "tell", "list"}),
+    ("read_tasks", [("tasks",), ("task", "list"), ("todo",), ("to", "do", "list")],
+     {"what", "are", "is", "the", "whats", "s", "show", "me", "my", "list", "read", "all", "current", "tell",
+      "pending", "open", "do", "to"}),
+    ("read_user_profile", [("my", "profile")], {"show", "me", "my", "read", "what", "is", "whats", "s", "the"}),
+]
+# "plan" is a blocking word only when it is used as a verb ("plan my day")
+PLAN_NOUN_INTENTS = {"read_todays_plan"}
+
+
+def normalize(message):
+    """Lowercased words of message without the commander's [timestamp] prefix and punctuation."""
+    message = re.sub(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*", "", message.strip())
+    message = message.lower().replace("’", "'").replace("'", "")
+    return re.findall(r"[a-z]+", message)
+
+def route(message):
+    """Returns (tool_name, parameters) when message is a plain request one tool answers, else None."""
+    words = normalize(message)
+    if not words or len(words) > MAX_WORDS:
+        return None
+    word_set = set(words)
+    for tool_name, phrases, allowed in INTENTS:
+        blocking = BLOCKING_WORDS - {"plan"} if tool_name in PLAN_NOUN_INTENTS else BLOCKING_WORDS
+        if word_set & blocking:
+            continue
+        for phrase in phrases:
+            if set(phrase) <= word_set and word_set <= allowed | set(phrase):
+                return tool_name, {}
+    return None
+
+
+# --- ANSWERS ---
+
+def _item_text(item):
+    if isinstance(item, dict):
+        for key in ("title", "name", "task", "description", "activity", "text"):
+            if item.get(key):
+                details = [f"{k}: {v}" for k, v in item.items()
+                           if k != key and isinstance(v, (str, int, float)) and v not in ("", None)]
+                return str(item[key]) + (f" ({', '.join(details)})" if details else "")
+        return json.dumps(item, ensure_ascii=False)
+    return str(item)
+
+def format_data(data, indent=0):
+    """Readable markdown-ish lines for a JSON document of unknown shape."""
+    pad = "  " * indent
+    lines = []
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict) and any(isinstance(v, (list, dict)) for v in item.values()):
+                lines.append(f"{pad}- {_item_text({k: v for k, v in item.items() if not isinstance(v, (list, dict))})}")
+                lines += format_data({k: v for k, v in item.items() if isinstance(v, (list, dict))}, indent + 1)
+            else:
+                lines.append(f"{pad}- {_item_text(item)}")
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            if isinstance(value, (list, dict)):
+                lines.append(f"{pad}{key}:")
+                lines += format_data(value, indent + 1)
+            else:
+                lines.append(f"{pad}{key}: {value}")
+    else:
+        lines.append(f"{pad}{data}")
+    return lines
+
+def answer(tool_name, tool_result):
+    """The conversation reply ({"response_type", "comment", "speak"}) for a routed tool's result."""
+    if tool_name == "current_time":
+        now = datetime.strptime(tool_result["current_time"], '%Y-%m-%d %H:%M:%S')
+        comment = f"It's {now.strftime('%H:%M')} on {now.strftime('%A, %B %d, %Y')}."
+        return {"response_type": "conversation", "comment": comment, "speak": f"It's {now.strftime('%I:%M %p').lstrip('0')}."}
+
+    titles = {
+        "read_todays_plan": ("Today's plan", "You don't have a plan for today yet.", "Here's today's plan."),
+        "read_tasks": ("Your tasks", "Your task list is empty.", "Here are your tasks."),
+        "read_user_profile": ("Your profile", "Your profile is empty.", "Here's your profile."),
+    }
+    title, empty, spoken = titles[tool_name]
+    if not tool_result or (isinstance(tool_result, dict) and tool_result.get("status") == "error"):
+        return {"response_type": "conversation", "comment": empty, "speak": empty}
+    # Comments are rendered as rich markup, like the model's
+    comment = f"[bold]{title}:[/bold]\n" + "\n".join(format_data(tool_result))
+    return {"response_type": "conversation", "comment": comment, "speak": spoken}
@@ -0,0 +1,254 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+# Health-aware API key pool shared by the commander, strategist, activity
+# monitor and TTS. The ledger is a small SQLite database, so every process
+# sees the same per-key request counts, 429 cooldowns and in-flight leases,
+# and acquire() hands out the least-loaded healthy key instead of blindly
+# cycling into a throttled one.
+#
+#     with KEY_POOL.lease() as api_key:
+#         bind_model(model, api_key)
+#         model.generate_content(...)
+
+# --- CONFIGURATION ---
+KEY_POOL_DB = 'database/key_pool.db'
+REQUESTS_PER_MINUTE = 10      # per key
+MAX_IN_FLIGHT = 2             # concurrent requests per key
+COOLDOWN_BASE_SECONDS = 30    # first 429 cooldown, doubled on each consecutive 429
+COOLDOWN_MAX_SECONDS = 600
+LEASE_TTL_SECONDS = 300       # leases older than this are treated as leaked by a crashed process
+ACQUIRE_WAIT_SECONDS = 30
+
+
+class NoHealthyKeyError(RuntimeError):
+    """Raised when no key becomes available within the wait time."""
+
+
+def load_api_keys():
+    """All Gemini keys from .env: GOOGLE_API_KEY_1..N, then GENAI_API_KEY_1..N, deduplicated in order."""
+    load_dotenv()
+    keys = []
+    for prefix in ("GOOGLE_API_KEY_", "GENAI_API_KEY_"):
+        for i in range(1, 21):
+            key = os.getenv(f"{prefix}{i}")
+            if key and key not in keys:
+                keys.append(key)
+    return keys
+
+def key_id(api_key):
+    """Stable identifier for a key; raw keys are never written to the ledger."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+def is_rate_limit_error(error):
+    """True for 429 / quota errors from the Gemini SDK."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "quota" in message or "rate limit" in message
+
+_clients = {}  # api_key -> (sync client, async client)
+_bind_lock = threading.Lock()
+
+def _clients_for(api_key):
+    """The GenerativeService clients for one key, built once and reused."""
+    from google.ai import generativelanguage as glm
+    clients = _clients.get(api_key)
+    if clients is None:
+        options = {"api_key": api_key}
+        clients = _clients[api_key] = (
+            glm.GenerativeServiceClient(client_options=options),
+            glm.GenerativeServiceAsyncClient(client_options=options),
+        )
+    return clients
+
+def bind_model(model, api_key):
+    """
+    Points a GenerativeModel at api_key by giving it that key's own sync and
+    async clients. genai.configure is never called: it is process-global, so
+    a request on another thread could go out with the wrong key.
+    """
+    with _bind_lock:
+        model._client, model._async_client = _clients_for(api_key)
+
+
+class KeyPool:
+    def __init__(self, keys=None, db_path=KEY_POOL_DB, requests_per_minute=REQUESTS_PER_MINUTE,
+                 max_in_flight=MAX_IN_FLIGHT):
+        keys = keys if keys is not None else load_api_keys()
+        if not keys:
+            raise ValueError("No valid Google API keys found in .env file.")
+        self.keys = {key_id(key): key for key in keys}
+        self.db_path = db_path
+        self.requests_per_minute = requests_per_minute
+        self.max_in_flight = max_in_flight
+        self._local = threading.local()
+        self._init_db()
+
+    # --- LEDGER ---
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Exclusive write transaction across every process sharing the ledger."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _init_db(self):
+        with self._transaction() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS api_keys (
+                    key_id TEXT PRIMARY KEY,
+                    cooldown_until REAL NOT NULL DEFAULT 0,
+                    consecutive_429s INTEGER NOT NULL DEFAULT 0,
+                    last_used REAL NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE TABLE IF NOT EXISTS key_requests (key_id TEXT NOT NULL, requested_at REAL NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS key_leases (
+                    lease_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key_id TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    started_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_key_requests ON key_requests (key_id, requested_at)")
+            conn.executemany("INSERT OR IGNORE INTO api_keys (key_id) VALUES (?)", [(k,) for k in self.keys])
+
+    # --- LEASING ---
+
+    def _try_acquire(self):
+        """Returns (lease_id, key) for the best available key, or (None, seconds to wait)."""
+        now = time.time()
+        ids = list(self.keys)
+        marks = ",".join("?" * len(ids))
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM key_requests WHERE requested_at < ?", (now - 60,))
+            conn.execute("DELETE FROM key_leases WHERE started_at < ?", (now - LEASE_TTL_SECONDS,))
+            rows = conn.execute(f"""
+                SELECT k.key_id, k.cooldown_until, k.last_used,
+                       (SELECT COUNT(*) FROM key_leases l WHERE l.key_id = k.key_id) AS in_flight,
+                       (SELECT COUNT(*) FROM key_requests r WHERE r.key_id = k.key_id) AS recent,
+                       (SELECT MIN(requested_at) FROM key_requests r WHERE r.key_id = k.key_id) AS oldest
+                FROM api_keys k WHERE k.key_id IN ({marks})
+            """, ids).fetchall()
+
+            healthy = [
+                row for row in rows
+                if row[1] <= now and row[3] < self.max_in_flight and row[4] < self.requests_per_minute
+            ]
+            if not healthy:
+                # Earliest moment something could free up: a cooldown ending or a request ageing out
+                waits = [row[1] - now for row in rows if row[1] > now]
+                waits += [row[5] + 60 - now for row in rows if row[4] >= self.requests_per_minute and row[5]]
+                return None, max(0.5, min(waits) if waits else 1.0)
+
+            # Least loaded first: fewest in flight, then fewest recent requests, then least recently used
+            chosen = min(healthy, key=lambda row: (row[3], row[4], row[2]))[0]
+            conn.execute("INSERT INTO key_requests (key_id, requested_at) VALUES (?, ?)", (chosen, now))
+            conn.execute("UPDATE api_keys SET last_used = ? WHERE key_id = ?", (now, chosen))
+            cursor = conn.execute(
+                "INSERT INTO key_leases (key_id, pid, started_at) VALUES (?, ?, ?)", (chosen, os.getpid(), now)
+            )
+            return cursor.lastrowid, self.keys[chosen]
+
+    def acquire(self, wait_seconds=ACQUIRE_WAIT_SECONDS):
+        """Leases the least-loaded healthy key, waiting up to wait_seconds. Returns (lease_id, api_key)."""
+        deadline = time.time() + wait_seconds
+        while True:
+            lease_id, result = self._try_acquire()
+            if lease_id is not None:
+                return lease_id, result
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise NoHealthyKeyError("All API keys are throttled or busy.")
+            time.sleep(min(result, remaining))
+
+    def release(self, lease_id, api_key, throttled=False):
+        """Ends a lease. A throttled release puts the key on an exponential cooldown."""
+        kid = key_id(api_key)
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM key_leases WHERE lease_id = ?", (lease_id,))
+            if throttled:
+                strikes = conn.execute(
+                    "SELECT consecutive_429s FROM api_keys WHERE key_id = ?", (kid,)
+                ).fetchone()[0]
+                cooldown = min(COOLDOWN_BASE_SECONDS * (2 ** strikes), COOLDOWN_MAX_SECONDS)
+                conn.execute(
+                    "UPDATE api_keys SET cooldown_until = ?, consecutive_429s = consecutive_429s + 1 WHERE key_id = ?",
+                    (time.time() + cooldown, kid),
+                )
+                print(f"API key {kid[:6]}… throttled; cooling down for {cooldown}s.")
+            else:
+                conn.execute("UPDATE api_keys SET consecutive_429s = 0 WHERE key_id = ?", (kid,))
+
+    @contextmanager
+    def lease(self, wait_seconds=ACQUIRE_WAIT_SECONDS):
+        """Context manager around acquire/release that detects 429s from the wrapped call."""
+        lease_id, api_key = self.acquire(wait_seconds)
+        try:
+            yield api_key
+        except Exception as e:
+            self.release(lease_id, api_key, throttled=is_rate_limit_error(e))
+            raise
+        else:
+            self.release(lease_id, api_key)
+
+    def status(self):
+        """Per-key health snapshot (by key id) for debugging."""
+        now = time.time()
+        conn = self._connect()
+        rows = conn.execute("""
+            SELECT k.key_id, k.cooldown_until, k.consecutive_429s,
+                   (SELECT COUNT(*) FROM key_leases l WHERE l.key_id = k.key_id),
+                   (SELECT COUNT(*) FROM key_requests r WHERE r.key_id = k.key_id AND r.requested_at >= ?)
+            FROM api_keys k
+        """, (now - 60,)).fetchall()
+        return [
+            {
+                "key_id": kid,
+                "cooldown_seconds": max(0, round(until - now)),
+                "consecutive_429s": strikes,
+                "in_flight": in_flight,
+                "requests_last_minute": recent,
+            }
+            for kid, until, strikes, in_flight, recent in rows if kid in self.keys
+        ]
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_key_pool():
+    """The process-wide pool over the keys in .env, created on first use."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = KeyPool()
+        return _default_pool
+
+
+if __name__ == "__main__":
+    for row in get_key_pool().status():
+        print(row)
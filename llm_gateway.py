@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from key_pool import NoHealthyKeyError, bind_model, get_key_pool, is_rate_limit_error
+
+# Local LLM gateway shared by the commander, strategist, activity monitor and TTS.
+#
+#     python llm_gateway.py                 # Gemini backend
+#     python llm_gateway.py --backend stub  # canned replies, no network or keys
+#
+# Clients send one JSON request per line over a local socket. The gateway
+# schedules requests by priority (the interactive commander first, background
+# summaries last, with slots reserved for interactive work), caches
+# deterministic responses, coalesces identical in-flight requests and retries
+# rate limits and transient errors with backoff. When the gateway is not
+# running, generate() calls the backend in-process, so every caller keeps
+# working without it.
+
+# --- CONFIGURATION ---
+GATEWAY_HOST = '127.0.0.1'
+GATEWAY_PORT = int(os.getenv('JANUS_GATEWAY_PORT', '8765'))
+MAX_CONCURRENCY = 4               # backend calls running at once
+RESERVED_INTERACTIVE_SLOTS = 1    # of those, kept free for interactive requests
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_TTL_SECONDS = 3600
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0            # seconds, doubled on each retry
+CONNECT_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 300
+STREAM_LIMIT = 64 * 1024 * 1024   # max bytes per protocol line (audio results are base64 encoded)
+
+PRIORITY_INTERACTIVE = "interactive"  # the commander, waiting on a human
+PRIORITY_SPEECH = "speech"            # TTS for what the commander just said
+PRIORITY_BACKGROUND = "background"    # monitor analyses, strategist decisions and summaries
+PRIORITIES = {PRIORITY_INTERACTIVE: 0, PRIORITY_SPEECH: 1, PRIORITY_BACKGROUND: 2}
+
+TRANSIENT_ERROR_MARKERS = ("500", "502", "503", "504", "unavailable", "deadline", "timed out", "timeout", "internal error")
+
+
+class GatewayUnavailable(ConnectionError):
+    """Raised when no gateway is listening."""
+
+class GatewayError(RuntimeError):
+    """Raised when the gateway (or the in-process backend) could not complete a request."""
+
+
+# --- REQUESTS ---
+
+def build_request(model, contents, system_instruction=None, generation_config=None, cache=None):
+    """
+    A JSON-serializable generation request. contents is a prompt string or a
+    list of {"role", "parts": [text, ...]} messages. cache=None caches only
+    deterministic (temperature 0) requests.
+    """
+    if isinstance(contents, str):
+        contents = [{"role": "user", "parts": [contents]}]
+    return {
+        "model": model,
+        "contents": contents,
+        "system_instruction": system_instruction,
+        "generation_config": generation_config or {},
+        "cache": cache,
+    }
+
+def history_to_contents(history):
+    """Chat history (Content protos or dicts) as plain {"role", "parts": [text]} dicts."""
+    contents = []
+    for message in history:
+        role = message["role"] if isinstance(message, dict) else message.role
+        parts = message["parts"] if isinstance(message, dict) else message.parts
+        texts = [part if isinstance(part, str) else getattr(part, "text", "") for part in parts]
+        contents.append({"role": role, "parts": texts})
+    return contents
+
+def request_key(request):
+    """Identity of a request for caching and coalescing; priority and streaming don't change the answer."""
+    identity = {k: request.get(k) for k in ("model", "contents", "system_instruction", "generation_config")}
+    return hashlib.sha256(json.dumps(identity, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def is_cacheable(request):
+    if request.get("cache") is not None:
+        return bool(request["cache"])
+    return request.get("generation_config", {}).get("temperature") == 0
+
+def is_transient_error(error):
+    if is_rate_limit_error(error):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+# --- BACKENDS ---
+# A backend turns a request into {"text": str, "audio": [{"mime_type", "data": bytes}]},
+# calling on_chunk(text) for each streamed piece of text and on_audio(part) for
+# each audio part as it arrives, when they are given.
+
+class GeminiBackend:
+    name = "gemini"
+
+    def generate(self, request, on_chunk=None, on_audio=None):
+        import google.generativeai as genai
+
+        model = genai.GenerativeModel(
+            request["model"],
+            system_instruction=request.get("system_instruction"),
+            generation_config=request.get("generation_config") or None,
+        )
+        texts, audio = [], []
+        with get_key_pool().lease() as api_key:
+            bind_model(model, api_key)
+            for chunk in model.generate_content(request["contents"], stream=True):
+                if not chunk.candidates or chunk.candidates[0].content is None:
+                    continue
+                for part in chunk.candidates[0].content.parts or []:
+                    if part.inline_data and part.inline_data.data:
+                        audio.append({"mime_type": part.inline_data.mime_type, "data": part.inline_data.data})
+                        if on_audio:
+                            on_audio(audio[-1])
+                    elif part.text:
+                        texts.append(part.text)
+                        if on_chunk:
+                            on_chunk(part.text)
+        return {"text": "".join(texts), "audio": audio}
+
+
+class StubBackend:
+    """Canned, deterministic replies for running the other modules without network access or keys."""
+    name = "stub"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, request, on_chunk=None, on_audio=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        generation_config = request.get("generation_config") or {}
+        last_parts = request["contents"][-1]["parts"] if request["contents"] else [""]
+        prompt = " ".join(str(part) for part in last_parts)
+
+        if "AUDIO" in generation_config.get("response_modalities", []):
+            # One second of silence in the format the Gemini TTS model returns, in four parts
+            audio = [{"mime_type": "audio/L16;rate=24000", "data": b"\x00\x00" * 6000} for _ in range(4)]
+            if on_audio:
+                for part in audio:
+                    on_audio(part)
+            return {"text": "", "audio": audio}
+
+        if generation_config.get("response_mime_type") == "application/json":
+            text = json.dumps({"response_type": "conversation", "comment": f"(stub) {prompt[:120]}", "speak": "",
+                               "execute_code": -1})
+        else:
+            text = f"(stub) {prompt[:200]}"
+        if on_chunk:
+            for i in range(0, len(text), 40):
+                on_chunk(text[i:i + 40])
+        return {"text": text, "audio": []}
+
+BACKENDS = {"gemini": GeminiBackend, "stub": StubBackend}
+
+
+def call_with_retries(backend, request, on_chunk=None, on_audio=None, attempts=RETRY_ATTEMPTS):
+    """Runs backend.generate, retrying rate limits and transient errors with exponential backoff and jitter."""
+    emitted = False
+
+    def track_chunk(text):
+        nonlocal emitted
+        emitted = True
+        on_chunk(text)
+
+    def track_audio(part):
+        nonlocal emitted
+        emitted = True
+        on_audio(part)
+
+    for attempt in range(attempts):
+        try:
+            return backend.generate(request, track_chunk if on_chunk else None, track_audio if on_audio else None)
+        except NoHealthyKeyError:
+            raise  # the key pool already waited for a key
+        except Exception as e:
+            # A partially streamed reply can't be retried without duplicating text or audio
+            if emitted or attempt == attempts - 1 or not is_transient_error(e):
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** attempt)
+            delay += random.uniform(0, delay)
+            print(f"LLM request failed ({e}); retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+# --- GATEWAY SERVER ---
+
+class _Job:
+    def __init__(self, key, request, priority):
+        self.key = key
+        self.request = request
+        self.priority = priority
+        self.started = False
+        self.chunks = []      # streamed so far, replayed to requests that coalesce late
+        self.listeners = []   # chunk callbacks of streaming requests
+        self.audio = []       # audio parts streamed so far
+        self.audio_listeners = []
+        self.future = asyncio.get_running_loop().create_future()
+
+    def emit(self, text):
+        self.chunks.append(text)
+        for listener in list(self.listeners):
+            listener(text)
+
+    def emit_audio(self, part):
+        self.audio.append(part)
+        for listener in list(self.audio_listeners):
+            listener(part)
+
+
+class LLMGateway:
+    def __init__(self, backend, max_concurrency=MAX_CONCURRENCY, reserved_interactive=RESERVED_INTERACTIVE_SLOTS):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.background_limit = max(1, max_concurrency - reserved_interactive)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="janus-llm")
+        self._queue = []          # heap of (priority, seq, job)
+        self._seq = itertools.count()
+        self._inflight = {}       # request key -> job, queued or running
+        self._cache = OrderedDict()  # request key -> (expires_at, size, result)
+        self._cache_bytes = 0
+        self._running = 0
+        self._running_background = 0
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "backend_calls": 0, "errors": 0}
+
+    # --- CACHE ---
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._cache_drop(key)
+            return None
+        self._cache.move_to_end(key)
+        return entry[2]
+
+    def _cache_put(self, key, result):
+        size = len(result["text"]) + sum(len(a["data"]) for a in result["audio"])
+        if size > CACHE_MAX_BYTES:
+            return
+        self._cache_drop(key)
+        self._cache[key] = (time.time() + CACHE_TTL_SECONDS, size, result)
+        self._cache_bytes += size
+        while len(self._cache) > CACHE_MAX_ENTRIES or self._cache_bytes > CACHE_MAX_BYTES:
+            self._cache_drop(next(iter(self._cache)))
+
+    def _cache_drop(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._cache_bytes -= entry[1]
+
+    # --- SCHEDULING ---
+
+    async def submit(self, request, priority=PRIORITY_BACKGROUND, on_chunk=None, on_audio=None):
+        """Returns (result, how) where how is "cache", "coalesced" or "backend"."""
+        self.stats["requests"] += 1
+        rank = PRIORITIES.get(priority, PRIORITIES[PRIORITY_BACKGROUND])
+        key = request_key(request)
+
+        cached = self._cache_get(key) if is_cacheable(request) else None
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            if on_chunk and cached["text"]:
+                on_chunk(cached["text"])
+            if on_audio:
+                for part in cached["audio"]:
+                    on_audio(part)
+            return cached, "cache"
+
+        job = self._inflight.get(key)
+        how = "backend"
+        if job is not None:
+            self.stats["coalesced"] += 1
+            how = "coalesced"
+            if not job.started and rank < job.priority:
+                # An interactive caller joined a queued background job; move it up
+                job.priority = rank
+                heapq.heappush(self._queue, (rank, next(self._seq), job))
+        else:
+            job = _Job(key, request, rank)
+            self._inflight[key] = job
+            heapq.heappush(self._queue, (rank, next(self._seq), job))
+            self._dispatch()
+
+        if on_chunk:
+            for text in job.chunks:
+                on_chunk(text)
+            job.listeners.append(on_chunk)
+        if on_audio:
+            for part in job.audio:
+                on_audio(part)
+            job.audio_listeners.append(on_audio)
+        try:
+            return await asyncio.shield(job.future), how
+        finally:
+            if on_chunk in job.listeners:
+                job.listeners.remove(on_chunk)
+            if on_audio in job.audio_listeners:
+                job.audio_listeners.remove(on_audio)
+
+    def _dispatch(self):
+        """Starts queued jobs while slots are free; background jobs never take the reserved slots."""
+        while self._queue and self._running < self.max_concurrency:
+            rank, _, job = self._queue[0]
+            if job.started or rank != job.priority:
+                heapq.heappop(self._queue)  # stale entry left behind by a priority bump
+                continue
+            background = rank > PRIORITIES[PRIORITY_INTERACTIVE]
+            if background and self._running_background >= self.background_limit:
+                break
+            heapq.heappop(self._queue)
+            job.started = True
+            self._running += 1
+            self._running_background += background
+            asyncio.get_running_loop().create_task(self._run(job, background))
+
+    async def _run(self, job, background):
+        loop = asyncio.get_running_loop()
+        on_chunk = lambda text: loop.call_soon_threadsafe(job.emit, text)
+        on_audio = lambda part: loop.call_soon_threadsafe(job.emit_audio, part)
+        try:
+            self.stats["backend_calls"] += 1
+            result = await loop.run_in_executor(
+                self._executor, call_with_retries, self.backend, job.request, on_chunk, on_audio
+            )
+            # Let chunks scheduled from the worker thread reach listeners before the result does
+            await asyncio.sleep(0)
+            if is_cacheable(job.request):
+                self._cache_put(job.key, result)
+            job.future.set_result(result)
+        except Exception as e:
+            self.stats["errors"] += 1
+            job.future.set_exception(e)
+        finally:
+            self._inflight.pop(job.key, None)
+            self._running -= 1
+            self._running_background -= background
+            self._dispatch()
+
+    # --- PROTOCOL ---
+
+    async def handle_client(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise ValueError("expected a JSON object")
+            op = message.get("op", "generate")
+            if op == "ping":
+                await self._send(writer, {"type": "result", "status": "ok", "backend": self.backend.name})
+            elif op == "stats":
+                stats = dict(self.stats, queued=len(self._inflight) - self._running, running=self._running,
+                             cache_entries=len(self._cache), cache_bytes=self._cache_bytes)
+                await self._send(writer, {"type": "result", "status": "ok", "stats": stats})
+            elif op == "generate":
+                await self._handle_generate(message, writer)
+            else:
+                await self._send(writer, {"type": "result", "status": "error", "message": f"Unknown op: {op}"})
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            await self._send(writer, {"type": "result", "status": "error", "message": f"Bad request: {e}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # the client went away; its job still finishes for anyone coalesced onto it
+        finally:
+            writer.close()
+
+    async def _handle_generate(self, message, writer):
+        missing = [field for field in ("model", "contents") if not message.get(field)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        request = build_request(
+            message["model"], message["contents"], message.get("system_instruction"),
+            message.get("generation_config"), message.get("cache"),
+        )
+        on_chunk = on_audio = None
+        if message.get("stream"):
+            on_chunk = lambda text: writer.write((json.dumps({"type": "chunk", "text": text}) + "\n").encode())
+        if message.get("stream_audio"):
+            on_audio = lambda part: writer.write((json.dumps({
+                "type": "audio", "mime_type": part["mime_type"], "data": base64.b64encode(part["data"]).decode(),
+            }) + "\n").encode())
+        started = time.perf_counter()
+        try:
+            result, how = await self.submit(request, message.get("priority", PRIORITY_BACKGROUND), on_chunk, on_audio)
+        except Exception as e:
+            await self._send(writer, {"type": "result", "status": "error", "message": str(e),
+                                      "rate_limited": is_rate_limit_error(e)})
+            return
+        await self._send(writer, {
+            "type": "result",
+            "status": "ok",
+            "text": result["text"],
+            # Streamed audio was already sent part by part
+            "audio": [] if on_audio else [
+                {"mime_type": a["mime_type"], "data": base64.b64encode(a["data"]).decode()} for a in result["audio"]
+            ],
+            "cached": how == "cache",
+            "coalesced": how == "coalesced",
+            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        })
+
+    async def _send(self, writer, payload):
+        writer.write((json.dumps(payload) + "\n").encode())
+        await writer.drain()
+
+    async def serve(self, host=GATEWAY_HOST, port=GATEWAY_PORT):
+        server = await asyncio.start_server(self.handle_client, host, port, limit=STREAM_LIMIT)
+        print(f"LLM gateway ({self.backend.name} backend) listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+# --- CLIENT ---
+
+def _generate_message(request, priority, stream, stream_audio=False):
+    message = dict(request, op="generate", priority=priority, stream=stream, stream_audio=stream_audio)
+    return (json.dumps(message) + "\n").encode()
+
+def _decode_result(reply):
+    if reply.get("status") != "ok":
+        raise GatewayError(reply.get("message", "Unknown gateway error"))
+    reply["audio"] = [{"mime_type": a["mime_type"], "data": base64.b64decode(a["data"])} for a in reply.get("audio", [])]
+    return reply
+
+def gateway_request(request, priority=PRIORITY_BACKGROUND, on_chunk=None, port=GATEWAY_PORT, timeout=REQUEST_TIMEOUT,
+                    on_audio=None):
+    """Sends a request to the running gateway. Raises GatewayUnavailable when none is listening."""
+    try:
+        sock = socket.create_connection((GATEWAY_HOST, port), timeout=CONNECT_TIMEOUT)
+    except OSError as e:
+        raise GatewayUnavailable(str(e)) from e
+    with sock:
+        sock.settimeout(timeout)
+        sock.sendall(_generate_message(request, priority, on_chunk is not None, on_audio is not None))
+        audio = []
+        with sock.makefile('rb') as replies:
+            for line in replies:
+                reply = json.loads(line)
+                if reply.get("type") == "chunk":
+                    on_chunk(reply["text"])
+                elif reply.get("type") == "audio":
+                    audio.append({"mime_type": reply["mime_type"], "data": base64.b64decode(reply["data"])})
+                    on_audio(audio[-1])
+                else:
+                    result = _decode_result(reply)
+                    if on_audio:
+                        result["audio"] = audio
+                    return result
+    raise GatewayError("Gateway closed the connection without a result.")
+
+async def gateway_stream_async(request, priority=PRIORITY_INTERACTIVE, port=GATEWAY_PORT):
+    """
+    Async iterator over the text chunks of a streamed request. Connects
+    eagerly, so GatewayUnavailable is raised here and not mid-iteration.
+    """
+    try:
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(GATEWAY_HOST, port, limit=STREAM_LIMIT), CONNECT_TIMEOUT
+        )
+    except (OSError, asyncio.TimeoutError) as e:
+        raise GatewayUnavailable(str(e)) from e
+    writer.write(_generate_message(request, priority, True))
+
+    async def chunks():
+        try:
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise GatewayError("Gateway closed the connection without a result.")
+                reply = json.loads(line)
+                if reply.get("type") == "chunk":
+                    yield reply["text"]
+                else:
+                    _decode_result(reply)
+                    return
+        finally:
+            writer.close()
+    return chunks()
+
+
+_local_backend = None
+_local_backend_lock = threading.Lock()
+
+def generate(model, contents, system_instruction=None, generation_config=None, priority=PRIORITY_BACKGROUND,
+             cache=None, on_chunk=None, on_audio=None):
+    """
+    Generates through the gateway, or directly with the Gemini backend (with
+    the same retries) when the gateway is not running. Returns
+    {"text", "audio": [{"mime_type", "data"}], "cached", ...}. on_chunk and
+    on_audio receive text and audio parts as they stream in.
+    """
+    global _local_backend
+    request = build_request(model, contents, system_instruction, generation_config, cache)
+    try:
+        return gateway_request(request, priority, on_chunk, on_audio=on_audio)
+    except GatewayUnavailable:
+        pass
+    with _local_backend_lock:
+        if _local_backend is None:
+            _local_backend = GeminiBackend()
+    result = call_with_retries(_local_backend, request, on_chunk, on_audio)
+    return dict(result, cached=False, coalesced=False)
+
+def gateway_stats(port=GATEWAY_PORT):
+    """The running gateway's counters, or None when it is not running."""
+    try:
+        with socket.create_connection((GATEWAY_HOST, port), timeout=CONNECT_TIMEOUT) as sock:
+            sock.sendall(b'{"op": "stats"}\n')
+            with sock.makefile('rb') as replies:
+                return json.loads(replies.readline()).get("stats")
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local LLM gateway shared by the Janus processes.")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="gemini")
+    parser.add_argument("--port", type=int, default=GATEWAY_PORT)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="simulated latency of the stub backend")
+    args = parser.parse_args()
+
+    backend = StubBackend(args.stub_delay) if args.backend == "stub" else GeminiBackend()
+    if args.backend == "gemini":
+        get_key_pool()  # fail fast when .env has no keys
+    try:
+        asyncio.run(LLMGateway(backend, args.concurrency).serve(port=args.port))
+    except KeyboardInterrupt:
+        print("LLM gateway stopped.")
@@ -0,0 +1,160 @@
+import json
+from datetime import datetime
+
+from focus_scorer import estimate_sample_seconds
+
+# Compact encodings of activity_log records for LLM prompts. Consecutive
+# identical {application, activity, topics} samples collapse into spans, and
+# repeated strings are dictionary-encoded, so each strategist cycle uploads a
+# fraction of the pretty-printed JSON it used to.
+
+# --- CONFIGURATION ---
+CHARS_PER_TOKEN = 4  # rough estimate for English text and JSON
+SPAN_COLUMNS = ["start", "end", "minutes", "application", "activity", "topics"]
+
+FORMAT_DESCRIPTIONS = {
+    "json": (
+        'Activity arrives as compact JSON: "date", a string table "s", the column names "cols" and "rows". '
+        'Each row is one span of identical consecutive activity; application, activity and topics are '
+        'indexes into "s" (topics is a list of indexes). Times are HH:MM:SS on "date".'
+    ),
+    "table": (
+        'Activity arrives as a "|"-separated table, one line per span of identical consecutive activity, '
+        'with the header start|end|minutes|application|activity|topics. Topics are separated by ";".'
+    ),
+}
+
+
+# --- ENCODING ---
+
+def _topics(record):
+    topics = record.get("topics") or []
+    if isinstance(topics, str):
+        topics = [topics]
+    return tuple(str(topic) for topic in topics)
+
+def _clock(timestamp):
+    try:
+        return datetime.fromisoformat(timestamp).strftime('%H:%M:%S')
+    except (TypeError, ValueError):
+        return str(timestamp)
+
+def collapse_spans(records):
+    """
+    Collapses consecutive records with the same application, activity and topics
+    into spans: {"start", "end", "minutes", "application", "activity", "topics"}.
+    "end" is the timestamp of the last sample in the span.
+    """
+    sample_minutes = estimate_sample_seconds(records) / 60
+    spans = []
+    for record in records:
+        key = (record.get("application"), record.get("activity"), _topics(record))
+        if spans and spans[-1]["_key"] == key:
+            spans[-1]["end"] = record.get("timestamp")
+            spans[-1]["samples"] += 1
+            continue
+        spans.append({
+            "_key": key,
+            "start": record.get("timestamp"),
+            "end": record.get("timestamp"),
+            "samples": 1,
+            "application": key[0],
+            "activity": key[1],
+            "topics": list(key[2]),
+        })
+    for span in spans:
+        del span["_key"]
+        span["minutes"] = round(span.pop("samples") * sample_minutes, 1)
+    return spans
+
+def encode_compact_json(spans):
+    """Dictionary-encodes repeated strings and emits the spans as minified JSON."""
+    strings, index = [], {}
+
+    def ref(value):
+        value = "" if value is None else str(value)
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    rows = [
+        [
+            _clock(span["start"]),
+            _clock(span["end"]),
+            span["minutes"],
+            ref(span["application"]),
+            ref(span["activity"]),
+            [ref(topic) for topic in span["topics"]],
+        ]
+        for span in spans
+    ]
+    date = (spans[0]["start"] or "")[:10] if spans else ""
+    payload = {"date": date, "s": strings, "cols": SPAN_COLUMNS, "rows": rows}
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+
+def encode_table(spans):
+    """Emits the spans as a "|"-separated table with one header line."""
+    def cell(value):
+        return ("" if value is None else str(value)).replace("|", "/").replace("\n", " ")
+
+    lines = ["|".join(SPAN_COLUMNS)]
+    for span in spans:
+        lines.append("|".join([
+            _clock(span["start"]),
+            _clock(span["end"]),
+            str(span["minutes"]),
+            cell(span["application"]),
+            cell(span["activity"]),
+            ";".join(cell(topic) for topic in span["topics"]),
+        ]))
+    return "\n".join(lines)
+
+def encode_activity_payload(records, fmt="json"):
+    """Encodes activity records for a prompt. fmt is "json" or "table"."""
+    spans = collapse_spans(records or [])
+    if fmt == "table":
+        return encode_table(spans)
+    if fmt == "json":
+        return encode_compact_json(spans)
+    raise ValueError(f"Unknown payload format: {fmt}")
+
+
+# --- REPORTING ---
+
+def estimate_tokens(text, model=None):
+    """Token count for text. Uses model.count_tokens when a Gemini model is given, else a length estimate."""
+    if model is not None:
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            print(f"count_tokens failed ({e}); falling back to an estimate.")
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def payload_report(records, encoded, model=None):
+    """Compares the pretty-printed JSON the strategist used to send with the encoded payload."""
+    raw = json.dumps(records, indent=2)
+    raw_tokens = estimate_tokens(raw, model)
+    encoded_tokens = estimate_tokens(encoded, model)
+    return {
+        "records": len(records),
+        "raw_chars": len(raw),
+        "encoded_chars": len(encoded),
+        "raw_tokens": raw_tokens,
+        "encoded_tokens": encoded_tokens,
+        "saved_percent": round(100 * (1 - encoded_tokens / raw_tokens), 1) if raw_tokens else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    sample = [
+        {"application": "VS Code", "activity": "Editing strategist.py", "topics": ["python", "Janus"], "timestamp": f"2025-10-23T10:{m:02d}:00"}
+        for m in range(0, 30, 2)
+    ] + [
+        {"application": "Google Chrome", "activity": "Watching YouTube", "topics": ["music"], "timestamp": f"2025-10-23T10:{m:02d}:00"}
+        for m in range(30, 40, 2)
+    ]
+    for fmt in ("json", "table"):
+        encoded = encode_activity_payload(sample, fmt)
+        print(encoded)
+        print(payload_report(sample, encoded))
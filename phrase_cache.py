@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Persistent cache of synthesized speech for the short phrases Janus repeats
+# (greetings, confirmations, nudges), so they play instantly without a TTS
+# request.
+#
+# Entries are content-addressed: the key is a hash of the TTS model, voice,
+# temperature and normalized text. The zlib-compressed PCM is stored in a
+# small SQLite database together with its format and last use. When the
+# stored audio exceeds MAX_CACHE_BYTES, the least recently used phrases are
+# evicted; SQLite reuses the freed pages, so the file stays near the budget.
+
+# --- CONFIGURATION ---
+PHRASE_CACHE_DB = 'database/phrase_cache.db'
+MAX_CACHE_BYTES = 32 * 1024 * 1024   # compressed audio kept in total
+MAX_PHRASE_CHARS = 160               # longer utterances rarely repeat and aren't cached
+COMPRESSION_LEVEL = 6
+
+
+def normalize_text(text):
+    """Text as compared for caching and deduplication: lowercased, whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+def phrase_key(text, voice_name, temperature, model):
+    identity = [model, voice_name, float(temperature), normalize_text(text)]
+    return hashlib.sha256(json.dumps(identity, ensure_ascii=False).encode()).hexdigest()
+
+def is_cacheable(text):
+    return 0 < len(normalize_text(text)) <= MAX_PHRASE_CHARS
+
+
+class PhraseCache:
+    def __init__(self, db_path=PHRASE_CACHE_DB, max_bytes=MAX_CACHE_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._init_db()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS phrases (
+                key TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                mime_type TEXT NOT NULL,
+                audio BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._connect().execute("CREATE INDEX IF NOT EXISTS idx_phrases_last_used ON phrases (last_used)")
+
+    def get(self, text, voice_name, temperature, model):
+        """(mime_type, pcm) for a cached phrase, or None."""
+        key = phrase_key(text, voice_name, temperature, model)
+        conn = self._connect()
+        row = conn.execute("SELECT mime_type, audio FROM phrases WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            pcm = zlib.decompress(row[1])
+        except zlib.error:
+            conn.execute("DELETE FROM phrases WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE phrases SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        return row[0], pcm
+
+    def contains(self, text, voice_name, temperature, model):
+        key = phrase_key(text, voice_name, temperature, model)
+        return self._connect().execute("SELECT 1 FROM phrases WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, text, voice_name, temperature, model, mime_type, pcm):
+        """Stores a phrase's PCM and evicts the least recently used phrases beyond the budget."""
+        if not is_cacheable(text) or not pcm:
+            return
+        audio = zlib.compress(pcm, COMPRESSION_LEVEL)
+        if len(audio) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO phrases (key, text, mime_type, audio, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (phrase_key(text, voice_name, temperature, model), normalize_text(text), mime_type, audio,
+                 len(audio), now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM phrases").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                for key, size in conn.execute("SELECT key, size FROM phrases ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM phrases WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+                print(f"Phrase cache: evicted {evicted} phrases to stay within {self.max_bytes / (1024 * 1024):.1f} MB.")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def stats(self):
+        entries, size, hits = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) FROM phrases"
+        ).fetchone()
+        return {"entries": entries, "bytes": size, "hits": hits}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_phrase_cache():
+    """The process-wide phrase cache, opened on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PhraseCache()
+        return _default_cache
+
+
+if __name__ == "__main__":
+    print(get_phrase_cache().stats())
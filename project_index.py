@@ -0,0 +1,326 @@
+import fnmatch
+import os
+import threading
+import time
+from datetime import datetime
+
+# Recursive, cached index of a project tree for the commander's
+# get_project_structure and find_files tools.
+#
+# The tree is walked with os.scandir, skipping the usual clutter (.git, venv,
+# __pycache__, ...) and whatever the .gitignore files in the tree exclude, each
+# relative to its own directory. Each directory's listing is kept with the
+# directory's mtime. A refresh only rescans the directories whose mtime changed
+# (an entry was added, removed or renamed) or whose listing is older than
+# RESCAN_SECONDS (files edited in place), so repeated calls cost one stat per
+# directory, plus one per .gitignore.
+
+# --- CONFIGURATION ---
+DEFAULT_IGNORES = [
+    '.git/', '.hg/', '.svn/', 'venv/', '.venv/', 'env/', '__pycache__/', 'node_modules/',
+    '.mypy_cache/', '.pytest_cache/', '.ruff_cache/', '.tox/', '.ipynb_checkpoints/', '*.pyc', '.DS_Store',
+]
+RESCAN_SECONDS = 300            # listings older than this are rescanned even if the directory mtime is unchanged
+MIN_REFRESH_INTERVAL = 2.0      # back-to-back tool calls share one refresh
+MAX_INDEX_ENTRIES = 50000       # stop indexing huge trees (e.g. a home directory) here
+MAX_TREE_ENTRIES = 400          # entries shown by get_project_structure before truncating
+DEFAULT_TREE_DEPTH = 3
+DEFAULT_FIND_LIMIT = 100
+
+
+def _format_mtime(mtime):
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
+
+
+# --- IGNORE RULES ---
+
+class IgnoreRules:
+    """The subset of .gitignore syntax that matters for browsing: globs, negation, dir-only and anchored patterns."""
+
+    def __init__(self, patterns):
+        self.rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            negate = pattern.startswith('!')
+            pattern = pattern.lstrip('!')
+            dir_only = pattern.endswith('/')
+            pattern = pattern.rstrip('/')
+            if pattern.startswith('**/'):
+                pattern = pattern[3:]
+            anchored = '/' in pattern
+            self.rules.append((pattern.lstrip('/'), negate, dir_only, anchored))
+
+    def match(self, rel_path, is_dir):
+        """True if ignored, False if re-included by a negation, None if no pattern matches."""
+        name = rel_path.rsplit('/', 1)[-1]
+        result = None
+        for pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if fnmatch.fnmatch(rel_path if anchored else name, pattern):
+                result = not negate
+        return result
+
+    def ignored(self, rel_path, is_dir):
+        return bool(self.match(rel_path, is_dir))
+
+
+def _read_gitignore(directory):
+    """((mtime_ns, size), IgnoreRules) of directory's own .gitignore, or (None, None)."""
+    path = os.path.join(directory, '.gitignore')
+    try:
+        stamp = _file_stamp(path)
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return stamp, IgnoreRules(f.read().splitlines())
+    except OSError:
+        return None, None
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_stamp(directory):
+    try:
+        return _file_stamp(os.path.join(directory, '.gitignore'))
+    except OSError:
+        return None
+
+def _ignored(rel_path, is_dir, chain):
+    """
+    Applies chain, [(base relative dir, IgnoreRules)] from the root down, to
+    rel_path. Each rule set sees the path relative to its own directory, and a
+    deeper .gitignore overrides a shallower one.
+    """
+    result = False
+    for base, rules in chain:
+        matched = rules.match(rel_path[len(base) + 1:] if base else rel_path, is_dir)
+        if matched is not None:
+            result = matched
+    return result
+
+
+# --- INDEX ---
+
+class _Listing:
+    __slots__ = ("mtime_ns", "scanned_at", "dirs", "files", "gitignore", "rules")
+
+    def __init__(self, mtime_ns, dirs, files, gitignore, rules):
+        self.mtime_ns = mtime_ns
+        self.scanned_at = time.time()
+        self.dirs = dirs            # sorted subdirectory names
+        self.files = files          # name -> (size, mtime)
+        self.gitignore = gitignore  # (mtime_ns, size) of the directory's own .gitignore, or None
+        self.rules = rules          # IgnoreRules of that .gitignore, or None
+
+
+class ProjectIndex:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._listings = {}   # relative dir path ('' for the root) -> _Listing
+        self._defaults = IgnoreRules(DEFAULT_IGNORES)
+        self._refreshed_at = 0.0
+        self.incomplete = False
+        self._lock = threading.Lock()  # batched tools may query the same index concurrently
+
+    def _scan(self, rel_dir, mtime_ns, chain):
+        """Lists rel_dir, filtered by chain plus the directory's own .gitignore."""
+        gitignore, rules = _read_gitignore(os.path.join(self.root, rel_dir))
+        if rules is not None:
+            chain = chain + [(rel_dir, rules)]
+        dirs, files = [], {}
+        with os.scandir(os.path.join(self.root, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if _ignored(rel_path, is_dir, chain):
+                        continue
+                    if is_dir:
+                        dirs.append(entry.name)
+                    else:
+                        stat = entry.stat(follow_symlinks=False)
+                        files[entry.name] = (stat.st_size, stat.st_mtime)
+                except OSError:
+                    continue  # vanished or unreadable while scanning
+        return _Listing(mtime_ns, sorted(dirs), files, gitignore, rules)
+
+    def refresh(self, force=False):
+        """Brings the index up to date. Returns {"scanned": n, "reused": n} directory counts."""
+        with self._lock:
+            now = time.time()
+            if not force and now - self._refreshed_at < MIN_REFRESH_INTERVAL and self._listings:
+                return {"scanned": 0, "reused": len(self._listings)}
+            listings, scanned, reused, entries = {}, 0, 0, 0
+            self.incomplete = False
+            # (relative dir, ignore rules of its ancestors, rescan the whole subtree)
+            pending = [('', [('', self._defaults)], force)]
+            while pending:
+                rel_dir, chain, rescan = pending.pop()
+                directory = os.path.join(self.root, rel_dir)
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                old = listing = self._listings.get(rel_dir)
+                if (not rescan and listing is not None and listing.mtime_ns == mtime_ns
+                        and now - listing.scanned_at < RESCAN_SECONDS
+                        and (listing.gitignore is None or _read_stamp(directory) == listing.gitignore)):
+                    reused += 1
+                else:
+                    try:
+                        listing = self._scan(rel_dir, mtime_ns, chain)
+                    except OSError:
+                        continue
+                    scanned += 1
+                    # Changed rules below this directory invalidate every listing under it
+                    rescan = rescan or (old is not None and old.gitignore != listing.gitignore)
+                listings[rel_dir] = listing
+                entries += len(listing.dirs) + len(listing.files)
+                if entries > MAX_INDEX_ENTRIES:
+                    self.incomplete = True
+                    break
+                if listing.rules is not None:
+                    chain = chain + [(rel_dir, listing.rules)]
+                pending.extend((f"{rel_dir}/{name}" if rel_dir else name, chain, rescan)
+                               for name in reversed(listing.dirs))
+            # Directories that were deleted simply aren't carried over
+            self._listings = listings
+            self._refreshed_at = now
+            return {"scanned": scanned, "reused": reused}
+
+    def listings(self):
+        """Snapshot of the listings; refresh() replaces the dict rather than changing it."""
+        with self._lock:
+            return self._listings
+
+    def covers(self, rel_dir):
+        """True if the last refresh indexed all of the tree and rel_dir is in it."""
+        with self._lock:
+            return not self.incomplete and rel_dir in self._listings
+
+    def tree(self, rel_dir='', max_depth=DEFAULT_TREE_DEPTH, max_entries=MAX_TREE_ENTRIES):
+        """
+        Nested dict of rel_dir: directories as "name/" -> {...}, files as
+        "name" -> [size in bytes, "YYYY-MM-DD HH:MM"]. Directories below
+        max_depth (or past max_entries) are shown as "name/" -> "N entries".
+        """
+        listings = self.listings()
+        budget = [max_entries]
+
+        def build(path, depth):
+            listing = listings.get(path)
+            if listing is None:
+                return "not indexed"
+            node = {}
+            for name in listing.dirs:
+                child = f"{path}/{name}" if path else name
+                child_listing = listings.get(child)
+                if depth >= max_depth or budget[0] <= 0 or child_listing is None:
+                    count = len(child_listing.dirs) + len(child_listing.files) if child_listing else "?"
+                    node[name + '/'] = f"{count} entries"
+                else:
+                    budget[0] -= 1
+                    node[name + '/'] = build(child, depth + 1)
+            for name in sorted(listing.files):
+                if budget[0] <= 0:
+                    node["..."] = f"{len(listing.files)} files in total"
+                    break
+                budget[0] -= 1
+                size, mtime = listing.files[name]
+                node[name] = [size, _format_mtime(mtime)]
+            return node
+
+        return build(rel_dir, 1)
+
+    def find(self, pattern, rel_dir='', limit=DEFAULT_FIND_LIMIT):
+        """
+        Files and directories under rel_dir matching a glob. Patterns without
+        a '/' match names, others match paths relative to the index root.
+        Patterns without wildcards match as case-insensitive substrings.
+        Returns (matches, total).
+        """
+        if not any(ch in pattern for ch in '*?['):
+            pattern = f"*{pattern}*"
+        on_path = '/' in pattern
+        pattern = pattern.lower()
+        prefix = rel_dir + '/' if rel_dir else ''
+        listings = self.listings()
+        matches, total = [], 0
+        for path in sorted(listings):
+            if rel_dir and path != rel_dir and not path.startswith(prefix):
+                continue
+            listing = listings[path]
+            candidates = [(name + '/', None) for name in listing.dirs]
+            candidates += [(name, listing.files[name]) for name in sorted(listing.files)]
+            for name, info in candidates:
+                rel_path = f"{path}/{name}" if path else name
+                target = rel_path.rstrip('/') if on_path else name.rstrip('/')
+                if not fnmatch.fnmatch(target.lower(), pattern):
+                    continue
+                total += 1
+                if len(matches) < limit:
+                    match = {"path": rel_path}
+                    if info is not None:
+                        match["size"], match["modified"] = info[0], _format_mtime(info[1])
+                    matches.append(match)
+        return matches, total
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_project_index(root):
+    """The cached index for root, refreshed incrementally."""
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(root)
+        if index is None:
+            index = _indexes[root] = ProjectIndex(root)
+    index.refresh()
+    return index
+
+def _locate(target_path):
+    """
+    The index to use for target_path: that of an already indexed ancestor
+    when it is complete and holds target_path, else one rooted at target_path.
+    """
+    target = os.path.abspath(target_path)
+    with _indexes_lock:
+        candidates = [(root, index) for root, index in _indexes.items()
+                      if root != target and target.startswith(root.rstrip(os.sep) + os.sep)]
+    for root, index in sorted(candidates, key=lambda candidate: len(candidate[0]), reverse=True):
+        if index.incomplete:
+            continue  # a truncated walk may have missed target_path; don't re-walk it either
+        index.refresh()
+        rel_dir = os.path.relpath(target, root).replace(os.sep, '/')
+        if index.covers(rel_dir):
+            return index, rel_dir
+    return get_project_index(target), ''
+
+
+# --- TOOLS ---
+
+def project_structure(target_path=".", max_depth=DEFAULT_TREE_DEPTH):
+    """Tool result with the recursive tree of target_path."""
+    if not os.path.isdir(target_path):
+        return {"status": "error", "message": f"Path '{target_path}' is not a valid directory."}
+    index, rel_dir = _locate(target_path)
+    if rel_dir not in index.listings():
+        return {"status": "error", "message": f"Path '{target_path}' could not be read."}
+    result = {"status": "success", "path": target_path, "tree": index.tree(rel_dir, max(1, int(max_depth)))}
+    if index.incomplete:
+        result["note"] = f"The tree is larger than {MAX_INDEX_ENTRIES} entries; only part of it is indexed."
+    return result
+
+def find_project_files(pattern, target_path=".", limit=DEFAULT_FIND_LIMIT):
+    """Tool result with the files under target_path matching pattern."""
+    if not os.path.isdir(target_path):
+        return {"status": "error", "message": f"Path '{target_path}' is not a valid directory."}
+    index, rel_dir = _locate(target_path)
+    matches, total = index.find(pattern, rel_dir, max(1, int(limit)))
+    result = {"status": "success", "pattern": pattern, "root": target_path, "matches": matches, "total": total}
+    if total > len(matches):
+        result["note"] = f"Showing {len(matches)} of {total} matches; use a narrower pattern."
+    return result
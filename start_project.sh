@@ -12,6 +12,7 @@ VENV_PATH="./venv"
 SCRIPT_1_PATH="./commander_cli.py"
 SCRIPT_2_PATH="./activity_monitor_gemini.py"
 SCRIPT_3_PATH="./strategist.py"
+GATEWAY_SCRIPT_PATH="./llm_gateway.py"
 
 # --- Script Logic ---
 # Check if a session with the same name already exists. If not, create it.
@@ -24,6 +25,10 @@ if [ $? != 0 ]; then
   # Start a new, detached tmux session
   tmux new-session -d -s $SESSION_NAME
   
+  # --- LLM Gateway ---
+  # Started first in its own window; the other scripts fall back to direct API calls without it.
+  tmux new-window -d -t $SESSION_NAME -n gateway "$VENV_PATH/bin/python $GATEWAY_SCRIPT_PATH"
+
   # --- Pane Setup ---
   tmux split-window -v -t $SESSION_NAME:0.0
   tmux split-window -h -t $SESSION_NAME:0.1
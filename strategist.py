@@ -7,21 +7,28 @@ import google.generativeai as genai
 from plyer import notification
 from dotenv import load_dotenv
 
-from blocker import block_for_duration
+from backfill_summaries import refresh_day_summary
+from behaviour_model import build_behaviour_profile
+from blocker import reconcile_blocks, schedule_block
+from focus_scorer import evaluate_window, load_scoring_config
+from key_pool import get_key_pool
+from llm_gateway import PRIORITY_BACKGROUND, generate, history_to_contents
+from payload_encoder import FORMAT_DESCRIPTIONS, encode_activity_payload, payload_report
 
 # --- CONFIGURATION ---
 load_dotenv()
 DB_PATH = 'database/activity_log_gemini.db'
 CHAT_HISTORY_DIR = 'chat_history'
-API_KEY = os.getenv('GENAI_API_KEY_3')
 ACTIVITY_DATA_DIR = 'activity_data'
+PAYLOAD_FORMAT = 'json'  # 'json' (dictionary-encoded) or 'table', see payload_encoder.py
+STRATEGIST_MODEL = 'gemini-2.5-flash'
 
 
 # --- SYSTEM PROMPT ---
-SYSTEM_PROMPT = """
+SYSTEM_PROMPT = f"""
 You are Janus, an AI accountability coach. Your purpose is to help the user stay focused and productive.
 
-You will receive a summary of the user's computer activity in a JSON format. Your task is to analyze this data and respond ONLY with a valid JSON object.
+You will receive a summary of the user's computer activity. {FORMAT_DESCRIPTIONS[PAYLOAD_FORMAT]} Your task is to analyze this data and respond ONLY with a valid JSON object.
 
 The JSON object must have two keys: "comment" and "execute_code".
 
@@ -45,11 +52,9 @@ Do not use any other codes. Analyze the following user data and provide your JSO
 # --- HELPER FUNCTIONS ---
 
 def setup_environment():
-    """Ensure API key is set and chat history directory exists."""
-    if not API_KEY:
-        raise ValueError("GOOGLE_API_KEY environment variable not set.")
+    """Ensure API keys are available and chat history directory exists."""
+    get_key_pool()  # raises ValueError when .env has no keys
     os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
-    genai.configure(api_key=API_KEY)
 
 def get_chat_history_path():
     """Returns the path for today's chat history file."""
@@ -60,7 +65,7 @@ def load_chat_session(SYSTEM_PROMPT):
     """Loads today's chat history or starts a new session."""
     history_path = get_chat_history_path()
     model = genai.GenerativeModel(
-        'gemini-2.5-flash',
+        STRATEGIST_MODEL,
         system_instruction=SYSTEM_PROMPT
     )
     
@@ -126,6 +131,28 @@ def get_recent_activity_data():
             
     return aggregated_data
 
+def send_for_decision(chat_session, data_payload):
+    """Sends an activity payload to Gemini and returns its parsed JSON decision."""
+    # The chat session only holds the history; the call goes through the LLM gateway at background priority
+    contents = history_to_contents(chat_session.history) + [{"role": "user", "parts": [data_payload]}]
+    response = generate(STRATEGIST_MODEL, contents, system_instruction=SYSTEM_PROMPT, priority=PRIORITY_BACKGROUND)
+    chat_session.history = contents + [{"role": "model", "parts": [response["text"]]}]
+    # Clean up response in case it's wrapped in markdown
+    cleaned_response_text = response["text"].strip().replace('```json', '').replace('```', '').strip()
+    return json.loads(cleaned_response_text)
+
+def word_comment_with_llm(chat_session, decision, evaluation):
+    """Keeps the locally decided code but lets Gemini write the comment."""
+    score = evaluation["score"]
+    summary = {key: value for key, value in score.items() if key != "categories"}
+    message = (
+        f"The local scorer already decided execute_code={decision['execute_code']} "
+        f"({evaluation['reason']}). Window statistics: {json.dumps(summary)}. "
+        "Only write the comment for this decision and keep the same execute_code."
+    )
+    llm_response_data = send_for_decision(chat_session, message)
+    return {"execute_code": decision["execute_code"], "comment": llm_response_data.get("comment") or decision["comment"]}
+
 def execute_action(response_data):
     """Executes a function based on the LLM's response code."""
     try:
@@ -161,7 +188,7 @@ def execute_action(response_data):
             distracting_sites = comment.get("distracting_sites", [])
             duration = int(comment.get("duration", 600)) # default to 10 minutes if not specified
             if distracting_sites and duration > 0:
-                block_for_duration(duration, distracting_sites)
+                schedule_block(duration, distracting_sites)
                 notification.notify(
                     title='Janus: Blocking Distracting Sites 🚫',
                     message=f"Blocked {', '.join(distracting_sites)} for {duration//60} minutes.",
@@ -169,56 +196,19 @@ def execute_action(response_data):
                 )
             else:
                 print("No distracting sites or invalid duration provided.")
-        except (AttributeError, TypeError, ValueError) as e:
+        except (AttributeError, TypeError, ValueError, OSError) as e:
             print(f"Error processing blocking command: {e}")
     # code == -1 is handled by the "if not comment" check above
 
 
 def update_activity_summary_of_day():
-    SYSTEM_PROMPT_SUMMARY = """
-    Give me the updated summary of today's activity based on the provided data.
-    Respond ONLY with a valid JSON object with the following.
-    
-    example:
-        {
-            "date": "2025-09-05",
-            "total_active_time_minutes": 320,
-            "productivity_score_percent": 75,
-            "timeline_log": [
-                "08:30 - Started working on 'Project Janus' in VS Code.",
-                "09:15 - Switched to Google Chrome for research on 'Python threading'.",
-                "09:45 - Got distracted on YouTube.",
-                "10:00 - Resumed work in the Terminal for 'Project Janus'.",
-                "12:30 - Took a break (Idle)."
-            ],
-            "time_by_category": {
-                "Productive": 240,
-                "Neutral": 50,
-                "Distracting": 30
-            },
-            "time_by_application": {
-                "VS Code": 180,
-                "Google Chrome": 60,
-                "Terminal": 45,
-                "YouTube": 25,
-                "System Settings": 10
-            }
-        }
-
-    Update this summary as you receive new activity data throughout the day.
-"""
-
-    chat_session = load_chat_session(SYSTEM_PROMPT_SUMMARY)
-    response = chat_session.send_message("give me the updated summary of today's activity based on the provided chat.")
-                
-    # Clean up response in case it's wrapped in markdown
-    cleaned_response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
-    llm_response_data = json.loads(cleaned_response_text)
-
-    # Save the updated summary to a file
-    summary_path = os.path.join(ACTIVITY_DATA_DIR, f'activity_summary_{datetime.now().strftime("%Y-%m-%d")}.json')
-    write_file(summary_path, llm_response_data)
-    print(f"Updated activity summary saved to {summary_path}")
+    """Rebuilds today's activity summary from activity_log if new rows arrived since the last rebuild."""
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    summary_path = refresh_day_summary(today_str, DB_PATH, ACTIVITY_DATA_DIR)
+    if summary_path:
+        print(f"Updated activity summary saved to {summary_path}")
+    else:
+        print("No activity logged today yet. Skipping activity summary.")
 
 # Update /user_data/user_behaviour file: Call this function at the boot time every day to update previous day's summary. -- pending
 def update_user_behaviour_file():
@@ -227,7 +217,10 @@ def update_user_behaviour_file():
     summary_path = os.path.join(ACTIVITY_DATA_DIR, f'activity_summary_{yesterday_str}.json')
     
     if not os.path.exists(summary_path):
-        print(f"No summary file found for {yesterday_str}. Skipping user behaviour update.")
+        # The strategist may not have run yesterday; rebuild the summary from activity_log.
+        refresh_day_summary(yesterday_str, DB_PATH, ACTIVITY_DATA_DIR)
+    if not os.path.exists(summary_path):
+        print(f"No activity found for {yesterday_str}. Skipping user behaviour update.")
         return
     
     with open(summary_path, 'r') as f:
@@ -243,29 +236,41 @@ def update_user_behaviour_file():
         user_behaviour_data = {}
 
 
+    # The statistics are computed locally over several weeks; the LLM only narrates them.
+    behaviour_profile = build_behaviour_profile(DB_PATH)
+    previous_insights = {k: v for k, v in user_behaviour_data.items() if k != "behaviour_profile"}
+    summary_headline = {k: v for k, v in summary_data.items() if k not in ("timeline_log", "source_fingerprint")}
+
     USER_PROMPT = f"""
-    This is the user's behaviour data:
-    <user_behaviour_data>
-    {json.dumps(user_behaviour_data, indent=2)}
-    </user_behaviour_data>
-
-    And this is the summary of today's activity:
-    <today_summary>
-    {json.dumps(summary_data, indent=2)}
-    </today_summary>
-
-    Based on this data, update insights into the user's productivity patterns, habits, and areas for improvement.
-    Respond ONLY with a valid JSON object to update the user behaviour data.
+    These statistics were computed from the last {behaviour_profile.get("weeks", 4)} weeks of the user's activity log.
+    hour_of_week_focus is the mean focus per weekday and hour (1 = productive, -1 = distracting, null = no data),
+    hours are 0-23 local time and durations are in minutes:
+    <behaviour_profile>
+    {json.dumps(behaviour_profile, separators=(',', ':'))}
+    </behaviour_profile>
+
+    This is yesterday's summary:
+    <yesterday_summary>
+    {json.dumps(summary_headline, separators=(',', ':'))}
+    </yesterday_summary>
+
+    These are the previous insights about the user:
+    <previous_insights>
+    {json.dumps(previous_insights, separators=(',', ':'))}
+    </previous_insights>
+
+    Describe the user's productivity patterns, habits and areas for improvement using only these numbers.
+    Do not invent statistics. Respond ONLY with a valid JSON object with the keys
+    "patterns", "habits", "areas_for_improvement" and "recommendations" (each a list of short strings).
     """
 
-    model = genai.GenerativeModel("gemini-2.5-pro")
-
-    response = model.generate_content(USER_PROMPT)
+    response = generate(STRATEGIST_MODEL, USER_PROMPT, priority=PRIORITY_BACKGROUND)
     # Clean up response in case it's wrapped in markdown
-    cleaned_response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
+    cleaned_response_text = response["text"].strip().replace('```json', '').replace('```', '').strip()
     llm_response_data = json.loads(cleaned_response_text)
 
-    user_behaviour_data = llm_response_data
+    user_behaviour_data = dict(llm_response_data)
+    user_behaviour_data["behaviour_profile"] = behaviour_profile
 
     write_file(user_behaviour_path, user_behaviour_data)
     print(f"User behaviour file updated with data from {yesterday_str}.")
@@ -292,6 +297,14 @@ def main():
     """The main function that runs the 15-minute loop."""
     setup_environment()
 
+    # Lift blocks that expired while the strategist was down and re-arm the rest
+    try:
+        outstanding = reconcile_blocks()
+        if outstanding:
+            print(f"Resuming {len(outstanding)} active site block(s).")
+    except OSError as e:
+        print(f"Could not reconcile site blocks: {e}")
+
     # run the user behaviour update only if the previous day's file doesn't exist
     yesterday_str = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
     user_behaviour_path = os.path.join(ACTIVITY_DATA_DIR, f'user_behaviour_{yesterday_str}.json')
@@ -305,23 +318,36 @@ def main():
         recent_activity = get_recent_activity_data()
         
         if recent_activity:
-            # 2. Prepare data and send to Gemini
-            data_payload = json.dumps(recent_activity, indent=2)
-            print("Sending data to Gemini...")
-            
+            # 2. Score the window locally; only ambiguous windows go to Gemini
+            scoring_config = load_scoring_config()
+            evaluation = evaluate_window(recent_activity, scoring_config)
+            print(f"Local focus score: {evaluation['score']['focus_score']} ({evaluation['reason']})")
+
             try:
-                response = chat_session.send_message(data_payload)
-                
-                # Clean up response in case it's wrapped in markdown
-                cleaned_response_text = response.text.strip().replace('```json', '').replace('```', '').strip()
-                llm_response_data = json.loads(cleaned_response_text)
-                
+                decision = evaluation["decision"]
+                used_llm = True
+                if decision is None:
+                    data_payload = encode_activity_payload(recent_activity, PAYLOAD_FORMAT)
+                    report = payload_report(recent_activity, data_payload)
+                    print(f"Payload: {report['raw_tokens']} -> {report['encoded_tokens']} tokens "
+                          f"({report['saved_percent']}% smaller, {report['records']} records).")
+                    print("Ambiguous window. Sending data to Gemini...")
+                    llm_response_data = send_for_decision(chat_session, data_payload)
+                elif decision["execute_code"] in (0, 1) and scoring_config.get("llm_comments"):
+                    print("Decided locally. Asking Gemini to word the comment...")
+                    llm_response_data = word_comment_with_llm(chat_session, decision, evaluation)
+                else:
+                    print("Decided locally. Skipping Gemini call.")
+                    llm_response_data = decision
+                    used_llm = False
+
                 # 3. Execute action based on response
                 execute_action(llm_response_data)
-                
+
                 # 4. Save the updated chat history
-                save_chat_history(chat_session)
-                
+                if used_llm:
+                    save_chat_history(chat_session)
+
             except Exception as e:
                 print(f"An error occurred during the Gemini API call or processing: {e}")
 
@@ -0,0 +1,160 @@
+import json
+
+# Incremental extraction of top-level string fields from a JSON object that is
+# still being streamed, so the commander can render "comment" and start
+# speech before the model has finished the whole response.
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def _hex(digits):
+    """Value of a \\u escape's four hex digits; U+FFFD for malformed ones."""
+    try:
+        return int(digits, 16)
+    except ValueError:
+        return 0xFFFD
+
+
+class StreamingFieldExtractor:
+    """
+    Feed it raw text chunks; it decodes the string values of the requested
+    keys as they arrive.
+
+        extractor = StreamingFieldExtractor(("comment", "speak"))
+        extractor.feed('{"response_type": "conversation", "comm')
+        extractor.feed('ent": "Hello th')
+        extractor.value("comment")      # -> "Hello th"
+        extractor.is_complete("comment")  # -> False
+    """
+
+    def __init__(self, keys):
+        self.buffer = ""
+        self.values = {}
+        self.completed = set()
+        self._keys = set(keys)
+        self._positions = {}  # key -> index in buffer of the next undecoded character
+        # Structural scan, so only keys of the top-level object match
+        self._scanned = 0          # index in buffer of the next character to scan
+        self._depth = 0            # open objects and arrays
+        self._string_start = None  # index of the opening quote of the string being scanned
+        self._escaped = False
+        self._last_string = None   # a top-level string that may turn out to be a key
+        self._key = None           # top-level key whose value comes next
+
+    def feed(self, chunk):
+        """Adds a chunk and returns the keys whose values changed."""
+        self.buffer += chunk
+        self._scan()
+        changed = []
+        for key in self._positions:
+            if key not in self.completed and self._decode(key):
+                changed.append(key)
+        return changed
+
+    def _scan(self):
+        buffer = self.buffer
+        for pos in range(self._scanned, len(buffer)):
+            char = buffer[pos]
+            if self._string_start is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    if self._depth == 1:
+                        try:
+                            self._last_string = json.loads(buffer[self._string_start:pos + 1])
+                        except json.JSONDecodeError:
+                            self._last_string = None
+                    self._string_start = None
+                continue
+            if char in ' \t\r\n':
+                continue
+            if char == '"':
+                self._string_start = pos
+                if self._depth == 1 and self._key is not None:
+                    if self._key in self._keys and self._key not in self._positions:
+                        self._positions[self._key] = pos + 1
+                        self.values[self._key] = ""
+                    self._key = None
+                continue
+            if char == ':' and self._depth == 1 and self._last_string is not None:
+                self._key = self._last_string
+            else:
+                self._key = None
+                if char in '{[':
+                    self._depth += 1
+                elif char in '}]':
+                    self._depth -= 1
+            self._last_string = None
+        self._scanned = len(buffer)
+
+    def _decode(self, key):
+        """Decodes as much of key's string value as the buffer allows. Returns True if it grew."""
+        pos = self._positions[key]
+        out = []
+        buffer = self.buffer
+        while pos < len(buffer):
+            char = buffer[pos]
+            if char == '"':
+                self.completed.add(key)
+                pos += 1
+                break
+            if char != '\\':
+                out.append(char)
+                pos += 1
+                continue
+            # Escape sequence: wait for the rest of it if the chunk ended mid-escape
+            if pos + 1 >= len(buffer):
+                break
+            code = buffer[pos + 1]
+            if code == 'u':
+                if pos + 6 > len(buffer):
+                    break
+                codepoint = _hex(buffer[pos + 2:pos + 6])
+                if 0xD800 <= codepoint < 0xDC00:
+                    # High surrogate: combine with a low surrogate if one follows
+                    if pos + 8 > len(buffer) or (buffer[pos + 6:pos + 8] == '\\u' and pos + 12 > len(buffer)):
+                        break
+                    low = _hex(buffer[pos + 8:pos + 12]) if buffer[pos + 6:pos + 8] == '\\u' else -1
+                    if 0xDC00 <= low < 0xE000:
+                        codepoint = 0x10000 + ((codepoint - 0xD800) << 10) + (low - 0xDC00)
+                        pos += 6
+                    else:
+                        codepoint = 0xFFFD  # lone surrogate
+                elif 0xDC00 <= codepoint < 0xE000:
+                    codepoint = 0xFFFD
+                out.append(chr(codepoint))
+                pos += 6
+            else:
+                out.append(_ESCAPES.get(code, code))
+                pos += 2
+        self._positions[key] = pos
+        if out:
+            self.values[key] += "".join(out)
+        return bool(out) or key in self.completed
+
+    def value(self, key, default=""):
+        return self.values.get(key, default)
+
+    def is_complete(self, key):
+        return key in self.completed
+
+
+def clean_model_json(text):
+    """Strips markdown code fences the model sometimes wraps around JSON."""
+    return text.strip().replace('```json', '').replace('```', '').strip()
+
+
+if __name__ == "__main__":
+    full = json.dumps({"response_type": "conversation", "comment": "Line one\nquote \" and é 🚀", "speak": "Hi!"})
+    extractor = StreamingFieldExtractor(("comment", "speak"))
+    for i in range(0, len(full), 5):
+        extractor.feed(full[i:i + 5])
+    print(repr(extractor.value("comment")), extractor.is_complete("comment"), repr(extractor.value("speak")))
+
+    nested = '{"args": {"comment": "not this one", "x": ["comment: \\"no\\""]}, "comment": "top level"}'
+    extractor = StreamingFieldExtractor(("comment",))
+    for char in nested:
+        extractor.feed(char)
+    print(repr(extractor.value("comment")))
@@ -0,0 +1,235 @@
+import argparse
+import shutil
+import statistics
+import subprocess
+import threading
+import time
+import wave
+
+from key_pool import get_key_pool
+from llm_gateway import PRIORITY_SPEECH, generate
+
+# Text-to-speech engines behind generative_speech.speak().
+#
+#     python tts_engines.py --benchmark           # time to first audio of every available engine
+#     python tts_engines.py --benchmark --engines local --repeat 5
+#
+# An engine streams an utterance to on_audio as parts shaped like the LLM
+# gateway's, {"mime_type": "audio/L<bits>;rate=<rate>", "data": pcm}. The
+# cloud engine sounds best but depends on the network and API quota; the
+# local engine is instant and offline. route() picks the order to try them in
+# for each utterance: short utterances locally, long ones in the
+# cloud, and the local engine whenever the cloud is throttled or failing.
+
+# --- CONFIGURATION ---
+TTS_ENGINE = "auto"             # "auto" routes per utterance; "gemini" or "local" is always tried first
+LOCAL_MAX_CHARS = 80            # auto: utterances up to this length are spoken by the local engine
+CLOUD_RETRY_SECONDS = 60        # after a cloud failure the local engine speaks for this long
+
+TTS_MODEL = "gemini-2.5-flash-preview-tts"
+VOICE_NAME = "Zephyr"
+TEMPERATURE = 0.5
+
+# Offline synthesizers writing a WAV to stdout; the first one installed is used. Text is read from stdin.
+LOCAL_TTS_COMMANDS = [
+    ["espeak-ng", "--stdout", "--stdin", "-v", "en-us", "-s", "170"],
+    ["espeak", "--stdout", "--stdin", "-v", "en-us", "-s", "170"],
+]
+LOCAL_READ_FRAMES = 2048        # frames per audio part
+
+BENCHMARK_PHRASES = [
+    "Executing tool.",
+    "Good morning! Ready to plan the day?",
+    "You've been on YouTube for twenty minutes. Is this still part of your research, or should we get back to the report?",
+]
+
+
+class SpeechCancelled(Exception):
+    """Raised inside a streaming synthesis to abandon a cancelled utterance."""
+
+
+def parse_audio_mime_type(mime_type: str) -> dict[str, int | None]:
+    bits_per_sample = 16
+    rate = 24000
+    parts = mime_type.split(";")
+    for param in parts:
+        param = param.strip()
+        if param.lower().startswith("rate="):
+            try: rate = int(param.split("=", 1)[1])
+            except (ValueError, IndexError): pass 
+        elif param.startswith("audio/L"):
+            try: bits_per_sample = int(param.split("L", 1)[1])
+            except (ValueError, IndexError): pass 
+    return {"bits_per_sample": bits_per_sample, "rate": rate}
+
+
+# --- ENGINES ---
+
+class GeminiEngine:
+    """The cloud Gemini TTS model, through the LLM gateway when it is running."""
+    name = "gemini"
+    cacheable = True   # its output is worth keeping in the phrase cache
+
+    def __init__(self, model=TTS_MODEL, voice_name=VOICE_NAME, temperature=TEMPERATURE):
+        self.model = model
+        self.voice_name = voice_name
+        self.temperature = temperature
+        self._unavailable_until = 0.0
+
+    @property
+    def cache_identity(self):
+        """(voice_name, temperature, model) for the phrase cache."""
+        return self.voice_name, self.temperature, self.model
+
+    def generation_config(self):
+        return {
+            "temperature": self.temperature,
+            "response_modalities": ["AUDIO"],
+            "speech_config": {
+                "voice_config": {"prebuilt_voice_config": {"voice_name": self.voice_name}}
+            },
+        }
+
+    def available(self):
+        """False after a recent failure or while every API key is cooling down."""
+        if time.time() < self._unavailable_until:
+            return False
+        try:
+            return any(key["cooldown_seconds"] == 0 for key in get_key_pool().status())
+        except Exception:
+            return False  # no keys configured
+
+    def synthesize(self, text, on_audio, cache=True, priority=PRIORITY_SPEECH):
+        try:
+            generate(
+                self.model, [{"role": "user", "parts": [text]}], generation_config=self.generation_config(),
+                priority=priority, cache=cache, on_audio=on_audio,
+            )
+        except SpeechCancelled:
+            raise
+        except Exception:
+            self._unavailable_until = time.time() + CLOUD_RETRY_SECONDS
+            raise
+
+
+class LocalEngine:
+    """Offline speech with espeak-ng (or espeak): robotic, but immediate and free."""
+    name = "local"
+    cacheable = False
+    cache_identity = None
+
+    def __init__(self, commands=LOCAL_TTS_COMMANDS):
+        self.command = next((command for command in commands if shutil.which(command[0])), None)
+
+    def available(self):
+        return self.command is not None
+
+    def synthesize(self, text, on_audio, cache=True, priority=PRIORITY_SPEECH):
+        process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            process.stdin.write(text.encode())
+            process.stdin.close()
+            # The WAV streams through a pipe, so its header can't carry the real length; read to the end
+            with wave.open(process.stdout, 'rb') as wav:
+                mime_type = f"audio/L{wav.getsampwidth() * 8};rate={wav.getframerate()}"
+                frame_bytes = wav.getsampwidth() * wav.getnchannels()
+                read = (lambda: wav.readframes(LOCAL_READ_FRAMES)) if wav.getnframes() else \
+                    (lambda: process.stdout.read(LOCAL_READ_FRAMES * frame_bytes))
+                while True:
+                    data = read()
+                    if not data:
+                        break
+                    on_audio({"mime_type": mime_type, "data": data})
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            if process.stdout:
+                process.stdout.close()
+
+
+ENGINES = {"gemini": GeminiEngine, "local": LocalEngine}
+
+_engines = None
+_engines_lock = threading.Lock()
+
+def get_engines():
+    """The process-wide engine instances by name."""
+    global _engines
+    with _engines_lock:
+        if _engines is None:
+            _engines = {name: engine() for name, engine in ENGINES.items()}
+        return _engines
+
+
+# --- ROUTING ---
+
+def route(text):
+    """The available engines to try for an utterance, most preferred first."""
+    if TTS_ENGINE in ENGINES:
+        order = [TTS_ENGINE] + [name for name in ENGINES if name != TTS_ENGINE]
+    elif len(text) <= LOCAL_MAX_CHARS:
+        order = ["local", "gemini"]
+    else:
+        order = ["gemini", "local"]
+    engines = get_engines()
+    return [engines[name] for name in order if engines[name].available()]
+
+
+# --- BENCHMARK ---
+
+def measure(engine, text):
+    """(seconds to first audio, total seconds, seconds of audio) of one uncached synthesis."""
+    started = time.perf_counter()
+    first = None
+    audio_seconds = 0.0
+
+    def on_audio(part):
+        nonlocal first, audio_seconds
+        if first is None:
+            first = time.perf_counter()
+        parameters = parse_audio_mime_type(part["mime_type"])
+        audio_seconds += len(part["data"]) / (parameters["bits_per_sample"] // 8) / parameters["rate"]
+
+    engine.synthesize(text, on_audio, cache=False)
+    total = time.perf_counter() - started
+    return (first - started if first is not None else None), total, audio_seconds
+
+def benchmark(names, phrases=BENCHMARK_PHRASES, repeat=3):
+    engines = get_engines()
+    print(f"{'engine':<8} {'chars':>5} {'first audio ms':>15} {'total ms':>9} {'audio s':>8}")
+    for name in names:
+        engine = engines[name]
+        if not engine.available():
+            print(f"{name:<8} unavailable")
+            continue
+        for text in phrases:
+            firsts, totals, audio = [], [], 0.0
+            for _ in range(repeat):
+                try:
+                    first, total, audio = measure(engine, text)
+                except Exception as e:
+                    print(f"{name:<8} {len(text):>5} failed: {e}")
+                    break
+                if first is not None:
+                    firsts.append(first * 1000)
+                totals.append(total * 1000)
+            else:
+                first_ms = f"{statistics.median(firsts):.0f}" if firsts else "-"
+                print(f"{name:<8} {len(text):>5} {first_ms:>15} {statistics.median(totals):>9.0f} {audio:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Janus text-to-speech engines.")
+    parser.add_argument("--benchmark", action="store_true", help="compare time to first audio of the engines")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--text", action="append", help="phrase to benchmark (repeatable)")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.engines, args.text or BENCHMARK_PHRASES, args.repeat)
+    else:
+        for name, engine in get_engines().items():
+            print(f"{name}: {'available' if engine.available() else 'unavailable'}")